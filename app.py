@@ -2,7 +2,7 @@ import dash
 from dash import html, dcc
 import dash_bootstrap_components as dbc
 import dash_mantine_components as dmc
-from globals import PAGE_HEADER_STYLE, DEFAULT_CLIENT_INFO, DEFAULT_ROW_MEASURE, DEFAULT_ROW_PRACTICE, DEFAULT_ROW_SESSION
+from globals import PAGE_HEADER_STYLE, DEFAULT_CLIENT_INFO, DEFAULT_ROW_MEASURE, DEFAULT_ROW_PRACTICE, DEFAULT_ROW_SESSION, RECORD_LIBRARY, AUTOSAVE_INTERVAL
 from dash import _dash_renderer
 _dash_renderer._set_react_version("18.2.0")
 
@@ -109,6 +109,17 @@ app.layout = dmc.MantineProvider(
         dcc.Store(id='sessions-store', data=[DEFAULT_ROW_SESSION], storage_type='session'),
         dcc.Store(id='practices-store', data=[DEFAULT_ROW_PRACTICE], storage_type='session'),
         dcc.Store(id='client-store', data=[DEFAULT_CLIENT_INFO], storage_type='session'),
+
+        # Column definitions of the sessions grid and the schema they were generated for, kept across page changes
+        dcc.Store(id='sessions-grid-schema', storage_type='memory'),
+
+        # Autosave to the record library, the interval runs while there are unsaved changes
+        dcc.Store(id='library-changed-store', data=None),
+        dcc.Store(id='library-save-request-store', data=None),
+        dcc.Store(id='library-autosave-store', data={'seen': None, 'saved': None} if RECORD_LIBRARY else None),
+        # Library ID the record of this browser session is saved under, kept with the record
+        dcc.Store(id='library-record-store', data=None, storage_type='session'),
+        dcc.Interval(id='library-autosave-interval', interval=AUTOSAVE_INTERVAL * 1000, disabled=True),
         html.Div([sidebar, content])
     ],
     theme={'fontSizes': {
@@ -0,0 +1,212 @@
+window.dash_clientside = Object.assign({}, window.dash_clientside, {
+    dashboard: {
+
+        // Switch the dashboard axes using the data of all axis options carried in the figure meta.
+        // The signature of the rendered figure no longer matches and is dropped, so the next update
+        // from the server sends the full figure.
+        switch_axes: function (yaxis, xaxis, figure) {
+            const noUpdate = window.dash_clientside.no_update;
+            if (!figure || !figure.layout || !figure.layout.meta) {
+                return [noUpdate, noUpdate];
+            }
+
+            const data = figure.data.map(function (trace) {
+                if (!trace.meta) {
+                    return trace;
+                }
+                const updated = Object.assign({}, trace);
+                if (trace.meta.x) {
+                    updated.x = trace.meta.x[xaxis];
+                }
+                if (trace.meta.y) {
+                    updated.y = trace.meta.y[yaxis];
+                }
+                return updated;
+            });
+
+            const layout = Object.assign({}, figure.layout);
+            const axisOptions = [layout.meta.x[xaxis], layout.meta.y[yaxis]];
+            axisOptions.forEach(function (axes) {
+                Object.keys(axes).forEach(function (axis) {
+                    layout[axis] = Object.assign({}, layout[axis], axes[axis]);
+                });
+            });
+
+            return [Object.assign({}, figure, {data: data, layout: layout}), null];
+        }
+    },
+
+    sessions: {
+
+        // Set the column definitions kept for the schema the grid was loaded with
+        apply_columns: function (schema, gridSchema) {
+            if (!gridSchema || gridSchema.schema !== schema) {
+                return window.dash_clientside.no_update;
+            }
+            return gridSchema.columnDefs;
+        },
+
+        // Describe a change of the sessions grid with only the rows needed to apply it on the server
+        request_delta: function (addClicks, deleteClicks, cellChanged, sessionsStore, rowModelType) {
+            const noUpdate = window.dash_clientside.no_update;
+            const triggered = window.dash_clientside.callback_context.triggered;
+            if (!triggered || !triggered.length) {
+                return noUpdate;
+            }
+            const trigger = triggered[0].prop_id.split('.')[0];
+
+            let api;
+            try {
+                api = dash_ag_grid.getApi('sessions-grid');
+            } catch (e) {
+                return noUpdate;
+            }
+            const count = api.getDisplayedRowCount();
+            const rowAt = function (index) {
+                return api.getDisplayedRowAtIndex(index).data;
+            };
+            const selectedNumbers = function () {
+                return api.getSelectedNodes().map(function (node) { return node.data.session_number; });
+            };
+            const changedCells = function () {
+                return cellChanged.map(function (change) {
+                    const copy = Object.assign({}, change);
+                    delete copy.data;
+                    return copy;
+                });
+            };
+
+            // Rows of the paged grid are not all loaded, the server takes them from its record
+            let request;
+            if (rowModelType === 'infinite') {
+                if (trigger === 'add-row-sessions-btn') {
+                    request = {op: 'add'};
+                } else if (trigger === 'delete-row-sessions-btn') {
+                    const selected = selectedNumbers();
+                    if (!selected.length) {
+                        return noUpdate;
+                    }
+                    request = {op: 'delete', selected: selected};
+                } else if (trigger === 'sessions-grid' && cellChanged && cellChanged.length) {
+                    request = {op: 'edit', changes: changedCells()};
+                } else {
+                    return noUpdate;
+                }
+                request.paged = true;
+                request.store = sessionsStore;
+                request.timestamp = Date.now();
+                return request;
+            }
+
+            if (trigger === 'add-row-sessions-btn') {
+                request = {op: 'add', last: count ? rowAt(count - 1) : null, count: count};
+            } else if (trigger === 'delete-row-sessions-btn') {
+                const selected = api.getSelectedNodes();
+                if (!selected.length) {
+                    return noUpdate;
+                }
+                const start = Math.min.apply(null, selected.map(function (node) { return node.rowIndex; }));
+                const tail = [];
+                for (let index = start; index < count; index++) {
+                    tail.push(rowAt(index));
+                }
+                request = {
+                    op: 'delete',
+                    selected: selectedNumbers(),
+                    start: start,
+                    tail: tail,
+                    count: count
+                };
+            } else if (trigger === 'sessions-grid' && cellChanged && cellChanged.length) {
+                // All changes of a paste or of quick successive edits, with the rows around them
+                const changes = changedCells();
+                const indices = [];
+                const included = {};
+                changes.forEach(function (change) {
+                    for (let index = change.rowIndex - 1; index <= change.rowIndex + 1; index++) {
+                        if (index >= 0 && index < count && !included[index]) {
+                            included[index] = true;
+                            indices.push(index);
+                        }
+                    }
+                });
+                request = {op: 'edit', changes: changes, indices: indices, rows: indices.map(rowAt)};
+            } else {
+                return noUpdate;
+            }
+
+            // Server-side stores are resolved by their handle, browser stores are patched
+            const isHandle = sessionsStore && !Array.isArray(sessionsStore) && 'record_id' in sessionsStore;
+            request.store = isHandle ? sessionsStore : null;
+            request.timestamp = Date.now();
+            return request;
+        },
+
+        // Reload the loaded blocks of the paged grid
+        refresh_rows: function (sessionsStore, rowModelType) {
+            if (rowModelType === 'infinite') {
+                try {
+                    dash_ag_grid.getApi('sessions-grid').refreshInfiniteCache();
+                } catch (e) {
+                    // Grid not rendered yet, it loads the current rows when it is
+                }
+            }
+            return window.dash_clientside.no_update;
+        }
+    },
+
+    grids: {
+
+        // Request the deletion of the selected rows of a grid by their position
+        request_delete: function (nClicks, gridId) {
+            let api;
+            try {
+                api = dash_ag_grid.getApi(gridId);
+            } catch (e) {
+                return window.dash_clientside.no_update;
+            }
+            const rows = api.getSelectedNodes().map(function (node) { return node.rowIndex; });
+            if (!rows.length) {
+                return window.dash_clientside.no_update;
+            }
+            rows.sort(function (a, b) { return a - b; });
+            return {clicks: nClicks, rows: rows};
+        }
+    },
+
+    library: {
+        // Note the time of the last change and start the autosave interval, if the library is enabled
+        mark_changed: function (client, measures, sessions, practices, autosave) {
+            const noUpdate = window.dash_clientside.no_update;
+            if (!autosave) {
+                return [noUpdate, noUpdate];
+            }
+            return [Date.now(), false];
+        },
+
+        // Request a save once the record has not changed for a whole interval, stop when it is saved
+        check_autosave: function (nIntervals, changed, autosave) {
+            const noUpdate = window.dash_clientside.no_update;
+            if (!autosave || changed === null || changed === autosave.saved) {
+                return [noUpdate, noUpdate, true];
+            }
+            if (changed !== autosave.seen) {
+                return [Object.assign({}, autosave, {seen: changed}), noUpdate, false];
+            }
+            return [noUpdate, changed, false];
+        }
+    },
+
+    progress: {
+        // Start a task for an upload under a new ID and show its progress until it is done
+        start_task: function (contents) {
+            const noUpdate = window.dash_clientside.no_update;
+            if (!contents || (Array.isArray(contents) && !contents.length)) {
+                return [noUpdate, noUpdate, noUpdate, noUpdate, noUpdate];
+            }
+            const bytes = window.crypto.getRandomValues(new Uint8Array(16));
+            const id = Array.from(bytes, function (byte) { return byte.toString(16).padStart(2, '0'); }).join('');
+            return [{id: id}, false, false, 0, ''];
+        }
+    }
+});
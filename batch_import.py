@@ -0,0 +1,205 @@
+import base64
+import io
+import multiprocessing
+import os
+import re
+import sys
+import threading
+import uuid
+import zipfile
+from concurrent.futures import ProcessPoolExecutor, FIRST_COMPLETED, wait
+from concurrent.futures.process import BrokenProcessPool
+from globals import COHORT_DATA_DIR, RECORD_LIBRARY, RECORD_EXTENSIONS, COMPRESSED_EXTENSION, IMPORT_WORKERS, MAX_RECORD_SIZE
+from record_io import parse_record_bytes, write_record
+
+# Batch import of record files
+#
+# Uploaded record files, and the record files in uploaded zip archives, are parsed and sanitized in a
+# pool of IMPORT_WORKERS processes shared by all imports. At most twice as many files are submitted at
+# once, so only a few decoded files are held in memory besides the upload. Each record is written to
+# COHORT_DATA_DIR as a compressed binary record named after its file, replacing an earlier import of
+# the same file, and saved to the record library under a library ID derived from that name if it is
+# enabled.
+#
+# Workers are started with spawn, as forking the threaded server could copy locks held by other
+# threads into the workers. Files in archives and compressed records are limited to MAX_RECORD_SIZE
+# bytes after decompression.
+
+ARCHIVE_EXTENSION = '.zip'
+
+_executor = None
+_executor_lock = threading.Lock()
+
+def _get_executor():
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ProcessPoolExecutor(max_workers=IMPORT_WORKERS, mp_context=multiprocessing.get_context('spawn'))
+        return _executor
+
+def _reset_executor(executor):
+    # A pool whose worker died cannot be used again
+    global _executor
+    with _executor_lock:
+        if _executor is executor:
+            _executor = None
+    executor.shutdown(wait=False)
+
+def is_record_file(name):
+    '''Check if a filename has a record extension, compressed or not'''
+    name = name.lower()
+    if name.endswith(COMPRESSED_EXTENSION):
+        name = name[:-len(COMPRESSED_EXTENSION)]
+    return name.endswith(tuple(RECORD_EXTENSIONS.values()))
+
+def output_name(name, number=1):
+    '''Filename of an imported record in the cohort directory, numbered if number is above 1'''
+    stem = os.path.basename(name)
+    if stem.lower().endswith(COMPRESSED_EXTENSION):
+        stem = stem[:-len(COMPRESSED_EXTENSION)]
+    stem = os.path.splitext(stem)[0]
+    stem = re.sub(r'[^\w\-]+', '_', stem).strip('_') or 'record'
+    if number > 1:
+        stem += f'_{number}'
+    return stem + RECORD_EXTENSIONS['binary'] + COMPRESSED_EXTENSION
+
+def record_files(filenames, contents):
+    '''Yield (name, data, error) for every uploaded record file and every record file in uploaded
+    zip archives. data is None if the file is not imported, with the reason in error.'''
+    for filename, content in zip(filenames, contents):
+        try:
+            data = base64.b64decode(content[content.index(',') + 1:])
+        except ValueError:
+            yield filename, None, 'Invalid file.'
+            continue
+
+        if not filename.lower().endswith(ARCHIVE_EXTENSION):
+            if is_record_file(filename):
+                yield filename, data, None
+            else:
+                yield filename, None, 'Not a record file.'
+            continue
+
+        try:
+            with zipfile.ZipFile(io.BytesIO(data)) as archive:
+                members = [
+                    member for member in archive.infolist()
+                    if not member.is_dir() and is_record_file(member.filename)
+                    and not member.filename.startswith('__MACOSX/') and not os.path.basename(member.filename).startswith('.')
+                ]
+                if not members:
+                    yield filename, None, 'No record files in the archive.'
+                # Members are read one at a time, as they are submitted
+                for member in members:
+                    name = f'{filename}/{member.filename}'
+                    if member.file_size > MAX_RECORD_SIZE:
+                        yield name, None, 'The file is too large.'
+                        continue
+                    # The size in the archive is not trusted, at most one byte more is read
+                    with archive.open(member) as file:
+                        data = file.read(MAX_RECORD_SIZE + 1)
+                    if len(data) > MAX_RECORD_SIZE:
+                        yield name, None, 'The file is too large.'
+                    else:
+                        yield name, data, None
+        except zipfile.BadZipFile:
+            yield filename, None, 'Invalid archive.'
+
+def import_record_file(name, data, filename):
+    '''Parse and sanitize a record file, write it to the cohort directory as filename and save it to
+    the record library. Runs in a worker process, returns the result for the import report.'''
+    # Workers started without fork have to create the app before the pages can be imported
+    if 'pages.home' not in sys.modules:
+        import app  # Registers the pages before they are imported
+    from pages.home import sanitize_data_types, format_sanitize_report
+    from library import save_library_record, record_summary, import_library_id
+
+    try:
+        report = {}
+        record = sanitize_data_types(parse_record_bytes(data), report)
+        if not isinstance(record, dict):
+            raise ValueError('The record is not a JSON object.')
+    except Exception as e:
+        print(f"Error importing {name}: {str(e)}")
+        return {'name': name, 'status': 'failed', 'message': 'Invalid file format.'}
+
+    # Write atomically so the cohort page never reads a partial file
+    os.makedirs(COHORT_DATA_DIR, exist_ok=True)
+    path = os.path.join(COHORT_DATA_DIR, filename)
+    temp_path = f'{path}.{uuid.uuid4().hex}.tmp'
+    with open(temp_path, 'wb') as file:
+        file.write(write_record(record, 'binary', compress=True))
+    os.replace(temp_path, path)
+
+    messages = [f'Saved as {filename}.']
+    if RECORD_LIBRARY:
+        if record_summary(record)['client_id']:
+            save_library_record(record, import_library_id(filename))
+        else:
+            messages.append('Not added to the library, the record has no client ID.')
+    sanitize_message = format_sanitize_report(report)
+    if sanitize_message:
+        messages.append(sanitize_message)
+
+    return {
+        'name': name,
+        'status': 'warning' if report.get('dropped') else 'imported',
+        'message': ' '.join(messages),
+    }
+
+def import_records(filenames, contents, progress=None):
+    '''Import uploaded record files and zip archives in the worker processes.
+    Returns the results per file, in the order of the uploads.
+
+    progress(done, total) is called whenever a file is done, total counts the files found so far as
+    the files in archives are only listed when the archive is read.'''
+    results = []
+    futures = {}
+    used_names = set()
+    executor = _get_executor()
+
+    def collect(done):
+        nonlocal executor
+        for future in done:
+            index, name = futures.pop(future)
+            try:
+                results[index] = future.result()
+            except Exception as e:
+                print(f"Error importing {name}: {str(e)}")
+                results[index] = {'name': name, 'status': 'failed', 'message': 'Import failed.'}
+                if isinstance(e, BrokenProcessPool):
+                    _reset_executor(executor)
+                    executor = _get_executor()
+        if progress:
+            progress(len(results) - len(futures), len(results))
+
+    for name, data, error in record_files(filenames, contents):
+        if data is None:
+            results.append({'name': name, 'status': 'failed', 'message': error})
+            continue
+
+        # Files with the same name in one batch are numbered
+        number = 1
+        while output_name(name, number) in used_names:
+            number += 1
+        filename = output_name(name, number)
+        used_names.add(filename)
+
+        if len(futures) >= 2 * IMPORT_WORKERS:
+            done, _ = wait(futures, return_when=FIRST_COMPLETED)
+            collect(done)
+
+        try:
+            future = executor.submit(import_record_file, name, data, filename)
+        except BrokenProcessPool:
+            _reset_executor(executor)
+            executor = _get_executor()
+            future = executor.submit(import_record_file, name, data, filename)
+        futures[future] = (len(results), name)
+        results.append(None)
+
+    while futures:
+        done, _ = wait(futures, return_when=FIRST_COMPLETED)
+        collect(done)
+
+    return results
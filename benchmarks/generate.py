@@ -0,0 +1,77 @@
+import argparse
+import json
+from datetime import date, timedelta
+import numpy as np
+from globals import COLORS_MEASURES
+
+# Synthetic record generator
+# Writes records with the same shape as example-data/example.json, e.g.:
+# python -m benchmarks.generate --sessions 1000 --measures 10 --practices 5 --missing 0.2 -o record.json
+
+RATERS = ['Self', 'Caregiver', 'Educator', 'Therapist', 'Other']
+
+def generate_record(num_sessions, num_measures, num_practices, missing_rate=0.2, seed=0):
+    '''Generate a record with mixed Scale and Count measures and random session data'''
+    rng = np.random.default_rng(seed)
+
+    measures = []
+    for i in range(num_measures):
+        is_count = i % 3 == 2
+        measures.append({
+            'Name': f'Measure {i + 1}',
+            'Type': 'Count' if is_count else 'Scale',
+            'Min': 0,
+            'Max': None if is_count else float(rng.choice([10, 63, 100])),
+            'Rater': RATERS[i % len(RATERS)],
+            'Description': f'Synthetic measure {i + 1}',
+            'SelectMeasure': True,
+            'SelectRater': False,
+            'Color': COLORS_MEASURES[i % len(COLORS_MEASURES)],
+        })
+
+    practices = [{'Name': f'Practice {i + 1}', 'Description': f'Synthetic practice {i + 1}'} for i in range(num_practices)]
+
+    # Sessions 1 to 14 days apart
+    first_date = date(2020, 1, 1)
+    days = np.cumsum(rng.integers(1, 15, num_sessions)) - 1
+
+    columns = {}
+    for measure in measures:
+        if measure['Type'] == 'Count':
+            values = rng.poisson(5, num_sessions).astype(float)
+        else:
+            values = np.round(rng.uniform(measure['Min'], measure['Max'], num_sessions), 1)
+        values[rng.random(num_sessions) < missing_rate] = np.nan
+        columns[measure['Name']] = [None if np.isnan(value) else value for value in values.tolist()]
+    for practice in practices:
+        columns[practice['Name']] = (rng.random(num_sessions) < 0.3).tolist()
+
+    sessions = [
+        {
+            'session_number': i + 1,
+            'session_date': (first_date + timedelta(days=int(days[i]))).isoformat(),
+            **{name: values[i] for name, values in columns.items()},
+        }
+        for i in range(num_sessions)
+    ]
+
+    client = [{'ID': f'Synthetic {seed}', 'Age': 30, 'Gender': '', 'Focus': 'Benchmark', 'Notes': ''}]
+
+    return {'client': client, 'measures': measures, 'sessions': sessions, 'practices': practices}
+
+def main():
+    parser = argparse.ArgumentParser(description='Generate a synthetic PsyDash record.')
+    parser.add_argument('--sessions', type=int, default=1000)
+    parser.add_argument('--measures', type=int, default=10)
+    parser.add_argument('--practices', type=int, default=10)
+    parser.add_argument('--missing', type=float, default=0.2, help='Share of missing measure values')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('-o', '--output', default='record.json')
+    args = parser.parse_args()
+
+    record = generate_record(args.sessions, args.measures, args.practices, args.missing, args.seed)
+    with open(args.output, 'w') as file:
+        json.dump(record, file, indent=2)
+
+if __name__ == '__main__':
+    main()
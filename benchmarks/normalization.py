@@ -0,0 +1,53 @@
+import timeit
+import numpy as np
+import pandas as pd
+from records import measure_index, normalize_measures
+
+# Micro-benchmark of measure normalization
+# Run from the repository root: python -m benchmarks.normalization
+
+NUM_SESSIONS = 1000
+NUM_MEASURES = [10, 20, 40, 80, 160]
+REPEAT = 5
+
+def create_measures(num_measures):
+    return [
+        {'Name': f'Measure {i}', 'Type': 'Count' if i % 4 == 0 else 'Scale', 'Min': 0, 'Max': None if i % 4 == 0 else 100}
+        for i in range(num_measures)
+    ]
+
+def create_values(measures, num_sessions, rng):
+    values = {}
+    for measure in measures:
+        column = rng.uniform(0, 100, num_sessions)
+        column[rng.random(num_sessions) < 0.2] = np.nan
+        values[measure['Name']] = column
+    return values
+
+def normalize_legacy(df, measures_data, selected_measures):
+    '''Previous implementation: linear lookup and one column at a time after a full copy'''
+    df_normalized = df.copy()
+    for measure in selected_measures:
+        measure_data = next(m for m in measures_data if m['Name'] == measure)
+        min_value = measure_data['Min']
+        max_value = measure_data['Max'] if measure_data['Type'] == 'Scale' else df[measure].max()
+        df_normalized[measure] = (df[measure] - min_value) / (max_value - min_value)
+    return df_normalized
+
+def run():
+    rng = np.random.default_rng(0)
+    print(f'{"measures":>10} {"legacy [ms]":>12} {"vectorized [ms]":>16}')
+
+    for num_measures in NUM_MEASURES:
+        measures = create_measures(num_measures)
+        values = create_values(measures, NUM_SESSIONS, rng)
+        names = [measure['Name'] for measure in measures]
+        df = pd.DataFrame(values)
+
+        legacy = min(timeit.repeat(lambda: normalize_legacy(df, measures, names), number=1, repeat=REPEAT))
+        vectorized = min(timeit.repeat(lambda: normalize_measures(values, measure_index(measures), names), number=1, repeat=REPEAT))
+
+        print(f'{num_measures:>10} {legacy * 1000:>12.2f} {vectorized * 1000:>16.2f}')
+
+if __name__ == '__main__':
+    run()
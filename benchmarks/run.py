@@ -0,0 +1,141 @@
+import argparse
+import copy
+import json
+import sys
+import time
+import app  # Registers the pages before they are imported
+from pages import dashboard, sessions, measures, home
+from benchmarks.generate import generate_record
+
+# Benchmarks of the functions behind the callbacks
+# Run from the repository root: python -m benchmarks.run [--sizes 1000 10000] [--output results.json]
+# Exits with status 1 if a budget is exceeded.
+
+DEFAULT_SIZES = [1000, 10000]
+NUM_MEASURES = 10
+NUM_PRACTICES = 10
+MISSING_RATE = 0.2
+REPEAT = 3
+
+# Budgets per function: maximum seconds at the largest size, and maximum growth of the run time
+# relative to the growth of the number of sessions (1 is linear, quadratic code grows with the size factor)
+BUDGETS = {
+    'create_dashboard_graph': {'seconds': 2.0, 'scaling': 2.0},
+    'validate_and_update_cell': {'seconds': 0.01, 'scaling': 2.0},
+    'delete_sessions': {'seconds': 0.5, 'scaling': 2.0},
+    'reorder_measures': {'seconds': 1.0, 'scaling': 2.0},
+    'update_sessions_on_out_of_range': {'seconds': 0.5, 'scaling': 2.0},
+    'sanitize_data_types': {'seconds': 2.0, 'scaling': 2.0},
+}
+
+# Each benchmark prepares a call on a fresh copy of the record, only the call is timed
+
+def bench_create_dashboard_graph(record):
+    dashboard.build_dashboard_figure.cache_clear()
+    return lambda: dashboard.create_dashboard_graph(record['sessions'], record['measures'], record['practices'], 'Normalized', 'Day')
+
+def bench_validate_and_update_cell(record):
+    row_index = len(record['sessions']) // 2
+    measure = record['measures'][0]['Name']
+    cell_changed = [{
+        'colId': measure,
+        'rowIndex': row_index,
+        'oldValue': record['sessions'][row_index][measure],
+        'value': 5,
+    }]
+    return lambda: sessions.validate_and_update_cell(record['sessions'], cell_changed, record['measures'], record['practices'])
+
+def bench_delete_sessions(record):
+    selected_numbers = [session['session_number'] for session in record['sessions'][::10]]
+    return lambda: sessions.delete_sessions(record['sessions'], selected_numbers)
+
+def bench_reorder_measures(record):
+    virtual_row_data = record['measures'][::-1]
+    return lambda: measures.reorder_measures(virtual_row_data, record['measures'], record['sessions'])
+
+def bench_update_sessions_on_out_of_range(record):
+    rows = record['measures']
+    rows[0]['Max'] = rows[0]['Max'] / 2
+    return lambda: measures.update_sessions_on_out_of_range(0, rows, record['sessions'])
+
+def bench_sanitize_data_types(record):
+    return lambda: home.sanitize_data_types(record)
+
+BENCHMARKS = {
+    'create_dashboard_graph': bench_create_dashboard_graph,
+    'validate_and_update_cell': bench_validate_and_update_cell,
+    'delete_sessions': bench_delete_sessions,
+    'reorder_measures': bench_reorder_measures,
+    'update_sessions_on_out_of_range': bench_update_sessions_on_out_of_range,
+    'sanitize_data_types': bench_sanitize_data_types,
+}
+
+def time_benchmark(benchmark, record, repeat=REPEAT):
+    '''Best run time of a benchmark in seconds'''
+    timings = []
+    for _ in range(repeat):
+        call = benchmark(copy.deepcopy(record))
+        start = time.perf_counter()
+        call()
+        timings.append(time.perf_counter() - start)
+    return min(timings)
+
+def check_budgets(results, sizes):
+    '''List the budgets exceeded by the results'''
+    violations = []
+    size_factor = sizes[-1] / sizes[0]
+
+    for name, timings in results.items():
+        budget = BUDGETS[name]
+        largest = timings[str(sizes[-1])]
+        if largest > budget['seconds']:
+            violations.append(f'{name}: {largest:.4f} s at {sizes[-1]} sessions exceeds {budget["seconds"]} s')
+
+        if len(sizes) > 1 and timings[str(sizes[0])] > 0:
+            growth = (largest / timings[str(sizes[0])]) / size_factor
+            if growth > budget['scaling']:
+                violations.append(f'{name}: run time grows {growth:.1f} times faster than the number of sessions')
+
+    return violations
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark the PsyDash callbacks on synthetic records.')
+    parser.add_argument('--sizes', type=int, nargs='+', default=DEFAULT_SIZES, help='Numbers of sessions')
+    parser.add_argument('--only', nargs='+', choices=list(BENCHMARKS), help='Run only these benchmarks')
+    parser.add_argument('--output', help='Write the results as JSON to this file')
+    args = parser.parse_args()
+
+    sizes = sorted(args.sizes)
+    names = args.only or list(BENCHMARKS)
+    records = {size: generate_record(size, NUM_MEASURES, NUM_PRACTICES, MISSING_RATE) for size in sizes}
+
+    results = {}
+    for name in names:
+        results[name] = {str(size): time_benchmark(BENCHMARKS[name], records[size]) for size in sizes}
+        timings = ', '.join(f'{size}: {results[name][str(size)] * 1000:.2f} ms' for size in sizes)
+        print(f'{name:<34} {timings}', file=sys.stderr)
+
+    violations = check_budgets(results, sizes)
+    for violation in violations:
+        print(f'Budget exceeded - {violation}', file=sys.stderr)
+
+    report = {
+        'sizes': sizes,
+        'measures': NUM_MEASURES,
+        'practices': NUM_PRACTICES,
+        'missing_rate': MISSING_RATE,
+        'results': results,
+        'budgets': {name: BUDGETS[name] for name in names},
+        'violations': violations,
+    }
+
+    if args.output:
+        with open(args.output, 'w') as file:
+            json.dump(report, file, indent=2)
+    else:
+        print(json.dumps(report, indent=2))
+
+    sys.exit(1 if violations else 0)
+
+if __name__ == '__main__':
+    main()
@@ -1,6 +1,7 @@
 from datetime import date
 import seaborn as sns
 import os
+import tempfile
 from dash import html, dcc
 import dash_mantine_components as dmc
 from dash_iconify import DashIconify
@@ -17,7 +18,48 @@ PAGE_HEADER_STYLE = {
 
 # Directories
 CURRENT_DIR = os.path.dirname(os.path.abspath(__file__))
-EXAMPLE_FILE_PATH = os.path.join(CURRENT_DIR, "example-data", "example.json")
+EXAMPLE_DATA_DIR = os.path.join(CURRENT_DIR, "example-data")
+
+# Bundled example and template records by the name shown under Show example
+EXAMPLE_RECORDS = {
+    'Example client': 'example.json',
+    'Intake template (PHQ-9, GAD-7, WHO-5)': 'template-intake.json',
+}
+
+# Formats of saved records and their file extensions
+RECORD_FORMATS = {'json': 'JSON', 'binary': 'Binary'}
+RECORD_EXTENSIONS = {'json': '.json', 'binary': '.psydash'}
+COMPRESSED_EXTENSION = '.gz'
+
+# Directory with saved records shown on the cohort page
+COHORT_DATA_DIR = os.environ.get('PSYDASH_COHORT_DIR', os.path.join(CURRENT_DIR, "cohort-data"))
+
+# Server-side record storage, the browser stores then only keep a handle to the record
+SERVER_SIDE_STORE = os.environ.get('PSYDASH_SERVER_STORE', '').lower() in ['1', 'true', 'yes']
+RECORD_STORE_DIR = os.environ.get('PSYDASH_STORE_DIR', os.path.join(CURRENT_DIR, "record-store"))
+RECORD_STORE_MAX_ENTRIES = 10000
+RECORD_STORE_TTL = 7 * 24 * 60 * 60
+
+# Journal of server-side records, revisions between snapshots and revisions kept for undo
+JOURNAL_SNAPSHOT_INTERVAL = 200
+UNDO_DEPTH = 50
+
+# Record library, records are autosaved to an SQLite database on the server and can be opened from the home page
+RECORD_LIBRARY = os.environ.get('PSYDASH_LIBRARY', '').lower() in ['1', 'true', 'yes']
+RECORD_LIBRARY_PATH = os.environ.get('PSYDASH_LIBRARY_PATH', os.path.join(CURRENT_DIR, "record-library.db"))
+LIBRARY_PAGE_SIZE = 50
+
+# Seconds without changes before the record is autosaved to the library
+AUTOSAVE_INTERVAL = 5
+
+# Progress of record loads and imports, shared by all workers, and seconds between updates on the page
+PROGRESS_DIR = os.environ.get('PSYDASH_PROGRESS_DIR', os.path.join(tempfile.gettempdir(), 'psydash-progress'))
+PROGRESS_POLL_INTERVAL = 0.5
+
+# Paged sessions grid, rows are loaded in blocks from the server-side record while scrolling
+PAGED_SESSIONS_GRID = SERVER_SIDE_STORE and os.environ.get('PSYDASH_PAGED_SESSIONS', '').lower() in ['1', 'true', 'yes']
+SESSIONS_BLOCK_SIZE = 100
+SESSIONS_MAX_BLOCKS = 10
 
 # Instructions
 INSTRUCTIONS = '''
@@ -47,6 +89,25 @@ COLORS_MEASURES = COLORS_MEASURES[::2] + COLORS_MEASURES[1::2]
 # Alert duration
 ALERT_DURATION = 7000
 
+# Number of rows parsed and validated at once when importing sessions
+IMPORT_CHUNK_ROWS = 5000
+
+# Number of worker processes parsing and sanitizing records in a batch import
+IMPORT_WORKERS = min(4, os.cpu_count() or 1)
+
+# Number of base64 characters of an uploaded record decoded and parsed at once
+UPLOAD_CHUNK_SIZE = 1 << 20
+
+# Largest record accepted after decompression, in bytes, also for each file in an imported archive
+MAX_RECORD_SIZE = 64 * 1024 * 1024
+
+# Dashboard figure cache (approximate size of the cached figures in bytes, seconds until expiry)
+FIGURE_CACHE_MAXSIZE = 256 * 1024 * 1024
+FIGURE_CACHE_TTL = 900
+
+# Maximum number of points per dashboard trace before downsampling
+DOWNSAMPLE_THRESHOLD = 2000
+
 # Help button
 def create_help_button(help_text, position="bottom-end", button_position={'top': '2rem', 'right': '2rem'}):
 
@@ -86,9 +147,11 @@ HELP_TEXT_HOME = """
 Manage the data record.
 
 - Start a new record by clicking **Start New**. 
-- Load and edit an existing record by clicking **Load Record**. Only .json files saved from PsyDash are accepted.
-- Save a record by clicking **Save Record**. In the pop-up menu, enter a filename. The filetype .json is added automatically.
-- Show an example by clicking **Show example**.
+- Load and edit an existing record by clicking **Load Record**. Only .json and .psydash files saved from PsyDash are accepted, also when compressed (.gz).
+- Save a record by clicking **Save Record**. In the pop-up menu, enter a filename and choose the format. JSON files (.json) can be read by other programs, binary files (.psydash) are much smaller. Check **Compress (gzip)** to make the file smaller still. The filetype is added automatically.
+- Import many records at once by clicking **Import Records** and selecting the files or a .zip archive of them. The records are added to the cohort on the server, and to the record library if it is enabled. A report lists the result for every file.
+- Show an example by clicking **Show example** and choosing the example. Templates start a record with a standard set of measures.
+- If the record library is enabled, records with a client ID are saved automatically on the server. Open them again by clicking **Load from Library** and searching for the client ID or a term of the focus.
 """
 
 
@@ -162,6 +225,16 @@ Administrate sessions and enter data.
 ##### Add and delete sessions
 - Add a new session by clicking the **Add Row** button. 
 - Delete selected sessions by clicking the **Delete Selected** button.
+
+##### Import sessions
+- Import sessions from a CSV or TSV file by clicking the **Import CSV** button.
+- The file needs a header row. A **Date** or **session_date** column is required, other columns are matched to measures and practices by name. Unknown columns are ignored.
+- Imported sessions are added after the existing sessions. Rows with an invalid date, a date not after the previous session, or a measure value outside the Min - Max range are skipped and reported.
+- Practices are marked as implemented by 1, true, yes or x.
+
+##### Undo and redo
+- With server-side storage, changes of the session data made on this page can be undone with the **Undo** button and restored with **Redo**.
+- Changes of measures or practices cannot be undone, earlier changes of the session data can no longer be undone after them.
 """
 
 HELP_TEXT_DASHBOARD = """
@@ -185,15 +258,36 @@ View the dashboard and set options for the visualization.
 - Change the unit of the x-axis by selecting Day or Session from the dropdown menu.
 """
 
+HELP_TEXT_COHORT = """
+### Help
+
+View the progress of many clients at once.
+
+##### Records
+- All PsyDash records saved in the cohort directory on the server are included.
+- Filter the records by entering a term contained in the **Focus** of the clients.
+
+##### Measure
+- Select the measure to aggregate. Records without the measure are not included.
+
+##### Y-Axis
+- Raw shows the raw values.
+- Normalized shows the values normalized according to the Min and Max of each record. For count-based measures, Max is set to the maximum value in the record.
+
+##### X-Axis
+- Session aligns the records by session number.
+- Day aligns the records by days since the first session of each record. Values are averaged per week.
+
+##### Graph
+- The line shows the median, the dashed line the mean and the band the interquartile range across records.
+"""
+
 # Retrieve selected raters from measures
+from records import schema_index
 def get_rater_selection(measures_data):
-    rater_selection = {}
-    for measure in measures_data:
-        if measure['Rater'] not in rater_selection:
-            rater_selection[measure['Rater']] = measure['SelectRater']
-    rater_selection = dict(sorted(rater_selection.items()))
-
-    return rater_selection
+    # The first measure of each rater determines the selection of the rater
+    raters = schema_index(measures_data, [])['raters']
+    return {rater: measures_data[raters[rater][0]]['SelectRater'] for rater in sorted(raters)}
 
 # Encode and decode text strings to handle umlauts and other special characters
 from urllib.parse import quote, unquote
@@ -0,0 +1,204 @@
+import hashlib
+import os
+import re
+import sqlite3
+import threading
+import time
+import uuid
+from globals import RECORD_LIBRARY_PATH, LIBRARY_PAGE_SIZE
+from record_io import write_record, parse_record_bytes
+
+# Record library
+#
+# With RECORD_LIBRARY enabled, records are autosaved to an SQLite database in WAL mode at
+# RECORD_LIBRARY_PATH and can be opened again from the home page. Each record is saved under a
+# library ID, chosen when a record is loaded, started or opened in a browser session, so records of
+# different users with the same client ID never replace each other. Imported record files are saved
+# under an ID derived from their file name, replacing an earlier import of the same file.
+# The records are stored in the compressed binary format. The client ID, the focus terms and the
+# last session date are kept in indexed columns so that listing and searching never reads the records.
+
+SCHEMA_VERSION = 2
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS records (
+    id INTEGER PRIMARY KEY,
+    library_id TEXT NOT NULL UNIQUE,
+    client_id TEXT NOT NULL COLLATE NOCASE,
+    focus TEXT NOT NULL,
+    last_session_date TEXT,
+    session_count INTEGER NOT NULL,
+    updated REAL NOT NULL,
+    digest TEXT NOT NULL,
+    data BLOB NOT NULL
+);
+CREATE INDEX IF NOT EXISTS records_last_session_date ON records (last_session_date);
+CREATE INDEX IF NOT EXISTS records_client_id ON records (client_id);
+CREATE TABLE IF NOT EXISTS focus_terms (
+    record_id INTEGER NOT NULL REFERENCES records (id) ON DELETE CASCADE,
+    term TEXT NOT NULL COLLATE NOCASE
+);
+CREATE INDEX IF NOT EXISTS focus_terms_term ON focus_terms (term);
+CREATE INDEX IF NOT EXISTS focus_terms_record_id ON focus_terms (record_id);
+'''
+
+# Separators of the terms in the Focus field
+FOCUS_SEPARATORS = re.compile(r'[,;/]')
+
+# Library IDs are 32 hex digits, they come from the browser and are checked before use
+LIBRARY_ID = re.compile(r'[0-9a-f]{32}')
+
+# Wait for locks held by other workers instead of failing
+BUSY_TIMEOUT = 5
+
+_connections = threading.local()
+
+def _migrate(connection):
+    # Version 1 kept one row per client ID, its rows are kept under new library IDs.
+    # The check is repeated in the transaction, as other workers may migrate at the same time.
+    connection.execute('BEGIN IMMEDIATE')
+    try:
+        columns = [row['name'] for row in connection.execute('PRAGMA table_info(records)')]
+        if columns and 'library_id' not in columns:
+            connection.execute('DROP TABLE IF EXISTS focus_terms')
+            connection.execute('DROP INDEX IF EXISTS records_last_session_date')
+            connection.execute('ALTER TABLE records RENAME TO records_v1')
+            for statement in SCHEMA.split(';'):
+                if statement.strip():
+                    connection.execute(statement)
+            connection.execute(
+                '''INSERT INTO records (id, library_id, client_id, focus, last_session_date, session_count, updated, digest, data)
+                SELECT id, lower(hex(randomblob(16))), client_id, focus, last_session_date, session_count, updated, digest, data
+                FROM records_v1'''
+            )
+            connection.execute('DROP TABLE records_v1')
+            connection.executemany(
+                'INSERT INTO focus_terms (record_id, term) VALUES (?, ?)',
+                [(row['id'], term) for row in connection.execute('SELECT id, focus FROM records').fetchall()
+                 for term in focus_terms(row['focus'])]
+            )
+        connection.execute(f'PRAGMA user_version = {SCHEMA_VERSION}')
+        connection.commit()
+    except BaseException:
+        connection.rollback()
+        raise
+
+def _connect():
+    # One connection per thread and process, sqlite3 connections cannot be shared between threads
+    # or with forked import workers
+    connection = getattr(_connections, 'connection', None)
+    if connection is None or _connections.pid != os.getpid():
+        connection = sqlite3.connect(RECORD_LIBRARY_PATH, timeout=BUSY_TIMEOUT)
+        connection.row_factory = sqlite3.Row
+        connection.execute('PRAGMA journal_mode=WAL')
+        connection.execute('PRAGMA synchronous=NORMAL')
+        connection.execute('PRAGMA foreign_keys=ON')
+        if connection.execute('PRAGMA user_version').fetchone()[0] < SCHEMA_VERSION:
+            _migrate(connection)
+        connection.executescript(SCHEMA)
+        _connections.connection = connection
+        _connections.pid = os.getpid()
+    return connection
+
+def new_library_id():
+    '''Library ID for a record that is not in the library yet'''
+    return uuid.uuid4().hex
+
+def import_library_id(filename):
+    '''Library ID of a record imported from a file, the same for every import of the file'''
+    return uuid.uuid5(uuid.NAMESPACE_URL, f'psydash-import/{filename}').hex
+
+def is_library_id(library_id):
+    '''Check if a value from the browser is a library ID'''
+    return isinstance(library_id, str) and LIBRARY_ID.fullmatch(library_id) is not None
+
+def record_summary(record):
+    '''Client ID, focus, last session date and number of sessions of a record'''
+    client = (record.get('client') or [{}])[0] or {}
+    sessions = [session for session in record.get('sessions') or [] if session]
+    dates = [session['session_date'] for session in sessions if isinstance(session.get('session_date'), str)]
+    return {
+        'client_id': str(client.get('ID') or '').strip(),
+        'focus': str(client.get('Focus') or '').strip(),
+        'last_session_date': max(dates) if dates else None,
+        'session_count': len(sessions),
+    }
+
+def focus_terms(focus):
+    '''Terms of a Focus field, such as the diagnoses in "Depression, Eating"'''
+    return sorted({term.strip() for term in FOCUS_SEPARATORS.split(focus) if term.strip()})
+
+def save_library_record(record, library_id):
+    '''Save a sanitized record under a library ID, replacing the record saved under it before.
+    Records without client ID are not saved. Returns True if the library changed.'''
+    if not is_library_id(library_id):
+        raise ValueError(f'Invalid library ID: {library_id!r}')
+    summary = record_summary(record)
+    if not summary['client_id']:
+        return False
+
+    data = write_record(record, 'binary', compress=True)
+    digest = hashlib.sha256(data).hexdigest()
+
+    connection = _connect()
+    with connection:
+        row = connection.execute(
+            'SELECT id, digest FROM records WHERE library_id = ?', (library_id,)
+        ).fetchone()
+        if row and row['digest'] == digest:
+            return False
+
+        connection.execute(
+            '''INSERT INTO records (library_id, client_id, focus, last_session_date, session_count, updated, digest, data)
+            VALUES (:library_id, :client_id, :focus, :last_session_date, :session_count, :updated, :digest, :data)
+            ON CONFLICT (library_id) DO UPDATE SET
+                client_id = excluded.client_id,
+                focus = excluded.focus,
+                last_session_date = excluded.last_session_date,
+                session_count = excluded.session_count,
+                updated = excluded.updated,
+                digest = excluded.digest,
+                data = excluded.data''',
+            {**summary, 'library_id': library_id, 'updated': time.time(), 'digest': digest, 'data': data}
+        )
+        record_id = connection.execute('SELECT id FROM records WHERE library_id = ?', (library_id,)).fetchone()['id']
+
+        connection.execute('DELETE FROM focus_terms WHERE record_id = ?', (record_id,))
+        connection.executemany(
+            'INSERT INTO focus_terms (record_id, term) VALUES (?, ?)',
+            [(record_id, term) for term in focus_terms(summary['focus'])]
+        )
+    return True
+
+def _search_filter(search):
+    # WHERE clause and parameters of the records matching a search term
+    search = (search or '').strip()
+    if not search:
+        return '', {}
+    prefix = re.sub(r'([\\%_])', r'\\\1', search) + '%'
+    return '''WHERE client_id LIKE :prefix ESCAPE '\\'
+        OR id IN (SELECT record_id FROM focus_terms WHERE term LIKE :prefix ESCAPE '\\')''', {'prefix': prefix}
+
+def list_library_records(search='', page=1, page_size=LIBRARY_PAGE_SIZE):
+    '''Summaries of a page of the records whose client ID or one of whose focus terms starts with
+    the search term, most recent sessions first. Pages are numbered from 1.'''
+    where, parameters = _search_filter(search)
+    rows = _connect().execute(
+        f'''SELECT library_id, client_id, focus, last_session_date, session_count, updated FROM records
+        {where}
+        ORDER BY last_session_date DESC, id DESC LIMIT :limit OFFSET :offset''',
+        {**parameters, 'limit': page_size, 'offset': (max(page, 1) - 1) * page_size}
+    ).fetchall()
+    return [dict(row) for row in rows]
+
+def count_library_records(search=''):
+    '''Number of records matching a search term, see list_library_records'''
+    where, parameters = _search_filter(search)
+    return _connect().execute(f'SELECT COUNT(*) FROM records {where}', parameters).fetchone()[0]
+
+def read_library_record(library_id):
+    '''Record saved under a library ID, or None if there is none'''
+    if not is_library_id(library_id):
+        return None
+    row = _connect().execute('SELECT data FROM records WHERE library_id = ?', (library_id,)).fetchone()
+    return parse_record_bytes(row['data']) if row else None
@@ -4,6 +4,7 @@ import dash_bootstrap_components as dbc
 import dash_mantine_components as dmc
 from dash.exceptions import PreventUpdate
 from globals import APP_TITLE, PAGE_HEADER_STYLE, DEFAULT_CLIENT_INFO, HELP_TEXT_CLIENT, create_help_button
+from store import read_store, write_store
 
 dash.register_page(__name__, name='Client', order=1, title=APP_TITLE)
 
@@ -85,6 +86,7 @@ layout = html.Div([
     prevent_initial_call=False
 )
 def load_client_data(client_data, current_data):
+    client_data = read_store(client_data)
 
     if not client_data or not isinstance(client_data, list) or len(client_data) == 0:
         raise PreventUpdate
@@ -100,11 +102,12 @@ def load_client_data(client_data, current_data):
     State('client-store', 'data'),
     prevent_initial_call=True
 )
-def update_client_data(pathname, id_value, age_value, gender_value, focus_value, notes_value, current_data):
+def update_client_data(pathname, id_value, age_value, gender_value, focus_value, notes_value, client_store):
 
     if pathname == '/client':
         raise PreventUpdate 
     
+    current_data = read_store(client_store)
     if not current_data:
         current_data = [DEFAULT_CLIENT_INFO.copy()]
     
@@ -116,4 +119,4 @@ def update_client_data(pathname, id_value, age_value, gender_value, focus_value,
         'Notes': notes_value if notes_value is not None else ''
     }
     
-    return current_data
\ No newline at end of file
+    return write_store(current_data, client_store)
\ No newline at end of file
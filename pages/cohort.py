@@ -0,0 +1,297 @@
+import dash
+from dash import dcc, html, Input, Output, State, callback
+import dash_bootstrap_components as dbc
+import dash_mantine_components as dmc
+import os
+import threading
+import warnings
+import numpy as np
+import plotly.graph_objects as go
+from cachetools import LRUCache, cached
+from globals import APP_TITLE, PAGE_HEADER_STYLE, COHORT_DATA_DIR, COLORS_MEASURES, RECORD_EXTENSIONS, COMPRESSED_EXTENSION, HELP_TEXT_COHORT, create_help_button
+from records import sessions_to_columns, session_days, measure_index, normalize_measures
+from record_io import parse_record_bytes
+from pages.home import sanitize_data_types
+
+dash.register_page(__name__, name='Cohort', order=6, title=APP_TITLE)
+
+# Parsed records by file path and modification time
+record_cache = LRUCache(maxsize=5000)
+
+# Number of days averaged per point when aligning by day
+DAY_BIN_SIZE = 7
+
+# Page layout
+
+layout = html.Div([
+
+    # Header
+    html.H2('Cohort', style=PAGE_HEADER_STYLE),
+    html.Br(),
+
+    # Content
+    dbc.Row([
+
+        # Graph
+        dbc.Col([
+            dcc.Graph(id='cohort-graph', config={'staticPlot': True}, style={'visibility': 'hidden'})
+        ], width=9),
+
+        # Sidebar with filters and options
+        dbc.Col([
+            html.Div(id='cohort-info', className='mb-2'),
+            html.Br(),
+            html.Div('Focus'),
+            dmc.TextInput(
+                id='cohort-focus-input',
+                placeholder='All records',
+                debounce=500,
+                w=200,
+                persistence=True,
+            ),
+            html.Br(),
+            html.Div('Measure'),
+            dmc.Select(
+                id='cohort-measure-select',
+                data=[],
+                w=200,
+                searchable=True,
+                persistence=True,
+                allowDeselect=False
+            ),
+            html.Br(),
+            html.Div('Y-Axis'),
+            dmc.Select(
+                id='cohort-yaxis-select',
+                value='Normalized',
+                data=[
+                    {'value': 'Normalized'},
+                    {'value': 'Raw'}
+                ],
+                w=200,
+                persistence=True,
+                allowDeselect=False
+            ),
+            html.Br(),
+            html.Div('X-Axis'),
+            dmc.Select(
+                id='cohort-xaxis-select',
+                value='Session',
+                data=[
+                    {'value': 'Session'},
+                    {'value': 'Day'}
+                ],
+                w=200,
+                persistence=True,
+                allowDeselect=False
+            )
+        ]),
+    ]),
+    create_help_button(HELP_TEXT_COHORT)
+])
+
+# Callbacks
+
+# Measures available in the filtered records
+@callback(
+    Output('cohort-measure-select', 'data'),
+    Output('cohort-measure-select', 'value'),
+    Output('cohort-info', 'children'),
+    Input('cohort-focus-input', 'value'),
+    State('cohort-measure-select', 'value'),
+)
+def update_cohort_measures(focus, measure):
+    records = filter_records(load_cohort_records(COHORT_DATA_DIR), focus)
+    measure_names = sorted({name for record in records for name in record['measures']})
+
+    if measure not in measure_names:
+        measure = measure_names[0] if measure_names else None
+
+    info = f'{len(records)} records' if records else f'No records found in {COHORT_DATA_DIR}'
+
+    return [{'value': name} for name in measure_names], measure, info
+
+# Cohort graph
+@callback(
+    Output('cohort-graph', 'figure'),
+    Output('cohort-graph', 'style'),
+    Input('cohort-focus-input', 'value'),
+    Input('cohort-measure-select', 'value'),
+    Input('cohort-yaxis-select', 'value'),
+    Input('cohort-xaxis-select', 'value'),
+)
+def create_cohort_graph(focus, measure, yaxis_select, xaxis_select):
+    records = filter_records(load_cohort_records(COHORT_DATA_DIR), focus)
+    stats = aggregate_measure(records, measure, xaxis_select, yaxis_select == 'Normalized')
+
+    fig = go.Figure()
+    color = COLORS_MEASURES[0]
+
+    if stats['x'].size:
+        hover_text = [
+            f'Median: {median:.2f}<br>Mean: {mean:.2f}<br>IQR: {q25:.2f} - {q75:.2f}<br>Records: {count}'
+            for median, mean, q25, q75, count in zip(stats['median'], stats['mean'], stats['q25'], stats['q75'], stats['count'])
+        ]
+
+        # Interquartile band
+        fig.add_trace(go.Scatter(x=stats['x'], y=stats['q25'], mode='lines', line=dict(width=0), hoverinfo='skip'))
+        fig.add_trace(go.Scatter(
+            x=stats['x'],
+            y=stats['q75'],
+            mode='lines',
+            line=dict(width=0),
+            fill='tonexty',
+            fillcolor='rgba(31, 119, 180, 0.2)',
+            hoverinfo='skip'
+        ))
+
+        # Mean and median
+        fig.add_trace(go.Scatter(x=stats['x'], y=stats['mean'], mode='lines', line=dict(color=color, dash='dash'), hoverinfo='skip'))
+        fig.add_trace(go.Scatter(
+            name=measure,
+            x=stats['x'],
+            y=stats['median'],
+            mode='lines+markers',
+            line=dict(color=color),
+            marker=dict(size=8),
+            text=hover_text,
+            hovertemplate=f'{xaxis_select}: %{{x}}<br>%{{text}}'
+        ))
+
+    fig.update_layout(
+        plot_bgcolor='white',
+        showlegend=False,
+        margin=dict(l=80, r=0, t=40, b=0),
+        height=400,
+        title=dict(text=measure or 'No measures', x=0, xanchor='left'),
+    )
+    fig.update_xaxes(title=xaxis_select, showgrid=False, showline=False, zeroline=False)
+    fig.update_yaxes(
+        ticks='outside',
+        tickcolor='white',
+        showgrid=True,
+        gridcolor='lightgray',
+        gridwidth=1,
+        showline=False,
+        zeroline=False,
+    )
+
+    if yaxis_select == 'Normalized':
+        fig.update_yaxes(
+            range=[-0.1, 1.1],
+            tickmode='array',
+            tickvals=[0, 0.25, 0.5, 0.75, 1],
+            ticktext=['Min', '', '', '', 'Max'],
+        )
+
+    return fig, {'visibility': 'visible'}
+
+def load_cohort_records(directory):
+    '''Load all records of a directory, reusing parsed records of unchanged files'''
+    if not os.path.isdir(directory):
+        return []
+
+    records = []
+    for filename in sorted(os.listdir(directory)):
+        if not filename.endswith(tuple(RECORD_EXTENSIONS.values())) and not filename.endswith(COMPRESSED_EXTENSION):
+            continue
+
+        path = os.path.join(directory, filename)
+        record = _read_record(path, os.path.getmtime(path))
+        if record:
+            records.append(record)
+
+    return records
+
+@cached(record_cache, lock=threading.Lock())
+def _read_record(path, mtime):
+    '''Parse and sanitize a record and precompute its columns, cached by path and modification time'''
+    try:
+        with open(path, 'rb') as file:
+            data = sanitize_data_types(parse_record_bytes(file.read()))
+    except Exception as e:
+        print(f"Error loading cohort record {path}: {str(e)}")
+        return None
+
+    client = (data.get('client') or [{}])[0]
+    measures = data.get('measures', [])
+    columns = sessions_to_columns(data.get('sessions', []), measures, data.get('practices', []))
+
+    return {
+        'filename': os.path.basename(path),
+        'focus': str(client.get('Focus') or ''),
+        'measures': measure_index(measures),
+        'columns': columns,
+        'days': session_days(columns),
+    }
+
+def filter_records(records, focus):
+    '''Records with the search term in their focus'''
+    if not focus or not focus.strip():
+        return records
+
+    term = focus.strip().lower()
+    return [record for record in records if term in record['focus'].lower()]
+
+def aggregate_measure(records, measure, xaxis_select, normalized):
+    '''Median, mean and interquartile range of a measure across records.
+
+    Records are aligned by session number or by days since their first session, binned by
+    DAY_BIN_SIZE. Normalization uses the Min and Max of each record, or for Count measures
+    the maximum observed value in the record.'''
+    empty = np.array([])
+    stats = {'x': empty, 'median': empty, 'mean': empty, 'q25': empty, 'q75': empty, 'count': empty}
+    records = [record for record in records if measure in record['measures']]
+    if not records:
+        return stats
+
+    # Collect the values of all records with their record and position index
+    record_indices, positions, values = [], [], []
+    for record_index, record in enumerate(records):
+        columns = record['columns']
+        if normalized:
+            record_values = normalize_measures(columns['measures'], record['measures'], [measure])[measure]
+        else:
+            record_values = columns['measures'][measure]
+
+        if xaxis_select == 'Day':
+            record_positions = (record['days'] - 1) // DAY_BIN_SIZE
+        else:
+            record_positions = columns['session_number']
+
+        valid = ~np.isnan(record_values) & (record_positions >= 0)
+        record_indices.append(np.full(valid.sum(), record_index))
+        positions.append(record_positions[valid])
+        values.append(record_values[valid])
+
+    record_indices = np.concatenate(record_indices)
+    positions = np.concatenate(positions).astype(np.int64)
+    values = np.concatenate(values)
+    if not values.size:
+        return stats
+
+    # Matrix of records by occupied position, averaging values that fall into the same position.
+    # Positions are compacted, so a single late session does not widen the matrix.
+    occupied, columns = np.unique(positions, return_inverse=True)
+    shape = (len(records), len(occupied))
+    sums = np.zeros(shape)
+    counts = np.zeros(shape)
+    np.add.at(sums, (record_indices, columns), values)
+    np.add.at(counts, (record_indices, columns), 1)
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        matrix = sums / counts
+
+    with warnings.catch_warnings():
+        warnings.simplefilter('ignore', RuntimeWarning)
+        q25, median, q75 = np.nanpercentile(matrix, [25, 50, 75], axis=0)
+        mean = np.nanmean(matrix, axis=0)
+
+    stats['x'] = occupied * DAY_BIN_SIZE + 1 if xaxis_select == 'Day' else occupied
+    stats['median'] = median
+    stats['mean'] = mean
+    stats['q25'] = q25
+    stats['q75'] = q75
+    stats['count'] = (counts > 0).sum(axis=0)
+
+    return stats
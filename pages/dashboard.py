@@ -1,17 +1,40 @@
 import dash
-from dash import dcc, html, Input, Output, callback, State, ctx, ALL
+from dash import dcc, html, Input, Output, callback, clientside_callback, ClientsideFunction, State, ctx, ALL, Patch
 from dash.exceptions import PreventUpdate
 import dash_bootstrap_components as dbc
 import dash_mantine_components as dmc
 from dash_iconify import DashIconify
-import pandas as pd
+import numpy as np
+import hashlib
+import json
+import threading
+from cachetools import TTLCache, cached
 import plotly.graph_objects as go
 from plotly.subplots import make_subplots
-from globals import APP_TITLE, PAGE_HEADER_STYLE, HELP_TEXT_DASHBOARD
+from plotly.utils import PlotlyJSONEncoder
+from globals import APP_TITLE, PAGE_HEADER_STYLE, HELP_TEXT_DASHBOARD, DEFAULT_CLIENT_INFO, FIGURE_CACHE_MAXSIZE, FIGURE_CACHE_TTL, DOWNSAMPLE_THRESHOLD
 from globals import get_rater_selection, create_help_button, encode_text, decode_text
+from store import read_store, write_store
+from records import sessions_to_columns, session_days, measure_index, normalize_measures
 
 dash.register_page(__name__, name='Dashboard', order=5, title=APP_TITLE)
 
+# Server-side cache of built figures and their signatures, shared by all sessions of a worker and
+# limited by the approximate size of the figures in bytes
+def _cached_size(value):
+    '''Approximate size in bytes of a cached figure fragment'''
+    if isinstance(value, np.ndarray):
+        return value.nbytes
+    if isinstance(value, dict):
+        return sum(_cached_size(item) for item in value.values()) + 64
+    if isinstance(value, (list, tuple)):
+        return sum(_cached_size(item) for item in value) + 8 * len(value)
+    if isinstance(value, str):
+        return len(value) + 49
+    return 16
+
+figure_cache = TTLCache(maxsize=FIGURE_CACHE_MAXSIZE, ttl=FIGURE_CACHE_TTL, getsizeof=_cached_size)
+
 # Page layout
 
 layout = html.Div([
@@ -25,7 +48,8 @@ layout = html.Div([
 
         # Graph
         dbc.Col([
-            dcc.Graph(id='dashboard-graph', config={'staticPlot': True}, style={'visibility': 'hidden'})
+            dcc.Graph(id='dashboard-graph', config={'staticPlot': True}, style={'visibility': 'hidden'}),
+            dcc.Store(id='dashboard-figure-signature')
         ], width=9),
         
         # Sidebar with info and tools
@@ -75,6 +99,7 @@ layout = html.Div([
     Input('client-store', 'data'),
 )
 def display_client_info(client_info):
+    client_info = read_store(client_info, [DEFAULT_CLIENT_INFO])
     avatar = dmc.Avatar(DashIconify(icon='ion:person-sharp'), color='grey', radius='xl')
     client_info = client_info[0]
     client_id = client_info['ID'] if client_info['ID'] else 'Client'
@@ -95,7 +120,7 @@ def display_client_info(client_info):
     Input('measures-store', 'data'),
 )
 def create_measure_switches(measures_data):
-    measures_data = [measure for measure in measures_data if measure['Name'] != 'New Measure']
+    measures_data = [measure for measure in read_store(measures_data, []) if measure['Name'] != 'New Measure']
     
     if not measures_data:
         return html.Div('No measures defined')
@@ -119,7 +144,7 @@ def create_measure_switches(measures_data):
     Input('measures-store', 'data'),
 )
 def create_rater_switches(measures_data):
-    measures_data = [measure for measure in measures_data if measure['Name'] != 'New Measure']
+    measures_data = [measure for measure in read_store(measures_data, []) if measure['Name'] != 'New Measure']
     if not measures_data:
         return html.Div('')
     
@@ -148,8 +173,9 @@ def create_rater_switches(measures_data):
     State('measures-store', 'data'),
     prevent_initial_call=True
 )
-def handle_switch_changes(rater_states, measure_states, rater_ids, measure_ids, measures_data):
+def handle_switch_changes(rater_states, measure_states, rater_ids, measure_ids, measures_store):
     trigger = ctx.triggered_id
+    measures_data = read_store(measures_store)
     if not measures_data or trigger is None:
         raise PreventUpdate
     
@@ -188,23 +214,69 @@ def handle_switch_changes(rater_states, measure_states, rater_ids, measure_ids,
             measure_copy['SelectRater'] = False
             measures_data_updated.append(measure_copy)
     
-    return measures_data_updated if measures_data_updated else dash.no_update
+    return write_store(measures_data_updated, measures_store) if measures_data_updated else dash.no_update
 
 # Dashboard graph
+
+# Axis options, the figure carries the data of all options to switch them in the browser
+XAXIS_OPTIONS = ['Day', 'Session']
+YAXIS_OPTIONS = ['Raw', 'Normalized']
+
 @callback(
     Output('dashboard-graph', 'figure'),
     Output('dashboard-graph', 'style'),
+    Output('dashboard-figure-signature', 'data'),
     Input('sessions-store', 'data'),
     Input('measures-store', 'data'),
     Input('practices-store', 'data'),
+    State('yaxis-select', 'value'),
+    State('xaxis-select', 'value'),
+    State('dashboard-figure-signature', 'data')
+)
+def create_dashboard_graph(sessions_data, measures_data, practices_data, yaxis_select, xaxis_select, previous_signature=None):
+    sessions_data = read_store(sessions_data, [])
+    measures_data = read_store(measures_data, [])
+    practices_data = read_store(practices_data, [])
+    figure, signature = build_dashboard_figure(sessions_data, measures_data, practices_data)
+    figure, signature = _apply_axis_options(figure, signature, yaxis_select, xaxis_select)
+
+    # Only send the traces and layout keys that differ from the rendered figure
+    figure_update = _patch_figure(figure, signature, previous_signature)
+
+    return figure_update, {'visibility': 'visible'}, signature
+
+# Switch axes without a server round trip, see assets/dashClientsideFunctions.js
+clientside_callback(
+    ClientsideFunction(namespace='dashboard', function_name='switch_axes'),
+    Output('dashboard-graph', 'figure', allow_duplicate=True),
+    Output('dashboard-figure-signature', 'data', allow_duplicate=True),
     Input('yaxis-select', 'value'),
-    Input('xaxis-select', 'value')
+    Input('xaxis-select', 'value'),
+    State('dashboard-graph', 'figure'),
+    prevent_initial_call=True
 )
-def create_dashboard_graph(sessions_data, measures_data, practices_data, yaxis_select, xaxis_select):
+
+def _figure_cache_key(sessions_data, measures_data, practices_data):
+    '''Content hash of all inputs that determine the dashboard figure'''
+    # Key order is kept, as the order of practices in the sessions affects the figure
+    encoded = json.dumps([sessions_data, measures_data, practices_data], separators=(',', ':'))
+    return hashlib.sha256(encoded.encode('utf-8')).hexdigest()
+
+@cached(figure_cache, key=_figure_cache_key, lock=threading.Lock(), info=True)
+def build_dashboard_figure(sessions_data, measures_data, practices_data):
+    '''Build the complete dashboard figure as a plotly JSON dict, with the first axis options applied,
+    and its signature.
     
+    The figure carries the data of all axis options, so it is cached by content only, hit and miss
+    counts are available from build_dashboard_figure.cache_info(). The returned figure is shared
+    between callers and must not be modified, see _apply_axis_options.'''
+    xaxis_select = XAXIS_OPTIONS[0]
+    yaxis_select = YAXIS_OPTIONS[0]
+
     # Manage data
     practices_data = [practice for practice in practices_data if practice['Name'] != 'New Practice']
-    num_practices = len(practices_data)
+    practices = [practice['Name'] for practice in practices_data]
+    num_practices = len(practices)
 
     # Determine heigth of subplots and figure
     measures_height = 300
@@ -226,15 +298,17 @@ def create_dashboard_graph(sessions_data, measures_data, practices_data, yaxis_s
         row_heights=[measures_height_ratio, practice_height_ratio],
     )
 
-    # Convert sessions data to DataFrame and prepare x-axis
-    df = pd.DataFrame(sessions_data)
-    x_values = _prepare_x_axis(df, xaxis_select)
+    # Convert sessions data to columns and prepare x-axis values of all options
+    columns = sessions_to_columns(sessions_data, measures_data, practices_data)
+    x_variants = {option: _prepare_x_axis(columns, option) for option in XAXIS_OPTIONS}
 
     # Handle measures
+    measures_by_name = measure_index(measures_data)
     selected_measures = [measure['Name'] for measure in measures_data if measure.get('SelectMeasure', False)]
     if not selected_measures:
         fig.add_trace(
             go.Scattergl(
+                uid='measures-placeholder',
                 x=[1,1],
                 y=[0,100],
                 marker=dict(color='rgba(0, 0, 0, 0)'),
@@ -243,50 +317,40 @@ def create_dashboard_graph(sessions_data, measures_data, practices_data, yaxis_s
             col=1,
             )
 
-    # Normalize data if required
-    if yaxis_select == 'Normalized':
-        df = _normalize_measures(df, measures_data, selected_measures)
+    # Raw and normalized values of the measures
+    y_variants = {
+        'Raw': columns['measures'],
+        'Normalized': normalize_measures(columns['measures'], measures_by_name, selected_measures),
+    }
 
     # Add measure traces
-    _add_measure_traces(fig, df, measures_data, selected_measures, x_values, xaxis_select)
+    _add_measure_traces(fig, y_variants, measures_by_name, selected_measures, x_variants, xaxis_select, yaxis_select)
 
     # Handle practices
-    _add_practice_traces(fig, df, practices_data, x_values, xaxis_select)
+    _add_practice_traces(fig, columns['practices'], practices, x_variants, xaxis_select)
 
     # Update layout and axes
-    _update_figure_layout(fig, yaxis_select, xaxis_select, df, x_values, total_height)
-    
-    return fig, {'visibility': 'visible'}
+    _update_figure_layout(fig, yaxis_select, xaxis_select, practices, x_variants, total_height)
+
+    figure = fig.to_plotly_json()
+    return figure, _figure_signature(figure)
 
-def _prepare_x_axis(df, xaxis_select):
+def _prepare_x_axis(columns, xaxis_select):
     '''Prepare x-axis values based on selection'''
     if xaxis_select == 'Day':
-        df['Date'] = pd.to_datetime(df['session_date'])
-        first_session_date = df['Date'].min()
-        df['Days'] = (df['Date'] - first_session_date).dt.days + 1
+        return session_days(columns)
 
-        return df['Days']
+    return columns['session_number']
 
-    return df['session_number']
-
-def _normalize_measures(df, measures_data, selected_measures):
-    '''Normalize selected measures'''
-    df_normalized = df.copy()
-    for measure in selected_measures:
-        measure_data = next(m for m in measures_data if m['Name'] == measure)
-        min_value = measure_data['Min']
-        max_value = measure_data['Max'] if measure_data['Type'] == 'Scale' else df[measure].max()
-        df_normalized[measure] = (df[measure] - min_value) / (max_value - min_value)
-    return df_normalized
-
-def _add_measure_traces(fig, df, measures_data, selected_measures, x_values, xaxis_select):
+def _add_measure_traces(fig, y_variants, measures_by_name, selected_measures, x_variants, xaxis_select, yaxis_select):
     '''Add measurement traces to the figure'''
     for measure in selected_measures:
-        if measure in df.columns:
-            measure_data = next(m for m in measures_data if m['Name'] == measure)
-            if df[measure].isna().all():
+        if measure in y_variants['Raw']:
+            measure_data = measures_by_name[measure]
+            if np.isnan(y_variants['Raw'][measure]).all():
                 fig.add_trace(
                     go.Scattergl(
+                        uid=f'measure-empty:{measure}',
                         x=[1,1],
                         y=[measure_data['Min'],measure_data['Max']],
                         marker=dict(color='rgba(0, 0, 0, 0)'),
@@ -295,58 +359,129 @@ def _add_measure_traces(fig, df, measures_data, selected_measures, x_values, xax
                     col=1,
                 )
             else:
+                # Normalization keeps the order of values, so both variants share the downsampled points
+                indices = _downsample_measure(y_variants['Raw'][measure])
+                meta = {
+                    'x': {option: x_variants[option][indices] for option in XAXIS_OPTIONS},
+                    'y': {option: y_variants[option][measure][indices] for option in YAXIS_OPTIONS},
+                }
                 fig.add_trace(
                     go.Scattergl(
+                        uid=f'measure:{measure}',
                         name=measure,
-                        x=x_values,
-                        y=df[measure],
+                        x=meta['x'][xaxis_select],
+                        y=meta['y'][yaxis_select],
                         line=dict(color=measure_data['Color']),
                         marker=dict(size=10),
                         mode='lines+markers',
                         connectgaps=True,
-                        customdata=[xaxis_select] * len(x_values),
-                        hovertemplate='%{customdata}: %{x}<br>Value: %{y:.2f}'
+                        meta=meta,
                     ),
                     row=1,
                     col=1,
                 )                        
 
-def _add_practice_traces(fig, df, practices_data, x_values, xaxis_select):
-    '''Add practice traces to the figure'''
-    if not practices_data:
+def _add_practice_traces(fig, practice_values, practices, x_variants, xaxis_select):
+    '''Add all practices to the figure as a single trace'''
+    if not practices:
+        num_sessions = len(x_variants[xaxis_select])
+        indices = [0, num_sessions - 1] if num_sessions > DOWNSAMPLE_THRESHOLD else slice(None)
+        meta = {'x': {option: x_variants[option][indices] for option in XAXIS_OPTIONS}}
         fig.add_trace(
             go.Scattergl(
-                x=x_values,
-                y=[None] * len(x_values),
+                uid='practices-placeholder',
+                x=meta['x'][xaxis_select],
+                y=[None] * len(meta['x'][xaxis_select]),
                 line=dict(color='lightgrey'),
                 marker=dict(size=10),
                 mode='lines+markers',
                 showlegend=False,
+                meta=meta,
             ),
             row=2,
             col=1,
         )
+        return
+
+    rows, cols, run_ends = _practice_points(practice_values, practices)
+
+    # Each run of sessions with a practice is followed by a gap, which separates the line segments
+    positions = np.arange(len(rows)) + np.cumsum(run_ends) - run_ends
+    num_points = len(rows) + int(run_ends.sum())
+
+    # The first practice is plotted at the top
+    y_values = np.full(num_points, np.nan)
+    y_values[positions] = len(practices) - 1 - rows
+
+    meta = {'x': {}}
+    for option in XAXIS_OPTIONS:
+        meta['x'][option] = np.full(num_points, np.nan)
+        meta['x'][option][positions] = x_variants[option][cols]
+
+    fig.add_trace(
+        go.Scattergl(
+            uid='practices',
+            name='Practices',
+            x=meta['x'][xaxis_select],
+            y=y_values,
+            line=dict(color='lightgrey'),
+            marker=dict(size=10),
+            mode='lines+markers',
+            connectgaps=False,
+            meta=meta,
+        ),
+        row=2,
+        col=1,
+    )
 
-    for i_practice, practice in enumerate(practices_data[::-1]):
-        if practice['Name'] in df.columns:
-            y_values = [i_practice if val else None for val in df[practice['Name']]]
-            fig.add_trace(
-                go.Scattergl(
-                    name=practice['Name'],
-                    x=x_values,
-                    y=y_values,
-                    line=dict(color='lightgrey'),
-                    marker=dict(size=10),
-                    mode='lines+markers',
-                    connectgaps=False,
-                    customdata=[xaxis_select] * len(x_values),
-                    hovertemplate='%{customdata}: %{x}'
-                ),
-                row=2,
-                col=1,
-            )
+def _practice_points(practice_values, practices, threshold=DOWNSAMPLE_THRESHOLD):
+    '''Practice and session indices of all implemented practices, and whether a point ends a run.
+
+    Above the threshold, only the first and last session of each run are kept, which draws the
+    same line segments.'''
+    implemented = np.vstack([practice_values[practice] for practice in practices])
+
+    # Runs of consecutive sessions with the same practice
+    previous = np.zeros_like(implemented)
+    previous[:, 1:] = implemented[:, :-1]
+    following = np.zeros_like(implemented)
+    following[:, :-1] = implemented[:, 1:]
+    run_starts = implemented & ~previous
+    run_ends = implemented & ~following
 
-def _update_figure_layout(fig, yaxis_select, xaxis_select, df, x_values, total_height):
+    if implemented.shape[1] > threshold:
+        implemented = run_starts | run_ends
+
+    rows, cols = np.nonzero(implemented)
+
+    return rows, cols, run_ends[rows, cols]
+
+def _downsample_measure(values, threshold=DOWNSAMPLE_THRESHOLD):
+    '''Indices of the points to plot for a measure.
+
+    Above the threshold, the sessions with values are split into buckets and the first, last,
+    minimum and maximum point of each bucket are kept. The points are real sessions, so the
+    extremes are preserved.'''
+    if len(values) <= threshold:
+        return np.arange(len(values))
+
+    # Missing values are skipped anyway as gaps are connected
+    valid = np.flatnonzero(~np.isnan(values))
+    if len(valid) <= threshold:
+        return valid
+
+    num_buckets = max(1, threshold // 4)
+    buckets = np.arange(len(valid)) * num_buckets // len(valid)
+    starts = np.flatnonzero(np.diff(buckets, prepend=-1))
+    ends = np.append(starts[1:] - 1, len(valid) - 1)
+
+    # Sort by value within each bucket, the first entry is the minimum and the last the maximum
+    order = np.lexsort((values[valid], buckets))
+    keep = np.unique(np.concatenate([starts, ends, order[starts], order[ends]]))
+
+    return valid[keep]
+
+def _update_figure_layout(fig, yaxis_select, xaxis_select, practices, x_variants, total_height):
     '''Update the figure's layout and axes'''
     fig.update_layout(
         plot_bgcolor='white',
@@ -356,13 +491,19 @@ def _update_figure_layout(fig, yaxis_select, xaxis_select, df, x_values, total_h
     )
 
     # Update measures subplot
-    _update_measures_axis(fig, yaxis_select == 'Normalized')
+    _update_measures_axis(fig)
 
     # Update practices subplot
-    _update_practices_axis(fig, df)
+    _update_practices_axis(fig, practices)
 
     # Update x-axis
-    _update_x_axis(fig, xaxis_select, x_values)
+    _update_x_axis(fig)
+
+    # Apply the selected axis options and keep all options for switching in the browser
+    axis_options = {'x': _x_axis_options(x_variants), 'y': _y_axis_options()}
+    fig.update_layout(axis_options['x'][xaxis_select])
+    fig.update_layout(axis_options['y'][yaxis_select])
+    fig.update_layout(meta=axis_options)
 
     # Adjust annotation positions
     for annotation in fig['layout']['annotations']:
@@ -371,7 +512,7 @@ def _update_figure_layout(fig, yaxis_select, xaxis_select, df, x_values, total_h
         if annotation['text'] == 'Measures':
             annotation['y'] = annotation['y'] + annotation['y'] * 0.04
 
-def _update_measures_axis(fig, normalized):
+def _update_measures_axis(fig):
     '''Update the measures (top) subplot y-axis'''
     fig.update_yaxes(
         row=1,
@@ -383,31 +524,35 @@ def _update_measures_axis(fig, normalized):
         gridwidth=1,
         showline=False,
         zeroline=False,
-        range=[-0.1, 1.1] if normalized else None,
     )
 
-    if normalized:
-        fig.update_yaxes(
-            row=1,
-            col=1,
-            tickmode='array',
-            tickvals=[0, 0.25, 0.5, 0.75, 1],
-            ticktext=['Min', '', '', '', 'Max'],
-        )
+def _y_axis_options():
+    '''Layout of the measures y-axis for each y-axis option'''
+    return {
+        'Raw': {
+            'yaxis': {'range': None, 'autorange': True, 'tickmode': 'auto', 'tickvals': None, 'ticktext': None},
+        },
+        'Normalized': {
+            'yaxis': {
+                'range': [-0.1, 1.1],
+                'autorange': False,
+                'tickmode': 'array',
+                'tickvals': [0, 0.25, 0.5, 0.75, 1],
+                'ticktext': ['Min', '', '', '', 'Max'],
+            },
+        },
+    }
 
-def _update_practices_axis(fig, df):
+def _update_practices_axis(fig, practices):
     '''Update the practices (bottom) subplot y-axis'''
-    practice_cols = [col for col in df.columns if col not in ['session_date', 'session_number', 'Date']]
-    practice_cols = [col for col in practice_cols if df[col].dtype == bool]
-    
-    if not practice_cols:
+    if not practices:
         ytick_vals = [0]
         ytick_texts = ['No practices defined']
         y_range = [-0.5, 0.5]
     else:
-        ytick_vals = list(range(len(practice_cols)))
-        ytick_texts = practice_cols[::-1]
-        y_range = [-0.5, len(practice_cols) - 0.5]
+        ytick_vals = list(range(len(practices)))
+        ytick_texts = practices[::-1]
+        y_range = [-0.5, len(practices) - 0.5]
 
     fig.update_yaxes(
         row=2,
@@ -421,24 +566,158 @@ def _update_practices_axis(fig, df):
         range=y_range,
     )
 
-def _update_x_axis(fig, xaxis_select, x_values):
-    '''Update the x-axis based on selection'''
+def _update_x_axis(fig):
+    '''Update the x-axis settings shared by all x-axis options'''
     # Update both subplots' x-axes to ensure consistency
     for axis in ['xaxis', 'xaxis2']:
-        title = xaxis_select if axis == 'xaxis2' else None
         fig.update_layout({
             axis: {
-                'title': title,
+                'title': None,
                 'showgrid': False,
                 'showline': False,
                 'zeroline': False,
                 'type': 'linear',
-                'tickmode': 'array',
                 'dtick': None,
                 'tickformat': None,
                 'calendar': None,
                 'hoverformat': None,
-                'type': 'linear',
-                'tickvals':x_values
             }
-        })
\ No newline at end of file
+        })
+
+def _x_axis_options(x_variants):
+    '''Layout of both x-axes for each x-axis option'''
+    options = {}
+    for option, x_values in x_variants.items():
+
+        # Let plotly choose the ticks for long histories instead of one tick per session
+        if len(x_values) <= DOWNSAMPLE_THRESHOLD:
+            ticks = {'tickmode': 'array', 'tickvals': x_values}
+        else:
+            ticks = {'tickmode': 'auto', 'tickvals': None}
+
+        options[option] = {
+            'xaxis': ticks,
+            'xaxis2': {'title': {'text': option}, **ticks},
+        }
+
+    return options
+
+# Axis options
+
+def _apply_axis_options(figure, signature, yaxis_select, xaxis_select):
+    '''Return the figure and signature with the selected axis options applied, as switch_axes does in
+    the browser. The cached figure and signature are not modified.'''
+    if xaxis_select == XAXIS_OPTIONS[0] and yaxis_select == YAXIS_OPTIONS[0]:
+        return figure, signature
+
+    data, traces = [], []
+    for trace, trace_signature in zip(figure['data'], signature['data']):
+        meta = trace.get('meta') or {}
+        trace, arrays = dict(trace), dict(trace_signature['arrays'])
+        for axis, select in [('x', xaxis_select), ('y', yaxis_select)]:
+            if axis in meta:
+                trace[axis] = meta[axis][select]
+                arrays[axis] = arrays[f'meta.{axis}.{select}']
+        data.append(trace)
+        traces.append({**trace_signature, 'arrays': arrays})
+
+    layout, layout_signature = dict(figure['layout']), dict(signature['layout'])
+    for options in [layout['meta']['x'][xaxis_select], layout['meta']['y'][yaxis_select]]:
+        for axis, axis_options in options.items():
+            # Options set to None are removed, as in plotly's update_layout
+            merged = {**layout.get(axis, {}), **axis_options}
+            layout[axis] = {key: value for key, value in merged.items() if value is not None}
+            layout_signature[axis] = _fragment_signature(layout[axis])
+
+    return {**figure, 'data': data, 'layout': layout}, {'data': traces, 'layout': layout_signature}
+
+# Partial figure updates
+#
+# A signature summarizes a figure as one digest of the properties per trace and layout key, and a
+# digest of every array in them. Numeric arrays are hashed from their buffers. Changes made while the
+# dashboard is shown, such as switching measures, only send the traces and layout keys that changed.
+# The signature is kept in the page, so a newly opened dashboard and an axis switch in the browser,
+# which drops the signature, get the full figure.
+
+def _hash_value(value):
+    '''Stable digest of a JSON-serializable figure fragment without arrays'''
+    encoded = json.dumps(value, cls=PlotlyJSONEncoder, sort_keys=True)
+    return hashlib.blake2b(encoded.encode('utf-8'), digest_size=16).hexdigest()
+
+def _hash_array(values):
+    '''Digest of an array, from the buffer of numeric arrays'''
+    array = np.asarray(values)
+    if array.dtype.kind in 'biuf':
+        data = array.dtype.str.encode('ascii') + np.ascontiguousarray(array).tobytes()
+    else:
+        data = json.dumps(array.tolist(), cls=PlotlyJSONEncoder).encode('utf-8')
+    return hashlib.blake2b(data, digest_size=16).hexdigest()
+
+def _is_array(value):
+    if isinstance(value, np.ndarray):
+        return value.ndim == 1
+    return isinstance(value, (list, tuple)) and not any(isinstance(item, (dict, list, tuple)) for item in value)
+
+def _split_arrays(value, path=()):
+    '''Return a fragment with its arrays replaced by None, and the arrays by dotted path'''
+    if isinstance(value, dict):
+        skeleton, arrays = {}, {}
+        for key, item in value.items():
+            skeleton[key], item_arrays = _split_arrays(item, path + (key,))
+            arrays.update(item_arrays)
+        return skeleton, arrays
+    if _is_array(value):
+        return None, {'.'.join(path): value}
+    return value, {}
+
+def _fragment_signature(value):
+    skeleton, arrays = _split_arrays(value)
+    return {
+        'props': _hash_value(skeleton),
+        'arrays': {path: _hash_array(values) for path, values in arrays.items()},
+    }
+
+def _figure_signature(figure):
+    '''Summarize a figure as per-trace and per-layout-key signatures'''
+    traces = [{'uid': trace.get('uid'), **_fragment_signature(trace)} for trace in figure['data']]
+    layout = {key: _fragment_signature(value) for key, value in figure['layout'].items()}
+    return {'data': traces, 'layout': layout}
+
+def _patch_figure(figure, signature, previous_signature):
+    '''Return a Patch with the changes from the previously rendered figure, or the full figure'''
+    if not previous_signature:
+        return figure
+
+    previous_uids = [trace['uid'] for trace in previous_signature['data']]
+    uids = [trace['uid'] for trace in signature['data']]
+    kept_uids = [uid for uid in previous_uids if uid in uids]
+
+    # Fall back to a full figure if traces were reordered or are not uniquely identified
+    if None in uids or len(set(uids)) != len(uids) or kept_uids != [uid for uid in uids if uid in kept_uids]:
+        return figure
+
+    patched = Patch()
+
+    # Remove traces that are no longer part of the figure
+    for index in reversed(range(len(previous_uids))):
+        if previous_uids[index] not in uids:
+            del patched['data'][index]
+
+    # Insert new traces and update changed ones in place
+    previous_traces = {trace['uid']: trace for trace in previous_signature['data']}
+    for index, (trace, trace_signature) in enumerate(zip(figure['data'], signature['data'])):
+        previous_trace = previous_traces.get(trace_signature['uid'])
+        if previous_trace is None:
+            patched['data'].insert(index, trace)
+        elif previous_trace != trace_signature:
+            patched['data'][index] = trace
+
+    # Update changed layout keys
+    for key, value in figure['layout'].items():
+        if previous_signature['layout'].get(key) != signature['layout'][key]:
+            patched['layout'][key] = value
+    for key in previous_signature['layout']:
+        if key not in signature['layout']:
+            del patched['layout'][key]
+
+    return patched
@@ -1,14 +1,34 @@
 import dash
-from dash import html, dcc, callback, Input, Output, State
+from dash import html, dcc, callback, clientside_callback, ClientsideFunction, Input, Output, State, ALL
 import dash_bootstrap_components as dbc
 from dash.exceptions import PreventUpdate
 import json
-import base64
+import math
+import os
+import threading
 from datetime import date
-from globals import APP_TITLE, PAGE_HEADER_STYLE, INSTRUCTIONS, DEFAULT_CLIENT_INFO, DEFAULT_ROW_MEASURE, DEFAULT_ROW_PRACTICE, DEFAULT_ROW_SESSION, EXAMPLE_FILE_PATH, HELP_TEXT_HOME, create_help_button
+from operator import itemgetter, is_
+import numpy as np
+from cachetools import LRUCache, cached
+from globals import APP_TITLE, PAGE_HEADER_STYLE, INSTRUCTIONS, DEFAULT_CLIENT_INFO, DEFAULT_ROW_MEASURE, DEFAULT_ROW_PRACTICE, DEFAULT_ROW_SESSION, EXAMPLE_DATA_DIR, EXAMPLE_RECORDS, RECORD_FORMATS, RECORD_EXTENSIONS, COMPRESSED_EXTENSION, RECORD_LIBRARY, LIBRARY_PAGE_SIZE, PROGRESS_POLL_INTERVAL, HELP_TEXT_HOME, create_help_button
+from store import read_store, write_store
+from records import measure_names, practice_names
+from record_io import BINARY_MAGIC, upload_chunks, peek_chunks, decode_text, read_record, read_binary_record, write_record, parse_record_bytes
+from library import save_library_record, list_library_records, count_library_records, read_library_record, record_summary, new_library_id, is_library_id
+from batch_import import ARCHIVE_EXTENSION, import_records
+from progress import report_progress, read_progress, clear_progress
 
 dash.register_page(__name__, path='/', name='Home', order=0, title=APP_TITLE)
 
+# Example records by name with the modification time of their file, preloaded at the end of the module
+example_cache = {}
+
+# Compiled session sanitizers by measure and practice names
+session_sanitizer_cache = LRUCache(maxsize=64)
+
+# List item colors of the batch import results
+IMPORT_STATUS_COLORS = {'imported': 'success', 'warning': 'warning', 'failed': 'danger'}
+
 # Page layout
 
 layout = html.Div([
@@ -27,15 +47,43 @@ layout = html.Div([
                 id='load-record-btn',
                 children=dbc.Button('Load Record', className='mt-2 me-2'),
                 multiple=False,
-                accept='.json'
+                accept=','.join([*RECORD_EXTENSIONS.values(), COMPRESSED_EXTENSION])
             ),
             dbc.Button('Save Record', id='save-record-btn', color='success', className='mt-2 me-2'),
+            dcc.Upload(
+                id='import-records-btn',
+                children=dbc.Button('Import Records', color='secondary', className='mt-2 me-2'),
+                multiple=True,
+                accept=','.join([*RECORD_EXTENSIONS.values(), COMPRESSED_EXTENSION, ARCHIVE_EXTENSION])
+            ),
+            dbc.Button(
+                'Load from Library',
+                id='library-btn',
+                className='mt-2 me-2',
+                style=None if RECORD_LIBRARY else {'display': 'none'}
+            ),
             dcc.Download(id='download-json'),
-            dbc.Button('Show example', id='show-example-btn', color='secondary', className='mt-2 me-2'),            
+            dbc.DropdownMenu(
+                [dbc.DropdownMenuItem(name, id={'type': 'show-example-item', 'name': name}) for name in EXAMPLE_RECORDS],
+                label='Show example',
+                color='secondary',
+                className='mt-2 me-2'
+            ),
         ], 
         style={'display': 'flex', 'flex-wrap': 'wrap'}
     ),
 
+    # Progress of loading or importing records, the tasks are started in the browser
+    dcc.Store(id='load-record-task'),
+    dcc.Store(id='import-records-task'),
+    dcc.Interval(id='record-progress-interval', interval=PROGRESS_POLL_INTERVAL * 1000, disabled=True),
+    html.Div(
+        dbc.Progress(id='record-progress', value=0, className='mt-2'),
+        id='record-progress-container',
+        hidden=True,
+        style={'maxWidth': '30rem'}
+    ),
+
     # Modal confirm new record
     dbc.Modal([
         dbc.ModalHeader(dbc.ModalTitle('New Record')),
@@ -49,14 +97,38 @@ layout = html.Div([
     # Modal save record filename
     dbc.Modal([
         dbc.ModalHeader('Enter Filename'),
-        dbc.ModalBody(
-            dbc.Input(id='filename-input', placeholder='Enter filename', type='text')
-        ),
+        dbc.ModalBody([
+            dbc.Input(id='filename-input', placeholder='Enter filename', type='text'),
+            dbc.RadioItems(
+                id='save-format-radio',
+                options=[{'label': label, 'value': value} for value, label in RECORD_FORMATS.items()],
+                value='json',
+                inline=True,
+                className='mt-2'
+            ),
+            dbc.Checkbox(id='save-compress-check', label='Compress (gzip)', value=False, className='mt-2'),
+        ]),
         dbc.ModalFooter(
             dbc.Button('Save', id='confirm-save-btn', color='primary')
         ),
     ], id='filename-modal', is_open=False),
 
+    # Modal record library
+    dbc.Modal([
+        dbc.ModalHeader(dbc.ModalTitle('Record Library')),
+        dbc.ModalBody([
+            dbc.Input(id='library-search-input', placeholder='Search client ID or focus', type='search', debounce=True),
+            dbc.ListGroup(id='library-record-list', className='mt-2'),
+            dbc.Pagination(id='library-pagination', max_value=1, active_page=1, fully_expanded=False, className='mt-2 mb-0'),
+        ]),
+    ], id='library-modal', is_open=False, scrollable=True),
+
+    # Modal batch import report
+    dbc.Modal([
+        dbc.ModalHeader(dbc.ModalTitle('Import Records')),
+        dbc.ModalBody(dbc.ListGroup(id='import-report-list')),
+    ], id='import-report-modal', is_open=False, scrollable=True),
+
     # Alert
     dbc.Alert(id='data-alert', is_open=False, duration=4000, color='success', className='mt-2', style={'width': 'fit-content'}),
     create_help_button(HELP_TEXT_HOME)
@@ -84,37 +156,52 @@ def toggle_modal(save_clicks, confirm_clicks, is_open):
     Output('data-alert', 'color', allow_duplicate=True),
     Input('confirm-save-btn', 'n_clicks'),
     State('filename-input', 'value'),
+    State('save-format-radio', 'value'),
+    State('save-compress-check', 'value'),
     State('client-store', 'data'),
     State('measures-store', 'data'),
     State('sessions-store', 'data'),
     State('practices-store', 'data'),
     prevent_initial_call=True
 )
-def save_data(n_clicks, filename, client_data, measures_data, sessions_data, practices_data):
+def save_data(n_clicks, filename, record_format, compress, client_data, measures_data, sessions_data, practices_data):
     if n_clicks is None or not filename:
         return dash.no_update, 'Record not saved. Please enter a filename.', True, 'warning'
     
-    # Default the filename if not provided
-    if not filename.endswith('.json'):
-        filename += '.json'
+    filename = record_filename(filename, record_format, compress)
 
     combined_data = {
-        'client': client_data,
-        'measures': measures_data,
-        'sessions': sessions_data,
-        'practices': practices_data
+        'client': read_store(client_data),
+        'measures': read_store(measures_data),
+        'sessions': read_store(sessions_data),
+        'practices': read_store(practices_data)
     }
     
     # Sanitize data before saving
     sanitized_data = sanitize_data_types(combined_data)
     
-    data_download = dict(
-        content=json.dumps(sanitized_data, indent=2),
-        filename=filename
-    )
+    if record_format == 'binary' or compress:
+        data_download = dcc.send_bytes(write_record(sanitized_data, record_format, compress), filename)
+    else:
+        data_download = dict(
+            content=json.dumps(sanitized_data, indent=2),
+            filename=filename
+        )
     
     return data_download, 'Record saved.', True, 'success'
 
+def record_filename(filename, record_format, compress):
+    '''Complete the extensions of a filename to match the saved record'''
+    # A compressed extension is only kept for compressed records
+    extension = RECORD_EXTENSIONS[record_format]
+    if filename.endswith(COMPRESSED_EXTENSION):
+        filename = filename[:-len(COMPRESSED_EXTENSION)]
+    if not filename.endswith(extension):
+        filename += extension
+    if compress:
+        filename += COMPRESSED_EXTENSION
+    return filename
+
 # Show example
 @callback(
     Output('client-store', 'data', allow_duplicate=True),
@@ -124,27 +211,60 @@ def save_data(n_clicks, filename, client_data, measures_data, sessions_data, pra
     Output('data-alert', 'children', allow_duplicate=True),
     Output('data-alert', 'is_open', allow_duplicate=True),
     Output('data-alert', 'color', allow_duplicate=True),
-    Input('show-example-btn', 'n_clicks'),
+    Output('library-record-store', 'data', allow_duplicate=True),
+    Input({'type': 'show-example-item', 'name': ALL}, 'n_clicks'),
     prevent_initial_call=True
 )
 def show_example(show_example_clicks):
 
-    if not show_example_clicks:
+    if not any(show_example_clicks):
         raise PreventUpdate
-    with open(EXAMPLE_FILE_PATH, 'r') as file:
-        data = json.load(file)
+    name = dash.ctx.triggered_id['name']
+    data = get_example_record(name)
+    if data is None:
+        return *[dash.no_update] * 4, f'{name} not found.', True, 'danger', dash.no_update
     
-    # Extract data from the JSON structure
-    client_data = data.get('client', [])
-    measures_data = data.get('measures', [])
-    sessions_data = data.get('sessions', [])
-    practices_data = data.get('practices', [])
+    # Use defaults if sections are missing, as for loaded records
+    client_data = data.get('client', [DEFAULT_CLIENT_INFO])
+    measures_data = data.get('measures', [DEFAULT_ROW_MEASURE])
+    sessions_data = data.get('sessions', [DEFAULT_ROW_SESSION])
+    practices_data = data.get('practices', [DEFAULT_ROW_PRACTICE])
 
-    alert_message = 'Example loaded.'
+    alert_message = f'{name} loaded.'
     show_alert = True
     alert_color = 'success'
     
-    return client_data, measures_data, sessions_data, practices_data, alert_message, show_alert, alert_color
+    return write_store(client_data), write_store(measures_data), write_store(sessions_data), write_store(practices_data), \
+           alert_message, show_alert, alert_color, new_library_id()
+
+# Start a load or import task when files are uploaded, see assets/dashClientsideFunctions.js
+for upload_id, task_id in [('load-record-btn', 'load-record-task'), ('import-records-btn', 'import-records-task')]:
+    clientside_callback(
+        ClientsideFunction(namespace='progress', function_name='start_task'),
+        Output(task_id, 'data'),
+        Output('record-progress-interval', 'disabled', allow_duplicate=True),
+        Output('record-progress-container', 'hidden', allow_duplicate=True),
+        Output('record-progress', 'value', allow_duplicate=True),
+        Output('record-progress', 'label', allow_duplicate=True),
+        Input(upload_id, 'contents'),
+        prevent_initial_call=True
+    )
+
+# Show the progress of the running task
+@callback(
+    Output('record-progress', 'value'),
+    Output('record-progress', 'label'),
+    Input('record-progress-interval', 'n_intervals'),
+    State('load-record-task', 'data'),
+    State('import-records-task', 'data'),
+    prevent_initial_call=True
+)
+def show_progress(n_intervals, load_task, import_task):
+    for task in [load_task, import_task]:
+        progress = read_progress(task['id']) if task else None
+        if progress:
+            return progress['value'], progress['label']
+    raise PreventUpdate
 
 # Load data
 @callback(
@@ -155,43 +275,47 @@ def show_example(show_example_clicks):
     Output('data-alert', 'children', allow_duplicate=True),
     Output('data-alert', 'is_open', allow_duplicate=True),
     Output('data-alert', 'color', allow_duplicate=True),
-    Input('load-record-btn', 'contents'),
+    Output('record-progress-interval', 'disabled', allow_duplicate=True),
+    Output('record-progress-container', 'hidden', allow_duplicate=True),
+    Output('library-record-store', 'data', allow_duplicate=True),
+    Input('load-record-task', 'data'),
+    State('load-record-btn', 'contents'),
     prevent_initial_call=True
 )
-def load_data(contents):
-    if contents is None:
+def load_data(task, contents):
+    if contents is None or not task:
         raise PreventUpdate
     
     try:
-        # Parse file contents
-        content_type, content_string = contents.split(',')
-        decoded = base64.b64decode(content_string)
-        data = json.loads(decoded.decode('utf-8'))
-        
-        # Sanitize and validate data
-        sanitized_data = sanitize_data_types(data)
+        # Parse and sanitize the file contents section by section
+        report = {}
+        sanitized_data = load_record(contents, progress=load_progress(task['id']), report=report)
+        sanitize_message = format_sanitize_report(report)
         
         # Use defaults if sections are missing
         return (
-            sanitized_data.get('client', [DEFAULT_CLIENT_INFO]),
-            sanitized_data.get('measures', [DEFAULT_ROW_MEASURE]),
-            sanitized_data.get('sessions', [DEFAULT_ROW_SESSION]),
-            sanitized_data.get('practices', [DEFAULT_ROW_PRACTICE]),
-            'Record uploaded.', True, 'success'
+            write_store(sanitized_data.get('client', [DEFAULT_CLIENT_INFO])),
+            write_store(sanitized_data.get('measures', [DEFAULT_ROW_MEASURE])),
+            write_store(sanitized_data.get('sessions', [DEFAULT_ROW_SESSION])),
+            write_store(sanitized_data.get('practices', [DEFAULT_ROW_PRACTICE])),
+            f'Record uploaded. {sanitize_message}'.strip(), True, 'warning' if report.get('dropped') else 'success',
+            True, True, new_library_id()
         )
     
     except json.JSONDecodeError:
         print("Invalid JSON format")
         return (
             dash.no_update, dash.no_update, dash.no_update, dash.no_update,
-            'Record not uploaded. Invalid JSON format.', True, 'danger'
+            'Record not uploaded. Invalid JSON format.', True, 'danger', True, True, dash.no_update
         )
     except Exception as e:
         print(f"Error loading data: {str(e)}")
         return (
             dash.no_update, dash.no_update, dash.no_update, dash.no_update,
-            'Record not uploaded. Invalid file format.', True, 'danger'
+            'Record not uploaded. Invalid file format.', True, 'danger', True, True, dash.no_update
         )
+    finally:
+        clear_progress(task['id'])
     
 # Start new record
 @callback(
@@ -203,6 +327,7 @@ def load_data(contents):
     Output('measures-store', 'data', allow_duplicate=True),
     Output('sessions-store', 'data', allow_duplicate=True),
     Output('practices-store', 'data', allow_duplicate=True),
+    Output('library-record-store', 'data', allow_duplicate=True),
     Input('new-record-btn', 'n_clicks'),
     Input('cancel-new-record-btn', 'n_clicks'),
     Input('confirm-new-record-btn', 'n_clicks'),
@@ -217,27 +342,310 @@ def start_new_record(new_clicks, cancel_clicks, confirm_clicks,
     trigger = dash.callback_context.triggered[0]['prop_id'].split('.')[0]
     
     current_data_is_default = (
-        client_data == [DEFAULT_CLIENT_INFO] and 
-        measures_data == [DEFAULT_ROW_MEASURE] and 
-        sessions_data == [DEFAULT_ROW_SESSION] and 
-        practices_data == [DEFAULT_ROW_PRACTICE]
+        read_store(client_data) == [DEFAULT_CLIENT_INFO] and 
+        read_store(measures_data) == [DEFAULT_ROW_MEASURE] and 
+        read_store(sessions_data) == [DEFAULT_ROW_SESSION] and 
+        read_store(practices_data) == [DEFAULT_ROW_PRACTICE]
     )
     
     if trigger == 'new-record-btn' and current_data_is_default and new_clicks:
-        return False, 'New record initialized.', True, 'success', *[dash.no_update] * 4
+        return False, 'New record initialized.', True, 'success', *[dash.no_update] * 4, new_library_id()
     
     if trigger == 'new-record-btn' and new_clicks:
-        return True, *[dash.no_update] * 7  # Show modal
+        return True, *[dash.no_update] * 8  # Show modal
         
     if trigger == 'confirm-new-record-btn':
-        return False, 'New record initialized.', True, 'success', [DEFAULT_CLIENT_INFO], [DEFAULT_ROW_MEASURE], [DEFAULT_ROW_SESSION], \
-               [DEFAULT_ROW_PRACTICE]
+        return False, 'New record initialized.', True, 'success', write_store([DEFAULT_CLIENT_INFO], client_data), \
+               write_store([DEFAULT_ROW_MEASURE], measures_data), write_store([DEFAULT_ROW_SESSION], sessions_data), \
+               write_store([DEFAULT_ROW_PRACTICE], practices_data), new_library_id()
     
     if trigger == 'cancel-new-record-btn':
-        return False, *[dash.no_update] * 7
+        return False, *[dash.no_update] * 8
         
     raise PreventUpdate
 
+# Note changes to the record for the library autosave, see assets/dashClientsideFunctions.js
+clientside_callback(
+    ClientsideFunction(namespace='library', function_name='mark_changed'),
+    Output('library-changed-store', 'data'),
+    Output('library-autosave-interval', 'disabled'),
+    Input('client-store', 'data'),
+    Input('measures-store', 'data'),
+    Input('sessions-store', 'data'),
+    Input('practices-store', 'data'),
+    State('library-autosave-store', 'data'),
+    prevent_initial_call=True
+)
+
+# Request an autosave once the record stopped changing
+clientside_callback(
+    ClientsideFunction(namespace='library', function_name='check_autosave'),
+    Output('library-autosave-store', 'data'),
+    Output('library-save-request-store', 'data'),
+    Output('library-autosave-interval', 'disabled', allow_duplicate=True),
+    Input('library-autosave-interval', 'n_intervals'),
+    State('library-changed-store', 'data'),
+    State('library-autosave-store', 'data'),
+    prevent_initial_call=True
+)
+
+# Autosave to the record library, under the library ID of the record in this browser session
+@callback(
+    Output('library-autosave-store', 'data', allow_duplicate=True),
+    Output('library-record-store', 'data', allow_duplicate=True),
+    Input('library-save-request-store', 'data'),
+    State('library-autosave-store', 'data'),
+    State('library-record-store', 'data'),
+    State('client-store', 'data'),
+    State('measures-store', 'data'),
+    State('sessions-store', 'data'),
+    State('practices-store', 'data'),
+    prevent_initial_call=True
+)
+def autosave_record(changed, autosave, library_id, client_data, measures_data, sessions_data, practices_data):
+    if not RECORD_LIBRARY or not autosave or changed is None:
+        raise PreventUpdate
+
+    combined_data = {
+        'client': read_store(client_data),
+        'measures': read_store(measures_data),
+        'sessions': read_store(sessions_data),
+        'practices': read_store(practices_data)
+    }
+    # The record of a session that did not load or start one yet is saved under a new library ID
+    new_id = not is_library_id(library_id)
+    if new_id:
+        library_id = new_library_id()
+    try:
+        save_library_record(sanitize_data_types(combined_data), library_id)
+    except Exception as e:
+        print(f"Error saving to the record library: {str(e)}")
+        raise PreventUpdate
+
+    # Only the requested change is marked as saved, later changes are saved on a later interval
+    return {**autosave, 'saved': changed}, library_id if new_id else dash.no_update
+
+# Open record library
+@callback(
+    Output('library-modal', 'is_open'),
+    Input('library-btn', 'n_clicks'),
+    prevent_initial_call=True
+)
+def open_library(n_clicks):
+    if not RECORD_LIBRARY or not n_clicks:
+        raise PreventUpdate
+    return True
+
+# List library records, a page at a time
+@callback(
+    Output('library-record-list', 'children'),
+    Output('library-pagination', 'max_value'),
+    Output('library-pagination', 'active_page'),
+    Output('library-pagination', 'style'),
+    Input('library-modal', 'is_open'),
+    Input('library-search-input', 'value'),
+    Input('library-pagination', 'active_page'),
+    prevent_initial_call=True
+)
+def list_library(is_open, search, page):
+    if not RECORD_LIBRARY or not is_open:
+        raise PreventUpdate
+
+    # Opening the library or searching starts on the first page
+    if dash.ctx.triggered_id != 'library-pagination' or not page:
+        page = 1
+    page_count = max(1, math.ceil(count_library_records(search) / LIBRARY_PAGE_SIZE))
+    page = min(page, page_count)
+    pagination_style = None if page_count > 1 else {'display': 'none'}
+
+    records = list_library_records(search, page, LIBRARY_PAGE_SIZE)
+    if not records:
+        return [dbc.ListGroupItem('No records found.', disabled=True)], page_count, page, pagination_style
+
+    items = [
+        dbc.ListGroupItem(
+            [
+                html.Strong(record['client_id']),
+                html.Span(f" {record['focus']}" if record['focus'] else ''),
+                html.Div(
+                    f"{record['session_count']} sessions, last session {record['last_session_date'] or '-'}",
+                    className='small text-muted'
+                ),
+            ],
+            id={'type': 'library-record-item', 'library_id': record['library_id']},
+            action=True
+        )
+        for record in records
+    ]
+    return items, page_count, page, pagination_style
+
+# Load from library
+@callback(
+    Output('client-store', 'data', allow_duplicate=True),
+    Output('measures-store', 'data', allow_duplicate=True),
+    Output('sessions-store', 'data', allow_duplicate=True),
+    Output('practices-store', 'data', allow_duplicate=True),
+    Output('data-alert', 'children', allow_duplicate=True),
+    Output('data-alert', 'is_open', allow_duplicate=True),
+    Output('data-alert', 'color', allow_duplicate=True),
+    Output('library-modal', 'is_open', allow_duplicate=True),
+    Output('library-record-store', 'data', allow_duplicate=True),
+    Input({'type': 'library-record-item', 'library_id': ALL}, 'n_clicks'),
+    prevent_initial_call=True
+)
+def load_library_record(record_clicks):
+    if not any(record_clicks):
+        raise PreventUpdate
+    library_id = dash.ctx.triggered_id['library_id']
+
+    try:
+        data = read_library_record(library_id)
+    except Exception as e:
+        print(f"Error loading from the record library: {str(e)}")
+        data = None
+    if data is None:
+        return *[dash.no_update] * 4, 'Record not loaded.', True, 'danger', False, dash.no_update
+
+    # Use defaults if sections are missing, as for uploaded records
+    # Later changes are saved over the opened record
+    sanitized_data = sanitize_data_types(data)
+    client_id = record_summary(sanitized_data)['client_id']
+    return (
+        write_store(sanitized_data.get('client', [DEFAULT_CLIENT_INFO])),
+        write_store(sanitized_data.get('measures', [DEFAULT_ROW_MEASURE])),
+        write_store(sanitized_data.get('sessions', [DEFAULT_ROW_SESSION])),
+        write_store(sanitized_data.get('practices', [DEFAULT_ROW_PRACTICE])),
+        f'Record {client_id} loaded.', True, 'success', False, library_id
+    )
+
+# Import record files
+@callback(
+    Output('import-report-modal', 'is_open'),
+    Output('import-report-list', 'children'),
+    Output('import-records-btn', 'contents'),
+    Output('data-alert', 'children', allow_duplicate=True),
+    Output('data-alert', 'is_open', allow_duplicate=True),
+    Output('data-alert', 'color', allow_duplicate=True),
+    Output('record-progress-interval', 'disabled', allow_duplicate=True),
+    Output('record-progress-container', 'hidden', allow_duplicate=True),
+    Input('import-records-task', 'data'),
+    State('import-records-btn', 'contents'),
+    State('import-records-btn', 'filename'),
+    prevent_initial_call=True
+)
+def import_record_files(task, contents, filenames):
+    if not contents or not task:
+        raise PreventUpdate
+
+    try:
+        results = import_records(filenames, contents, progress=import_progress(task['id']))
+    finally:
+        clear_progress(task['id'])
+    imported = sum(result['status'] != 'failed' for result in results)
+    failed = len(results) - imported
+
+    report_items = [
+        dbc.ListGroupItem(
+            [html.Strong(result['name']), html.Div(result['message'], className='small')],
+            color=IMPORT_STATUS_COLORS[result['status']]
+        )
+        for result in results
+    ]
+    alert_message = f"{imported} {'record' if imported == 1 else 'records'} imported."
+    if failed:
+        alert_message += f" {failed} {'file' if failed == 1 else 'files'} failed."
+
+    # Clear the upload so the same files can be imported again
+    return True, report_items, None, alert_message, True, 'warning' if failed else 'success', True, True
+
+def load_record(contents, progress=None, report=None):
+    """Decode, parse and sanitize an uploaded record, sanitizing the entries as they are read.
+
+    Compressed records and records in the binary format are detected by their first bytes,
+    compressed records are decompressed while reading. JSON records are parsed in
+    chunks, sessions are sanitized while reading if the measures and practices come first in the
+    file, as in saved records, otherwise after the whole record is read. Counts of coerced and
+    dropped session values are added to report."""
+    chunks = upload_chunks(contents, progress=progress)
+    prefix, chunks = peek_chunks(chunks, len(BINARY_MAGIC))
+    if prefix == BINARY_MAGIC:
+        return sanitize_data_types(read_binary_record(b''.join(chunks)), report)
+
+    # Field names shared by the sessions kept until the end, as json.loads does
+    field_names = {}
+
+    def read_items(section, items, record):
+        if section == 'measures':
+            return [sanitize_measure(item) for item in items]
+        if section == 'practices':
+            return [sanitize_practice(item) for item in items]
+        if section == 'sessions':
+            if 'measures' in record and 'practices' in record:
+                return sanitize_sessions(items, record['measures'], record['practices'], report)
+            return [
+                {field_names.setdefault(name, name): value for name, value in item.items()} if isinstance(item, dict) else item
+                for item in items
+            ]
+        return items
+
+    data = read_record(decode_text(chunks), read_items)
+
+    sanitized = {}
+    for section, sanitize in [('measures', sanitize_measure), ('practices', sanitize_practice)]:
+        if section in data:
+            items = data[section]
+            sanitized[section] = items if isinstance(items, list) else [sanitize(item) for item in items]
+
+    if 'sessions' in data:
+        sections = list(data)
+        read_first = sections[:sections.index('sessions')]
+        sessions = data['sessions']
+        if not isinstance(sessions, list) or 'measures' not in read_first or 'practices' not in read_first:
+            sessions = sanitize_sessions(sessions, sanitized.get('measures', []), sanitized.get('practices', []), report)
+        sanitized['sessions'] = sessions
+
+    if 'client' in data:
+        sanitized['client'] = data['client']
+
+    return sanitized
+
+def get_example_record(name):
+    """Sanitized example record, read again only when its file has changed."""
+    path = os.path.join(EXAMPLE_DATA_DIR, EXAMPLE_RECORDS[name])
+    try:
+        mtime = os.path.getmtime(path)
+        if name not in example_cache or example_cache[name]['mtime'] != mtime:
+            with open(path, 'rb') as file:
+                record = sanitize_data_types(parse_record_bytes(file.read()))
+            example_cache[name] = {'mtime': mtime, 'record': record}
+    except Exception as e:
+        print(f"Error loading example {path}: {str(e)}")
+        return None
+
+    return example_cache[name]['record']
+
+def load_progress(task_id):
+    '''Progress function reporting the decoded part of an uploaded record on the page'''
+    def progress(done, total):
+        percent = done * 100 // total
+        report_progress(task_id, percent, f'{percent}%')
+    return progress
+
+def import_progress(task_id):
+    '''Progress function reporting the imported files on the page'''
+    def progress(done, total):
+        report_progress(task_id, done * 100 // total, f'{done} of {total} files')
+    return progress
+
+def format_sanitize_report(report):
+    """Describe the coerced and dropped session values of a sanitize report."""
+    parts = []
+    if report.get('coerced'):
+        parts.append(f"{report['coerced']} {'value' if report['coerced'] == 1 else 'values'} converted")
+    if report.get('dropped'):
+        parts.append(f"{report['dropped']} invalid {'value' if report['dropped'] == 1 else 'values'} removed")
+    return f"{', '.join(parts).capitalize()}." if parts else ''
+
 def convert_to_float(value):
     """Safely convert a value to float."""
     if value is None or value == '':
@@ -267,18 +675,130 @@ def convert_to_date(value):
     except (ValueError, TypeError):
         return date.today().isoformat()
 
-def sanitize_measure(measure):
-    """Sanitize a single measure entry."""
-    if not measure:
-        return measure
-    
-    sanitized = measure.copy()
-    sanitized['Min'] = convert_to_float(measure.get('Min'))
-    sanitized['Max'] = convert_to_float(measure.get('Max'))
-    sanitized['SelectMeasure'] = convert_to_bool(measure.get('SelectMeasure'))
-    sanitized['SelectRater'] = convert_to_bool(measure.get('SelectRater'))
+# Session column sanitizers
+#
+# Each converts the values of one session field and adds the number of coerced values (converted
+# from another type or format) and dropped values (invalid, replaced by the default) to counts.
+# Columns that already have the target type are returned as they are.
+
+def sanitize_number_column(values, counts):
+    """Session numbers as integers, 0 if missing or invalid."""
+    if set(map(type, values)) <= {int}:
+        return values
+
+    sanitized = []
+    for value in values:
+        result = convert_to_int(value, None)
+        if result is None:
+            result = 0
+            if value is not None and value != '':
+                counts['dropped'] += 1
+        elif type(value) is not int:
+            counts['coerced'] += 1
+        sanitized.append(result)
+    return sanitized
+
+def sanitize_date_column(values, counts):
+    """Session dates as ISO date strings, today if missing or invalid."""
+    # Dates that numpy reads back unchanged are valid ISO dates
+    text = np.array([value if type(value) is str else '' for value in values], dtype=str)
+    try:
+        dates = text.astype('datetime64[D]')
+        valid = (dates.astype(str) == text) & (dates >= np.datetime64('0001-01-01'))
+    except ValueError:
+        valid = np.zeros(len(values), dtype=bool)
+    if valid.all():
+        return values
+
+    sanitized = list(values)
+    for index in np.flatnonzero(~valid):
+        value = values[index]
+        result = convert_to_date(value)
+        if value and result != value:
+            try:
+                date.fromisoformat(str(value))
+                counts['coerced'] += 1
+            except (ValueError, TypeError):
+                counts['dropped'] += 1
+        sanitized[index] = result
+    return sanitized
+
+def sanitize_measure_column(values, counts):
+    """Measure values as floats, None if missing or invalid."""
+    types = set(map(type, values))
+    if types <= {float, type(None)}:
+        return values
+    if types <= {float, int, type(None)}:
+        return [None if value is None else float(value) for value in values]
+
+    sanitized = []
+    for value in values:
+        result = convert_to_float(value)
+        if type(value) not in (float, int, type(None)) and value != '':
+            counts['dropped' if result is None else 'coerced'] += 1
+        sanitized.append(result)
     return sanitized
 
+def sanitize_practice_column(values, counts):
+    """Practice values as booleans, False if missing."""
+    if set(map(type, values)) <= {bool}:
+        return values
+
+    counts['coerced'] += sum(1 for value in values if value is not None and type(value) is not bool)
+    return [convert_to_bool(value) for value in values]
+
+@cached(session_sanitizer_cache, lock=threading.Lock())
+def compile_session_sanitizer(measures, practices):
+    """Field names and column sanitizers of the sessions of a schema, compiled once per schema."""
+    sanitizers = {'session_number': sanitize_number_column, 'session_date': sanitize_date_column}
+
+    # Practices take the place of measures of the same name
+    sanitizers.update((name, sanitize_measure_column) for name in measures)
+    sanitizers.update((name, sanitize_practice_column) for name in practices)
+
+    return tuple(sanitizers), list(sanitizers.values())
+
+def sanitize_sessions(sessions, measures, practices, report=None):
+    """Sanitize sessions column by column, keeping only the session fields of the schema.
+
+    Empty sessions and sessions that are already sanitized are kept as they are.
+    Counts of coerced and dropped values are added to report."""
+    fields, sanitizers = compile_session_sanitizer(tuple(measure_names(measures)), tuple(practice_names(practices)))
+    counts = report if report is not None else {}
+    counts.setdefault('coerced', 0)
+    counts.setdefault('dropped', 0)
+
+    rows = [session for session in sessions if session]
+
+    # Rows with exactly the fields of the schema in order are read at once
+    conforming = all(tuple(row) == fields for row in rows)
+    if conforming:
+        columns = [list(map(itemgetter(field), rows)) for field in fields]
+    else:
+        columns = [[row.get(field) for row in rows] for field in fields]
+
+        # Values of fields outside of the schema are dropped
+        known = set(fields)
+        counts['dropped'] += sum(1 for row in rows for field in row.keys() - known if row[field] is not None)
+
+    sanitized_columns = [sanitize(column, counts) for column, sanitize in zip(columns, sanitizers)]
+
+    # Rows that are already sanitized are kept if they share their field names, as rows parsed
+    # together by json.loads do. Rebuilding rows parsed one by one shares the names of the schema.
+    # The column sanitizers return their input list itself when every value already has its type.
+    unchanged = all(sanitized is column for sanitized, column in zip(sanitized_columns, columns))
+    shared_names = not rows or all(map(is_, rows[0], rows[-1]))  # The same str objects, not just equal ones
+    if conforming and unchanged and shared_names:
+        sanitized = rows
+    else:
+        sanitized = [dict(zip(fields, values)) for values in zip(*sanitized_columns)]
+
+    if len(rows) == len(sessions):
+        return sanitized
+
+    sanitized_rows = iter(sanitized)
+    return [next(sanitized_rows) if session else session for session in sessions]
+
 def sanitize_measure(measure):
     """Sanitize a single measure entry."""
     if not measure:
@@ -304,28 +824,6 @@ def sanitize_measure(measure):
     
     return sanitized
 
-def sanitize_session(session, measures, practices):
-    """Sanitize a single session entry."""
-    if not session:
-        return session
-    
-    sanitized = {
-        'session_number': convert_to_int(session.get('session_number')),
-        'session_date': convert_to_date(session.get('session_date'))
-    }
-    
-    # Handle measure values
-    for measure in measures:
-        if measure['Name'] != 'New Measure':
-            sanitized[measure['Name']] = convert_to_float(session.get(measure['Name']))
-    
-    # Handle practice values
-    for practice in practices:
-        if practice['Name'] != 'New Practice':
-            sanitized[practice['Name']] = convert_to_bool(session.get(practice['Name']))
-    
-    return sanitized
-
 def sanitize_practice(practice):
     """Sanitize a single practice entry."""
     if not practice:
@@ -336,8 +834,10 @@ def sanitize_practice(practice):
         'Description': str(practice.get('Description', ''))
     }
 
-def sanitize_data_types(data):
-    """Sanitize all data types before saving or after loading."""
+def sanitize_data_types(data, report=None):
+    """Sanitize all data types before saving or after loading.
+
+    Counts of coerced and dropped session values are added to report."""
     if not data:
         return data
 
@@ -353,15 +853,14 @@ def sanitize_data_types(data):
     
     # Handle sessions
     if 'sessions' in data:
-        measures = data.get('measures', [])
-        practices = data.get('practices', [])
-        sanitized['sessions'] = [
-            sanitize_session(s, measures, practices) 
-            for s in data['sessions']
-        ]
+        sanitized['sessions'] = sanitize_sessions(data['sessions'], data.get('measures', []), data.get('practices', []), report)
     
     # Pass through client data
     if 'client' in data:
         sanitized['client'] = data['client']
     
-    return sanitized
\ No newline at end of file
+    return sanitized
+
+# Parse the examples once at startup
+for example_name in EXAMPLE_RECORDS:
+    get_example_record(example_name)
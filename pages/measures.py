@@ -1,9 +1,12 @@
 import dash
-from dash import html, callback, Input, Output, State
+from dash import html, dcc, callback, clientside_callback, ClientsideFunction, Input, Output, State
 from dash.exceptions import PreventUpdate
 import dash_bootstrap_components as dbc
 import dash_ag_grid as dag
+import numpy as np
 from globals import APP_TITLE, PAGE_HEADER_STYLE, COLORS_MEASURES, AG_GRID_THEME, DEFAULT_ROW_MEASURE, ALERT_DURATION, HELP_TEXT_MEASURES, create_help_button
+from records import measure_column, schema_index, apply_operations
+from store import read_store, write_store
 import time
 dash.register_page(__name__, name='Measures', order=2, title=APP_TITLE)
 
@@ -79,6 +82,7 @@ ag_grid_config = {
 layout = html.Div([
     html.H2('Measures', style=PAGE_HEADER_STYLE),
     dag.AgGrid(id='measures-grid', **ag_grid_config),
+    dcc.Store(id='measures-delete-request'),
     dbc.Button(
         'Add Row',
         id='add-row-measures-btn',
@@ -105,6 +109,15 @@ layout = html.Div([
 
 # Callbacks
 
+# Positions of the selected rows in the grid, see assets/dashClientsideFunctions.js
+clientside_callback(
+    ClientsideFunction(namespace='grids', function_name='request_delete'),
+    Output('measures-delete-request', 'data'),
+    Input('delete-rows-measures-btn', 'n_clicks'),
+    State('measures-grid', 'id'),
+    prevent_initial_call=True
+)
+
 @callback(
     Output('measures-store', 'data', allow_duplicate=True),
     Output('measures-grid', 'rowData', allow_duplicate=True),
@@ -114,35 +127,41 @@ layout = html.Div([
     
     Input('measures-grid', 'cellValueChanged'),
     Input('add-row-measures-btn', 'n_clicks'),
-    Input('delete-rows-measures-btn', 'n_clicks'),
+    Input('measures-delete-request', 'data'),
     Input('measures-grid', 'virtualRowData'),
       
     State('measures-grid', 'rowData'),
-    State('measures-grid', 'selectedRows'),
     State('measures-store', 'data'),
     State('sessions-store', 'data'),
     prevent_initial_call='initial_duplicate'
 )
-def update_measures(cell_changed, add_clicks, delete_clicks, virtual_row_data, current_rows, selected_rows, measures_data, sessions_data):
+def update_measures(cell_changed, add_clicks, delete_request, virtual_row_data, current_rows, measures_store, sessions_store):
     ctx = dash.callback_context
     trigger_id = ctx.triggered[0]['prop_id']
     alert = {'message': dash.no_update, 'show': dash.no_update}
+    measures_data = read_store(measures_store, [DEFAULT_ROW_MEASURE])
+    sessions_data = read_store(sessions_store, [])
+
+    # Operations applied to the sessions, only these are written to the journal of server-side stores
+    operations = []
 
     if trigger_id == 'measures-grid.virtualRowData' and virtual_row_data:
-        updated_rows, sessions_data = reorder_measures(virtual_row_data, measures_data, sessions_data)
+        updated_rows, sessions_data = reorder_measures(virtual_row_data, measures_data, sessions_data, operations)
     elif trigger_id == 'measures-grid.cellValueChanged':
-        updated_rows, alert, sessions_data = update_cell(cell_changed, measures_data, sessions_data)
+        updated_rows, alert, sessions_data = update_cell(cell_changed, measures_data, sessions_data, operations)
         measures_data = updated_rows
     elif trigger_id == 'add-row-measures-btn.n_clicks':
         updated_rows = measures_data + [DEFAULT_ROW_MEASURE.copy()]
-    elif trigger_id == 'delete-rows-measures-btn.n_clicks':
-        updated_rows, sessions_data = delete_rows(selected_rows, measures_data, sessions_data)
+    elif trigger_id == 'measures-delete-request.data':
+        updated_rows, sessions_data = delete_rows(delete_request['rows'], measures_data, sessions_data, operations)
     else:
         updated_rows = measures_data
 
-    return updated_rows, updated_rows, sessions_data, alert['message'], alert['show']
+    sessions_output = write_store(sessions_data, sessions_store, operations) if operations else dash.no_update
+
+    return write_store(updated_rows, measures_store), updated_rows, sessions_output, alert['message'], alert['show']
 
-def update_cell(cell_changed, rows, sessions_data):
+def update_cell(cell_changed, rows, sessions_data, operations=None):
     alert = {'message': '', 'show': False}
     
     if not cell_changed:
@@ -160,13 +179,13 @@ def update_cell(cell_changed, rows, sessions_data):
     if column == 'Name':
         # Keep old value until validation is complete
         updated_rows[index]['Name'] = old_value
-        updated_rows, alert = handle_name_change(index, old_value, new_value, updated_rows, sessions_data)
+        updated_rows, alert = handle_name_change(index, old_value, new_value, updated_rows, sessions_data, operations)
     elif column == 'Type':
         updated_rows = handle_type_change(index, new_value, updated_rows)
     elif column == 'Rater':
         updated_rows = handle_rater_change(index, new_value, updated_rows)
     elif column in ['Min', 'Max']:
-        updated_rows, alert = handle_min_max_change(index, column, old_value, new_value, updated_rows, sessions_data)
+        updated_rows, alert = handle_min_max_change(index, column, old_value, new_value, updated_rows, sessions_data, operations)
         if alert['show']:
             # If validation failed, return immediately to prevent invalid value from being stored
             return updated_rows, alert, sessions_data
@@ -176,7 +195,7 @@ def update_cell(cell_changed, rows, sessions_data):
         updated_rows[index][column] = new_value
     
     return updated_rows, alert, sessions_data
-def handle_name_change(index, old_value, new_value, rows, sessions_data):
+def handle_name_change(index, old_value, new_value, rows, sessions_data, operations=None):
     alert = {'message': '', 'show': False}
 
     existing_names = [row['Name'] for row in rows if row['Name'] != old_value]
@@ -186,7 +205,7 @@ def handle_name_change(index, old_value, new_value, rows, sessions_data):
         alert['show'] = True
     else:
         rows[index]['Name'] = new_value
-        update_sessions_measure_names(sessions_data, old_value, new_value)
+        update_sessions_measure_names(sessions_data, old_value, new_value, operations)
         set_measure_colors(rows)
 
     return rows, alert
@@ -221,28 +240,20 @@ def handle_type_change(index, new_value, rows):
         rows[index]['Max'] = 100
     return rows
 
-def get_rater_selection(measures_data):
-    rater_selection = {}
-    for measure in measures_data:
-        measure_copy = measure.copy()
-        if measure_copy['Rater'] not in rater_selection:
-            rater_selection[measure_copy['Rater']] = measure_copy['SelectRater']
-    rater_selection = dict(sorted(rater_selection.items()))
-    return rater_selection
-
 def handle_rater_change(index, new_value, rows):
     '''Handles changes to the 'Rater' column, adjusting 'SelectMeasure' and 'SelectRater' values accordingly.'''
-    rater_selection = get_rater_selection(rows[:index] + rows[index + 1:])
-    if new_value in rater_selection:
-        rows[index]['SelectRater'] = rater_selection[new_value]
-        rows[index]['SelectMeasure'] = rater_selection[new_value]
+    # Take over the selection of the first other measure of the new rater
+    positions = [position for position in schema_index(rows, [])['raters'].get(new_value, []) if position != index]
+    if positions:
+        rows[index]['SelectRater'] = rows[positions[0]]['SelectRater']
+        rows[index]['SelectMeasure'] = rows[positions[0]]['SelectRater']
     elif not rows[index]['SelectRater']:
         rows[index]['SelectRater']  = False
         rows[index]['SelectMeasure'] = False
 
     return rows
 
-def handle_min_max_change(index, column, old_value, new_value, rows, sessions_data):
+def handle_min_max_change(index, column, old_value, new_value, rows, sessions_data, operations=None):
     '''Handles validation for changes in 'Min' and 'Max' columns.'''
     alert = {'message': '', 'show': False}
     
@@ -293,23 +304,26 @@ def handle_min_max_change(index, column, old_value, new_value, rows, sessions_da
     rows[index][column] = new_value_float  # Store as float instead of string
     
     # Check if any session data needs updating
-    alert = update_sessions_on_out_of_range(index, rows, sessions_data)
+    alert = update_sessions_on_out_of_range(index, rows, sessions_data, operations)
     
     return rows, alert
 
-def update_sessions_on_out_of_range(index, rows, sessions_data):
+def update_sessions_on_out_of_range(index, rows, sessions_data, operations=None):
     '''Checks if session data is out of the new Min/Max range and adjusts it.'''
     alert = {'message': '', 'show': False}
     measure_name = rows[index]['Name']
     min_value = float(rows[index]['Min'])
     max_value = float(rows[index]['Max'])
 
-    for session in sessions_data:
-        session_value = session.get(measure_name)
-        if session_value is not None and not (min_value <= session_value <= max_value):
-            session[measure_name] = None
-            alert['message'] = f'Values of {measure_name} in sessions data were out of range and have been deleted.'
-            alert['show'] = True
+    # Check the whole measure column at once and only touch the sessions out of range
+    values = measure_column(sessions_data, measure_name)
+    out_of_range = np.flatnonzero((values < min_value) | (values > max_value))
+
+    if len(out_of_range):
+        operation = {'op': 'clear_out_of_range', 'field': measure_name, 'min': min_value, 'max': max_value}
+        apply_operations(sessions_data, [operation], operations)
+        alert['message'] = f'Values of {measure_name} in sessions data were out of range and have been deleted.'
+        alert['show'] = True
 
     return alert
 
@@ -335,44 +349,35 @@ def is_valid_number(value, allow_zero=True):
     except (ValueError, TypeError):
         return False
 
-def update_sessions_measure_names(sessions_data, old_value, new_value):
-    for session in sessions_data:
-        if old_value in session:
-            session[new_value] = session.pop(old_value)
-        else:
-            session[new_value] = None
+def update_sessions_measure_names(sessions_data, old_value, new_value, operations=None):
+    operation = {'op': 'rename_field', 'old': old_value, 'new': new_value, 'default': None}
+    apply_operations(sessions_data, [operation], operations)
 
 def set_measure_colors(rows):
     for i, measure in enumerate(rows):
         measure['Color'] = COLORS_MEASURES[i % len(COLORS_MEASURES)]
 
-def delete_rows(selected_rows, measures_data, sessions_data):
-    if selected_rows:
-        updated_rows = [row for row in measures_data if row not in selected_rows]
+def delete_rows(selected_indices, measures_data, sessions_data, operations=None):
+    if selected_indices:
+        # Rows are deleted by position, as unnamed measures share the name New Measure
+        selected = set(selected_indices)
+        updated_rows = [row for index, row in enumerate(measures_data) if index not in selected]
         if not updated_rows:
             updated_rows = [DEFAULT_ROW_MEASURE.copy()]
 
-        delete_values = [row['Name'] for row in selected_rows if row['Name'] != 'New Measure']
-        for value in delete_values:
-            for session in sessions_data:
-                session.pop(value, None)
+        # Session fields are only dropped if no remaining measure has the name
+        deleted_names = {row['Name'] for index, row in enumerate(measures_data) if index in selected}
+        delete_values = deleted_names - {row['Name'] for row in updated_rows} - {'New Measure'}
+        if delete_values:
+            apply_operations(sessions_data, [{'op': 'drop_fields', 'fields': sorted(delete_values)}], operations)
     else:
         updated_rows = measures_data
     return updated_rows, sessions_data
 
-def reorder_measures(virtual_row_data, measures_data, sessions_data):
+def reorder_measures(virtual_row_data, measures_data, sessions_data, operations=None):
     if virtual_row_data and virtual_row_data != measures_data:
 
         new_order = [row['Name'] for row in virtual_row_data]
-        sessions_data_updated = []
-    
-        for session in sessions_data:
-            reordered_session = {k: session[k] for k in session if k not in new_order}
-            
-            for measure in new_order:
-                reordered_session[measure] = session.get(measure, None)
-            
-            sessions_data_updated.append(reordered_session)
-        sessions_data = sessions_data_updated
+        apply_operations(sessions_data, [{'op': 'order_fields', 'fields': new_order}], operations)
 
     return virtual_row_data, sessions_data
\ No newline at end of file
@@ -1,8 +1,10 @@
 import dash
-from dash import html, dcc, callback, Input, Output, State
+from dash import html, dcc, callback, clientside_callback, ClientsideFunction, Input, Output, State
 import dash_bootstrap_components as dbc
 import dash_ag_grid as dag
 from globals import APP_TITLE, PAGE_HEADER_STYLE, DEFAULT_ROW_PRACTICE, AG_GRID_THEME, ALERT_DURATION, HELP_TEXT_PRACTICES, create_help_button
+from records import apply_operations
+from store import read_store, write_store
 
 dash.register_page(__name__, name='Practices', order=3, title=APP_TITLE)
 
@@ -50,6 +52,7 @@ ag_grid_config = {
 layout = html.Div([
     html.H2('Practices', style=PAGE_HEADER_STYLE),
     dag.AgGrid(id='practices-grid', **ag_grid_config),
+    dcc.Store(id='practices-delete-request'),
     dbc.Button(
         'Add Row',
         id='add-row-practices-btn', 
@@ -74,6 +77,15 @@ layout = html.Div([
 
 # Callbacks
 
+# Positions of the selected rows in the grid, see assets/dashClientsideFunctions.js
+clientside_callback(
+    ClientsideFunction(namespace='grids', function_name='request_delete'),
+    Output('practices-delete-request', 'data'),
+    Input('delete-rows-practices-btn', 'n_clicks'),
+    State('practices-grid', 'id'),
+    prevent_initial_call=True
+)
+
 @callback(
     Output('practices-store', 'data'),
     Output('practices-grid', 'rowData'),
@@ -83,54 +95,51 @@ layout = html.Div([
 
     Input('practices-grid', 'cellValueChanged'),
     Input('add-row-practices-btn', 'n_clicks'),
-    Input('delete-rows-practices-btn', 'n_clicks'),
+    Input('practices-delete-request', 'data'),
     Input('practices-grid', 'virtualRowData'),
 
     State('practices-grid', 'rowData'),
-    State('practices-grid', 'selectedRows'),
     State('practices-store', 'data'),
     State('sessions-store', 'data'),
     prevent_initial_call='initial_duplicate'
 )
-def update_practices(cell_changed, add_clicks, delete_clicks, virtual_row_data, current_rows, selected_rows, practices_data, sessions_data):
+def update_practices(cell_changed, add_clicks, delete_request, virtual_row_data, current_rows, practices_store, sessions_store):
     ctx = dash.callback_context
     trigger_id = ctx.triggered[0]['prop_id']
     alert = {'message': dash.no_update, 'show': dash.no_update}
+    practices_data = read_store(practices_store, [DEFAULT_ROW_PRACTICE])
+    sessions_data = read_store(sessions_store, [])
+
+    # Operations applied to the sessions, only these are written to the journal of server-side stores
+    operations = []
 
     if trigger_id == 'practices-grid.virtualRowData' and virtual_row_data:
-        updated_rows, sessions_data = reorder_practices(virtual_row_data, practices_data, sessions_data)
+        updated_rows, sessions_data = reorder_practices(virtual_row_data, practices_data, sessions_data, operations)
     elif trigger_id == 'practices-grid.cellValueChanged':
-        updated_rows, alert = update_cell(cell_changed, practices_data, sessions_data)
+        updated_rows, alert = update_cell(cell_changed, practices_data, sessions_data, operations)
         practices_data = updated_rows
     elif trigger_id == 'add-row-practices-btn.n_clicks':
         updated_rows = practices_data + [DEFAULT_ROW_PRACTICE.copy()]
-    elif trigger_id == 'delete-rows-practices-btn.n_clicks':
-        updated_rows, sessions_data = delete_row(selected_rows, practices_data, sessions_data)
+    elif trigger_id == 'practices-delete-request.data':
+        updated_rows, sessions_data = delete_row(delete_request['rows'], practices_data, sessions_data, operations)
     else:
         updated_rows = practices_data
 
-    return updated_rows, updated_rows, sessions_data, alert['message'], alert['show']
+    sessions_output = write_store(sessions_data, sessions_store, operations) if operations else dash.no_update
+
+    return write_store(updated_rows, practices_store), updated_rows, sessions_output, alert['message'], alert['show']
 
-def reorder_practices(virtual_row_data, practices_data, sessions_data):
+def reorder_practices(virtual_row_data, practices_data, sessions_data, operations=None):
     
     if virtual_row_data and virtual_row_data != practices_data:
         
         # Reorder practices in sessions data
         new_order = [row['Name'] for row in virtual_row_data]
-        sessions_data_updated = []
-    
-        for session in sessions_data:
-            reordered_session = {k: session[k] for k in session if k not in new_order}
-            
-            for practice in new_order:
-                reordered_session[practice] = session.get(practice, None)
-            
-            sessions_data_updated.append(reordered_session)
-        sessions_data = sessions_data_updated
+        apply_operations(sessions_data, [{'op': 'order_fields', 'fields': new_order}], operations)
 
     return virtual_row_data, sessions_data
 
-def update_cell(cell_changed, rows, sessions_data):
+def update_cell(cell_changed, rows, sessions_data, operations=None):
     alert = {'message': '', 'show': False}
     
     if not cell_changed:
@@ -153,7 +162,7 @@ def update_cell(cell_changed, rows, sessions_data):
             alert['show'] = True
         else:
             updated_rows[index]['Name'] = new_value
-            update_sessions_data(sessions_data, old_value, new_value)
+            update_sessions_data(sessions_data, old_value, new_value, operations)
     else:
         updated_rows[index][column] = new_value
     
@@ -179,23 +188,23 @@ def get_alert_message(name):
     else:
         return f'Name {name} already in use. Please choose a different name.'
 
-def update_sessions_data(sessions_data, old_value, new_value):
-    for session in sessions_data:
-        if old_value in session:
-            session[new_value] = session.pop(old_value)
-        else:
-            session[new_value] = False
+def update_sessions_data(sessions_data, old_value, new_value, operations=None):
+    operation = {'op': 'rename_field', 'old': old_value, 'new': new_value, 'default': False}
+    apply_operations(sessions_data, [operation], operations)
 
-def delete_row(selected_rows, practices_data, sessions_data):
-    if selected_rows:
-        updated_rows = [row for row in practices_data if row not in selected_rows]
+def delete_row(selected_indices, practices_data, sessions_data, operations=None):
+    if selected_indices:
+        # Rows are deleted by position, as unnamed practices share the name New Practice
+        selected = set(selected_indices)
+        updated_rows = [row for index, row in enumerate(practices_data) if index not in selected]
         if not updated_rows:
             updated_rows = [DEFAULT_ROW_PRACTICE]
 
-        delete_values = [row['Name'] for row in selected_rows]
-        for value in delete_values:
-            for session in sessions_data:
-                session.pop(value, None)
+        # Session fields are only dropped if no remaining practice has the name
+        deleted_names = {row['Name'] for index, row in enumerate(practices_data) if index in selected}
+        delete_values = deleted_names - {row['Name'] for row in updated_rows}
+        if delete_values:
+            apply_operations(sessions_data, [{'op': 'drop_fields', 'fields': sorted(delete_values)}], operations)
     else:
         updated_rows = practices_data
     return updated_rows, sessions_data
\ No newline at end of file
@@ -1,16 +1,35 @@
 import dash
-from dash import html, dcc, callback, Input, Output, State
+from dash import html, dcc, callback, clientside_callback, ClientsideFunction, Input, Output, State, Patch
 from dash.exceptions import PreventUpdate
 import dash_bootstrap_components as dbc
 import dash_mantine_components as dmc
 import dash_ag_grid as dag
 from datetime import date, timedelta
 from dash_iconify import DashIconify
+import base64
+import csv
+import io
+import threading
+import numpy as np
+from cachetools import LRUCache, cached
 
 from globals import APP_TITLE, PAGE_HEADER_STYLE, DEFAULT_ROW_SESSION, AG_GRID_THEME, ALERT_DURATION, HELP_TEXT_SESSIONS, create_help_button
+from globals import SERVER_SIDE_STORE, PAGED_SESSIONS_GRID, SESSIONS_BLOCK_SIZE, SESSIONS_MAX_BLOCKS
+from store import is_handle, read_store, write_store, undo_store, redo_store
+from records import SESSION_FIELDS, schema_fingerprint, schema_index, to_float, columns_to_sessions, apply_operations
+from session_import import REJECT_REASONS, import_sessions
 
 dash.register_page(__name__, name='Sessions', order=4, title=APP_TITLE)
 
+# Column definitions by schema fingerprint
+column_defs_cache = LRUCache(maxsize=64)
+
+# Number of rejected values listed in the alert
+MAX_ALERT_MESSAGES = 5
+
+# Server-side sessions read for serving row blocks, by record id and revision
+paged_sessions_cache = LRUCache(maxsize=16)
+
 # AG Grid configuration
 
 ag_grid_config = {
@@ -29,14 +48,28 @@ ag_grid_config = {
         'sortable': False,
         'suppressMovable': True,
     },
+    'getRowId': 'params.data.session_number',
     'className': AG_GRID_THEME,
     'style': {'height': 400, 'width': '100%', 'minWidth': 400},
 }
 
+# Load rows in blocks from the server-side record instead of all at once
+if PAGED_SESSIONS_GRID:
+    ag_grid_config['rowModelType'] = 'infinite'
+    ag_grid_config['dashGridOptions'].update({
+        'cacheBlockSize': SESSIONS_BLOCK_SIZE,
+        'maxBlocksInCache': SESSIONS_MAX_BLOCKS,
+        'infiniteInitialRowCount': 1,
+    })
+
 # Page layout
 
 layout = html.Div([
     html.H2('Sessions', style=PAGE_HEADER_STYLE),
+    dcc.Location(id='sessions-url'),
+    dcc.Store(id='sessions-grid-request'),
+    dcc.Store(id='sessions-grid-columns'),
+    dcc.Store(id='sessions-grid-refresh'),
     dag.AgGrid(id='sessions-grid', **ag_grid_config),
     html.Div(id='custom-component-checkbox-value-changed-1'),
     dbc.Button(
@@ -49,7 +82,23 @@ layout = html.Div([
         'Delete Selected',
         id='delete-row-sessions-btn',
         color='danger',
-        className='mt-2', 
+        className='mt-2 me-2', 
+    ),
+    dcc.Upload(
+        id='import-sessions-btn',
+        children=dbc.Button('Import CSV', color='secondary', className='mt-2 me-2'),
+        multiple=False,
+        accept='.csv,.tsv,.txt',
+        style={'display': 'inline-block'}
+    ),
+
+    # Undo and redo need the journal of the server-side store
+    html.Div(
+        [
+            dbc.Button('Undo', id='undo-sessions-btn', color='secondary', outline=True, className='mt-2 me-2'),
+            dbc.Button('Redo', id='redo-sessions-btn', color='secondary', outline=True, className='mt-2'),
+        ],
+        style={'display': 'inline-block'} if SERVER_SIDE_STORE else {'display': 'none'}
     ),
     dbc.Alert(
         id='sessions-alert',
@@ -59,49 +108,336 @@ layout = html.Div([
         className='mt-2',
         style={'width': 'fit-content'}
     ),
+    dbc.Alert(
+        id='sessions-import-alert',
+        is_open=False,
+        duration=ALERT_DURATION,
+        className='mt-2',
+        style={'width': 'fit-content'}
+    ),
     create_help_button(HELP_TEXT_SESSIONS)
 ])
 
 # Callbacks
 
+# Full grid data only when the page is opened, changes are sent as row transactions
 @callback(
-    Output('sessions-store', 'data', allow_duplicate=True),
     Output('sessions-grid', 'rowData'),
+    Output('sessions-grid-columns', 'data'),
+    Output('sessions-grid-schema', 'data'),
+    Output('sessions-store', 'data', allow_duplicate=True),
+    Input('sessions-url', 'pathname'),
+    State('measures-store', 'data'),
+    State('sessions-store', 'data'),
+    State('practices-store', 'data'),
+    State('sessions-grid-schema', 'data'),
+    prevent_initial_call='initial_duplicate'
+)
+def load_sessions_grid(pathname, measures_store, sessions_store, practices_store, grid_schema):
+    sessions_data = read_store(sessions_store)
+    measures_data = read_store(measures_store, [])
+    practices_data = read_store(practices_store, [])
+
+    # Only send the column definitions again if the measures or practices changed, the browser
+    # keeps them in the app-level grid schema store across page changes
+    schema = schema_fingerprint(measures_data, practices_data)
+    if grid_schema and grid_schema['schema'] == schema:
+        schema_output = dash.no_update
+    else:
+        schema_output = {'schema': schema, 'columnDefs': generate_column_defs(measures_data, practices_data)}
+
+    if not sessions_data:
+        sessions_data = [DEFAULT_ROW_SESSION]
+        sessions_output = write_store(sessions_data, sessions_store)
+    else:
+        sessions_output = dash.no_update
+
+    # The paged grid requests its rows itself
+    row_data = dash.no_update if PAGED_SESSIONS_GRID else sessions_data
+
+    return row_data, schema, schema_output, sessions_output
+
+# Lay out the columns of the grid from the kept column definitions, see assets/dashClientsideFunctions.js
+clientside_callback(
+    ClientsideFunction(namespace='sessions', function_name='apply_columns'),
     Output('sessions-grid', 'columnDefs'),
-    Output('sessions-alert', 'children'),
-    Output('sessions-alert', 'is_open'),
+    Input('sessions-grid-columns', 'data'),
+    State('sessions-grid-schema', 'data'),
+    prevent_initial_call=True
+)
+
+# Serve a block of rows to the paged grid
+@callback(
+    Output('sessions-grid', 'getRowsResponse'),
+    Input('sessions-grid', 'getRowsRequest'),
+    State('sessions-store', 'data'),
+    prevent_initial_call=True
+)
+def serve_session_rows(request, sessions_store):
+    if not request:
+        raise PreventUpdate
+
+    sessions_data = read_paged_sessions(sessions_store)
+    return {
+        'rowData': sessions_data[request['startRow']:request['endRow']],
+        'rowCount': len(sessions_data)
+    }
+
+# Reload the rows of the paged grid after the server-side record changed
+clientside_callback(
+    ClientsideFunction(namespace='sessions', function_name='refresh_rows'),
+    Output('sessions-grid-refresh', 'data'),
+    Input('sessions-store', 'data'),
+    State('sessions-grid', 'rowModelType'),
+    prevent_initial_call=True
+)
+
+# Collect the rows affected by a change in the browser, see assets/dashClientsideFunctions.js
+clientside_callback(
+    ClientsideFunction(namespace='sessions', function_name='request_delta'),
+    Output('sessions-grid-request', 'data'),
     Input('add-row-sessions-btn', 'n_clicks'),
     Input('delete-row-sessions-btn', 'n_clicks'),
     Input('sessions-grid', 'cellValueChanged'),
-    State('sessions-grid', 'rowData'),
-    State('sessions-grid', 'selectedRows'),
+    State('sessions-store', 'data'),
+    State('sessions-grid', 'rowModelType'),
+    prevent_initial_call=True
+)
+
+@callback(
+    Output('sessions-store', 'data', allow_duplicate=True),
+    Output('sessions-grid', 'rowTransaction'),
+    Output('sessions-grid', 'rowData', allow_duplicate=True),
+    Output('sessions-alert', 'children'),
+    Output('sessions-alert', 'is_open'),
+    Input('sessions-grid-request', 'data'),
+    State('measures-store', 'data'),
+    State('practices-store', 'data'),
+    prevent_initial_call=True
+)
+def update_sessions(request, measures_store, practices_store):
+    if not request:
+        raise PreventUpdate
+
+    measures_data = read_store(measures_store, [])
+    practices_data = read_store(practices_store, [])
+
+    # The paged grid only sends keys, the rows are taken from the server-side record
+    sessions_data = read_store(request['store'], []) if is_handle(request.get('store')) else None
+    if request.get('paged'):
+        request = complete_paged_request(request, sessions_data)
+
+    transaction, operations, alert = session_delta(request, measures_data, practices_data)
+    if request.get('paged'):
+        transaction = dash.no_update
+
+    if not operations:
+        return dash.no_update, transaction, dash.no_update, alert['message'], alert['show']
+
+    # Patch the sessions in the browser store, or update the server-side entry
+    if sessions_data is not None:
+        sessions_store = write_store(apply_operations(sessions_data, operations), request['store'], operations, undoable=True)
+    else:
+        sessions_store = apply_operations(Patch(), operations)
+
+    # A change made on sessions that changed in the meantime is rejected, the grid shows them again
+    if is_handle(sessions_store) and sessions_store.get('rejected'):
+        row_data = dash.no_update if PAGED_SESSIONS_GRID else read_store(sessions_store, [])
+        return sessions_store, dash.no_update, row_data, 'The sessions changed in the meantime, please repeat the change.', True
+
+    return sessions_store, transaction, dash.no_update, alert['message'], alert['show']
+
+# Import sessions from a CSV or TSV file
+@callback(
+    Output('sessions-store', 'data', allow_duplicate=True),
+    Output('sessions-grid', 'rowTransaction', allow_duplicate=True),
+    Output('sessions-grid', 'rowData', allow_duplicate=True),
+    Output('sessions-import-alert', 'children'),
+    Output('sessions-import-alert', 'is_open'),
+    Output('sessions-import-alert', 'color'),
+    Input('import-sessions-btn', 'contents'),
+    State('import-sessions-btn', 'filename'),
     State('measures-store', 'data'),
     State('sessions-store', 'data'),
     State('practices-store', 'data'),
-    prevent_initial_call='initial_duplicate'
+    prevent_initial_call=True
 )
-def update_sessions(add_clicks, delete_clicks, cell_changed, rows, selected_rows, measures_data, sessions_data, practices_data):
-    ctx = dash.callback_context
-    trigger_id = ctx.triggered[0]['prop_id'].split('.')[0]
+def import_sessions_file(contents, filename, measures_store, sessions_store, practices_store):
+    if contents is None:
+        raise PreventUpdate
+
+    measures_data = read_store(measures_store, [])
+    sessions_data = read_store(sessions_store, [])
+    practices_data = read_store(practices_store, [])
+
+    # A record with only an empty first session is replaced, otherwise sessions are added at the end
+    replace = is_blank_record(sessions_data)
+    existing = [] if replace else sessions_data
+
+    try:
+        content_type, content_string = contents.split(',')
+        file = io.TextIOWrapper(io.BytesIO(base64.b64decode(content_string)), encoding='utf-8-sig', newline='')
+        columns, report = import_sessions(
+            file,
+            measures_data,
+            practices_data,
+            last_date=existing[-1]['session_date'] if existing else None,
+            first_number=len(existing) + 1,
+            filename=filename
+        )
+    except ValueError as e:
+        return dash.no_update, dash.no_update, dash.no_update, f'Sessions not imported. {e}', True, 'danger'
+    except (UnicodeDecodeError, csv.Error) as e:
+        print(f"Error importing sessions: {str(e)}")
+        return dash.no_update, dash.no_update, dash.no_update, 'Sessions not imported. Invalid file format.', True, 'danger'
+
+    message = format_import_report(report)
+    color = 'warning' if report['rejected'] or report['ignored_columns'] else 'success'
+    if not report['imported']:
+        return dash.no_update, dash.no_update, dash.no_update, message, True, 'danger'
+
+    new_sessions = columns_to_sessions(columns)
+    if replace:
+        row_data = dash.no_update if PAGED_SESSIONS_GRID else new_sessions
+        return write_store(new_sessions, sessions_store), dash.no_update, row_data, message, True, color
+
+    if is_handle(sessions_store):
+        sessions_output = write_store(existing + new_sessions, sessions_store, [{'op': 'extend', 'rows': new_sessions}], undoable=True)
+    else:
+        sessions_output = Patch()
+        sessions_output.extend(new_sessions)
+
+    transaction = dash.no_update if PAGED_SESSIONS_GRID else {'add': new_sessions}
+    return sessions_output, transaction, dash.no_update, message, True, color
+
+def is_blank_record(sessions_data):
+    '''Check if the sessions are only a first session without any values'''
+    if not sessions_data:
+        return True
+    if len(sessions_data) > 1:
+        return False
+    return not any(value for field, value in sessions_data[0].items() if field not in SESSION_FIELDS)
+
+def format_import_report(report):
+    '''Alert content summarizing an import'''
+    items = []
+    for reason, rejected in report['rejected'].items():
+        rows = ', '.join(str(row) for row in rejected['rows'])
+        more = ', ...' if rejected['count'] > len(rejected['rows']) else ''
+        skipped = '1 row' if rejected['count'] == 1 else f"{rejected['count']} rows"
+        items.append(html.Li(f"{skipped} skipped, {REJECT_REASONS[reason]} (rows {rows}{more})."))
+    if report['ignored_columns']:
+        items.append(html.Li(f"Columns ignored: {', '.join(report['ignored_columns'])}."))
+
+    summary = f"{report['imported']} of {report['total']} sessions imported."
+    return [summary, html.Ul(items, className='mb-0')] if items else summary
+
+# Undo and redo changes of the sessions
+@callback(
+    Output('sessions-store', 'data', allow_duplicate=True),
+    Output('sessions-grid', 'rowData', allow_duplicate=True),
+    Output('sessions-alert', 'children', allow_duplicate=True),
+    Output('sessions-alert', 'is_open', allow_duplicate=True),
+    Input('undo-sessions-btn', 'n_clicks'),
+    Input('redo-sessions-btn', 'n_clicks'),
+    State('sessions-store', 'data'),
+    prevent_initial_call=True
+)
+def undo_redo_sessions(undo_clicks, redo_clicks, sessions_store):
+    if dash.ctx.triggered_id == 'undo-sessions-btn':
+        handle, message = undo_store(sessions_store), 'Nothing to undo.'
+    else:
+        handle, message = redo_store(sessions_store), 'Nothing to redo.'
+
+    if handle is None:
+        return dash.no_update, dash.no_update, message, True
+
+    row_data = dash.no_update if PAGED_SESSIONS_GRID else read_store(handle, [])
+    return handle, row_data, dash.no_update, False
+
+def read_paged_sessions(sessions_store):
+    '''Sessions of a server-side store for serving row blocks, read once per revision.
+    Revisions are never reused, also not after an undo, so a cached revision is never outdated.'''
+    if not is_handle(sessions_store):
+        return read_store(sessions_store, [])
+
+    key = (sessions_store['record_id'], sessions_store['revision'])
+    if key not in paged_sessions_cache:
+        paged_sessions_cache[key] = read_store(sessions_store, [])
+    return paged_sessions_cache[key]
+
+def complete_paged_request(request, sessions_data):
+    '''Add the rows the browser would send for a change to a request of the paged grid'''
+    count = len(sessions_data)
+    request = {**request, 'count': count}
+
+    if request['op'] == 'add':
+        request['last'] = sessions_data[-1] if sessions_data else None
+    elif request['op'] == 'delete':
+        selected = set(request['selected'])
+        positions = [index for index, row in enumerate(sessions_data) if row['session_number'] in selected]
+        if not positions:
+            return {**request, 'op': None}
+        request['start'] = positions[0]
+        request['tail'] = sessions_data[positions[0]:]
+    elif request['op'] == 'edit':
+        indices = sorted({
+            index
+            for change in request['changes']
+            for index in range(change['rowIndex'] - 1, change['rowIndex'] + 2)
+            if 0 <= index < count
+        })
+        request['indices'] = indices
+        request['rows'] = [dict(sessions_data[index]) for index in indices]
+
+    return request
+
+def session_delta(request, measures_data, practices_data):
+    '''Grid transaction and store operations for an add, delete or edit request'''
     alert = {'message': None, 'show': False}
-    columnDefs = generate_column_defs(measures_data, practices_data)
-    updated_sessions = rows or sessions_data or [DEFAULT_ROW_SESSION]
-
-    if trigger_id == 'add-row-sessions-btn':
-        updated_sessions = add_new_session(updated_sessions, columnDefs, practices_data)
-    elif trigger_id == 'delete-row-sessions-btn' and selected_rows:
-        updated_sessions = delete_sessions(updated_sessions, selected_rows)
-        if not updated_sessions:
-            updated_sessions = add_new_session(updated_sessions, columnDefs, practices_data)
-    elif trigger_id == 'sessions-grid' and cell_changed:
-        updated_sessions, alert = validate_and_update_cell(updated_sessions, cell_changed, measures_data, practices_data)
-        
-        if not alert['show']:
-            return updated_sessions, dash.no_update, columnDefs, alert['message'], alert['show']
-    
-    return updated_sessions, updated_sessions, columnDefs, alert['message'], alert['show']
 
+    if request['op'] == 'add':
+        columnDefs = generate_column_defs(measures_data, practices_data)
+        new_row = new_session(request['last'], request['count'] + 1, columnDefs, practices_data)
+        return {'add': [new_row]}, [{'op': 'append', 'row': new_row}], alert
+
+    if request['op'] == 'delete':
+        # Sessions after the first deleted one are renumbered, replace them in the grid and the store
+        start, count = request['start'], request['count']
+        remaining = delete_sessions(request['tail'], request['selected'], first_number=start + 1)
+        if not remaining and start == 0:
+            columnDefs = generate_column_defs(measures_data, practices_data)
+            remaining = [new_session(None, 1, columnDefs, practices_data)]
+
+        transaction = {
+            'remove': [{'session_number': row['session_number']} for row in request['tail']],
+            'add': remaining
+        }
+        operations = [{'op': 'delete', 'index': index} for index in range(count - 1, start - 1, -1)]
+        operations += [{'op': 'append', 'row': row} for row in remaining]
+        return transaction, operations, alert
+
+    if request['op'] == 'edit':
+        # Validate against the neighbouring rows sent along with the changes
+        rows = dict(zip(request['indices'], request['rows']))
+        rows, alert, results = validate_and_update_cell(rows, request['changes'], measures_data, practices_data)
+        operations = [
+            {'op': 'set', 'index': result['rowIndex'], 'field': result['colId'], 'value': result['value']}
+            for result in results
+        ]
+
+        # Rejected values are reverted in the grid as well
+        rejected = dict.fromkeys(result['rowIndex'] for result in results if not result['accepted'])
+        transaction = {'update': [rows[row_index] for row_index in rejected]} if rejected else dash.no_update
+        return transaction, operations, alert
+
+    return dash.no_update, [], alert
+
+@cached(column_defs_cache, key=schema_fingerprint, lock=threading.Lock(), info=True)
 def generate_column_defs(measures_data, practices_data):
+    '''Column definitions of the sessions grid.
+    
+    Results are cached by schema fingerprint and shared between callers, they must not be modified.'''
     
     columnDefs = [
         {
@@ -155,13 +491,13 @@ def generate_column_defs(measures_data, practices_data):
     
     return columnDefs
 
-def add_new_session(sessions, columnDefs, practices_data):
+def new_session(last_session, session_number, columnDefs, practices_data):
     
     new_row = {col['field']: None for col in columnDefs if col['field'] not in ['session_number', 'session_date']}
-    new_row['session_number'] = len(sessions) + 1
+    new_row['session_number'] = session_number
     
-    if sessions:
-        last_session_date = date.fromisoformat(sessions[-1]['session_date'])
+    if last_session:
+        last_session_date = date.fromisoformat(last_session['session_date'])
         new_row['session_date'] = (last_session_date + timedelta(days=1)).isoformat()
     else:
         new_row['session_date'] = date.today().isoformat()
@@ -170,81 +506,148 @@ def add_new_session(sessions, columnDefs, practices_data):
         for practice in practices_data:
             if practice['Name'] != 'New Practice':
                 new_row[practice['Name']] = False
-    return sessions + [new_row]
+    return new_row
 
-def delete_sessions(sessions, selected_rows):
-    updated_sessions = [row for row in sessions if row not in selected_rows]
+def delete_sessions(sessions, selected_numbers, first_number=1):
     
-    if not updated_sessions:
-        return []
-        
-    # Otherwise renumber the remaining sessions
-    for i, row in enumerate(updated_sessions, start=1):
-        row['session_number'] = i
+    # Filter and renumber in a single pass, sessions are identified by their number
+    selected_numbers = set(selected_numbers)
+    updated_sessions = []
+    for row in sessions:
+        if row['session_number'] not in selected_numbers:
+            row['session_number'] = first_number + len(updated_sessions)
+            updated_sessions.append(row)
     return updated_sessions
 
 def validate_and_update_cell(sessions, cell_changed, measures_data, practices_data):
+    '''Validate a batch of cell changes and write the accepted or reverted values into the sessions.
+
+    The sessions are a list, or a dict of the changed rows and their neighbours by row index.
+    Returns the sessions, an alert summarizing the rejected values and the result of each change.'''
     alert = {'message': None, 'show': False}
     
     if not cell_changed:
-        return sessions, alert
-
-    change = cell_changed[0]
-    field = change['colId']
-    new_value = change['value'] if 'value' in change else None
-    row_index = change['rowIndex']
-
-    if field == 'session_date':
-        
-        # Check if the new date maintains chronological order
-        try:
-            new_date = date.fromisoformat(new_value)
-            
-            # Check previous session's date if not first session
-            if row_index > 0:
-                prev_date = date.fromisoformat(sessions[row_index - 1]['session_date'])
-                if new_date <= prev_date:
-                    sessions[row_index][field] = change['oldValue']
-                    alert['message'] = f'Date must be after previous date ({prev_date.isoformat()}).'
-                    alert['show'] = True
-                    return sessions, alert
-            
-            # Check next session's date if not last session
-            if row_index < len(sessions) - 1:
-                next_date = date.fromisoformat(sessions[row_index + 1]['session_date'])
-                if new_date >= next_date:
-                    sessions[row_index][field] = change['oldValue']
-                    alert['message'] = f'Date must be before next date ({next_date.isoformat()}).'
-                    alert['show'] = True
-                    return sessions, alert
-            
-            # If all checks pass, update the date
-            sessions[row_index][field] = new_value
-            
-        except ValueError:
-            sessions[row_index][field] = change['oldValue']
-            alert['message'] = 'Invalid date format. Please use YYYY-MM-DD format.'
-            alert['show'] = True
-            return sessions, alert
-            
-    elif any(measure['Name'] == field for measure in measures_data):
-        measure = next(measure for measure in measures_data if measure['Name'] == field)
-        if new_value is not None and new_value != '':
-            value = float(new_value)
-            min_val = float(measure['Min'])
-            max_val = float(measure['Max']) if measure['Type'] == 'Scale' else float('inf')
-            if min_val <= value <= max_val:
-                sessions[row_index][field] = value
+        return sessions, alert, []
+
+    results = validate_cell_changes(sessions, cell_changed, measures_data, practices_data)
+    for result in results:
+        sessions[result['rowIndex']][result['colId']] = result['value']
+
+    messages = [result['message'] for result in results if result['message']]
+    if len(messages) == 1:
+        alert = {'message': messages[0], 'show': True}
+    elif messages:
+        alert = {
+            'message': [
+                f'{len(messages)} of {len(results)} values were not accepted.',
+                html.Ul([html.Li(message) for message in messages[:MAX_ALERT_MESSAGES]], className='mb-0')
+            ],
+            'show': True
+        }
+
+    return sessions, alert, results
+
+def validate_cell_changes(sessions, cell_changed, measures_data, practices_data):
+    '''Validate cell changes against the measure ranges and the date order in one pass per column type.
+
+    Returns one result per change with the value to keep, whether the change was accepted and an
+    error message. Rejected values are reverted to their old value, empty measure values are cleared.'''
+    results = [
+        {
+            'rowIndex': change['rowIndex'],
+            'colId': change['colId'],
+            'value': change.get('value'),
+            'accepted': True,
+            'message': None
+        }
+        for change in cell_changed
+    ]
+    fields = schema_index(measures_data, practices_data)['fields']
+    kinds = [fields.get(change['colId'], {}).get('kind') for change in cell_changed]
+
+    def reject(position, value, message):
+        results[position].update(value=value, accepted=False, message=message)
+
+    # Measures, checked against their Min and Max
+    measure_positions = [i for i, kind in enumerate(kinds) if kind == 'measure']
+    if measure_positions:
+        definitions = [fields[cell_changed[i]['colId']] for i in measure_positions]
+        raw_values = [cell_changed[i].get('value') for i in measure_positions]
+        values = np.array([to_float(value) for value in raw_values])
+        min_values = np.array([measure['min'] for measure in definitions])
+        max_values = np.array([measure['max'] for measure in definitions])
+        is_empty = np.array([value is None or value == '' for value in raw_values])
+
+        with np.errstate(invalid='ignore'):
+            in_range = (min_values <= values) & (values <= max_values)
+
+        for j in np.flatnonzero(~in_range):
+            i = measure_positions[j]
+            field = cell_changed[i]['colId']
+            if is_empty[j] or np.isnan(values[j]):
+                value = None if is_empty[j] else cell_changed[i].get('oldValue')
+                reject(i, value, f'Invalid value for {field}. Please enter a numerical value and use dots for decimals.')
             else:
-                sessions[row_index][field] = change['oldValue']
-                alert['message'] = f'{value} out of range {min_val} - {max_val} in {field}.'
-                alert['show'] = True
-        else:
-            sessions[row_index][field] = None
-            alert['message'] = f'Invalid value for {field}. Please enter a numerical value and use dots for decimals.'
-            alert['show'] = True
-    
-    elif any(practice['Name'] == field for practice in practices_data):
-        sessions[row_index][field] = bool(new_value)
+                reject(i, cell_changed[i].get('oldValue'), f'{values[j]} out of range {min_values[j]} - {max_values[j]} in {field}.')
+        for j in np.flatnonzero(in_range):
+            results[measure_positions[j]]['value'] = float(values[j])
+
+    # Practices
+    for i, change in enumerate(cell_changed):
+        if kinds[i] == 'practice':
+            results[i]['value'] = bool(change.get('value'))
+
+    # Dates, checked against the previous and next session including other changed dates
+    date_positions = [i for i, kind in enumerate(kinds) if kind == 'session_date']
+    if date_positions:
+        row_indices = np.array([cell_changed[i]['rowIndex'] for i in date_positions])
+        new_dates = np.array([_parse_date(cell_changed[i].get('value')) for i in date_positions], dtype='datetime64[D]')
+
+        for j in np.flatnonzero(np.isnat(new_dates)):
+            i = date_positions[j]
+            reject(i, cell_changed[i].get('oldValue'), 'Invalid date format. Please use YYYY-MM-DD format.')
+
+        # Dates of the rows before the batch, rejected changes fall back to them
+        old_dates = {}
+        for offset in (-1, 1):
+            for row_index in row_indices + offset:
+                row = _row_at(sessions, row_index)
+                old_dates[row_index] = _parse_date(row['session_date']) if row else np.datetime64('NaT')
+        for j, i in enumerate(date_positions):
+            old_dates[row_indices[j]] = _parse_date(cell_changed[i].get('oldValue'))
+
+        # Rejecting a date can invalidate a neighbouring change, repeat until no more are rejected
+        accepted = ~np.isnat(new_dates)
+        while True:
+            dates = dict(old_dates)
+            dates.update(zip(row_indices[accepted], new_dates[accepted]))
+            previous_dates = np.array([dates[row_index - 1] for row_index in row_indices], dtype='datetime64[D]')
+            next_dates = np.array([dates[row_index + 1] for row_index in row_indices], dtype='datetime64[D]')
+
+            after_previous = np.isnat(previous_dates) | (new_dates > previous_dates)
+            before_next = np.isnat(next_dates) | (new_dates < next_dates)
+            rejected = accepted & ~(after_previous & before_next)
+            if not rejected.any():
+                break
+
+            for j in np.flatnonzero(rejected):
+                i = date_positions[j]
+                if not after_previous[j]:
+                    message = f'Date must be after previous date ({previous_dates[j]}).'
+                else:
+                    message = f'Date must be before next date ({next_dates[j]}).'
+                reject(i, cell_changed[i].get('oldValue'), message)
+            accepted &= ~rejected
+
+    return results
+
+def _parse_date(value):
+    try:
+        return np.datetime64(date.fromisoformat(value), 'D')
+    except (TypeError, ValueError):
+        return np.datetime64('NaT')
 
-    return sessions, alert
\ No newline at end of file
+def _row_at(sessions, row_index):
+    if isinstance(sessions, dict):
+        return sessions.get(row_index)
+    return sessions[row_index] if 0 <= row_index < len(sessions) else None
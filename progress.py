@@ -0,0 +1,53 @@
+import json
+import os
+import re
+import uuid
+from globals import PROGRESS_DIR
+
+# Task progress
+#
+# Long running callbacks, such as loading a record or importing record files, report their progress
+# under a task ID chosen by the browser. The progress is kept in a small JSON file per task in
+# PROGRESS_DIR, so the interval callback showing it on the page can run in any worker of the server.
+# The file is removed when the task is done.
+
+TASK_ID = re.compile(r'[0-9a-f]{32}')
+
+def _progress_path(task_id):
+    # Task IDs come from the browser and must not name other files
+    if not isinstance(task_id, str) or not TASK_ID.fullmatch(task_id):
+        return None
+    return os.path.join(PROGRESS_DIR, f'{task_id}.json')
+
+def report_progress(task_id, value, label=''):
+    '''Record the progress of a task, value in percent'''
+    path = _progress_path(task_id)
+    if path is None:
+        return
+
+    os.makedirs(PROGRESS_DIR, exist_ok=True)
+    temp_path = f'{path}.{uuid.uuid4().hex}.tmp'
+    with open(temp_path, 'w', encoding='utf-8') as file:
+        json.dump({'value': value, 'label': label}, file)
+    os.replace(temp_path, path)
+
+def read_progress(task_id):
+    '''Progress {'value': percent, 'label': text} of a task, or None if it has not reported any'''
+    path = _progress_path(task_id)
+    if path is None:
+        return None
+    try:
+        with open(path, encoding='utf-8') as file:
+            return json.load(file)
+    except (FileNotFoundError, json.JSONDecodeError):
+        return None
+
+def clear_progress(task_id):
+    '''Remove the progress of a finished task'''
+    path = _progress_path(task_id)
+    if path is None:
+        return
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
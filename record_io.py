@@ -0,0 +1,333 @@
+import base64
+import codecs
+import gzip
+import io
+import itertools
+import json
+import re
+import struct
+import zlib
+import numpy as np
+from globals import UPLOAD_CHUNK_SIZE, MAX_RECORD_SIZE
+from records import sessions_to_columns, columns_to_sessions
+
+# Streaming record reader
+#
+# Uploaded records arrive as a base64 data URL. upload_chunks decodes it in chunks of
+# UPLOAD_CHUNK_SIZE characters and decompresses gzip compressed records on the fly. read_record
+# parses the JSON object from the decoded text, reading the list sections one item at a time and
+# converting the items in batches as they are read. Besides the upload itself, only the resulting
+# record, the current chunk and the current batch are held in memory.
+
+# Binary record format
+#
+# A compact alternative to the JSON record, with the sessions stored as columns:
+#
+#   magic b'PSYD', format version (uint16), header length (uint32), all little-endian
+#   header: JSON object with all sections except the sessions, and the session layout
+#       {'count': n, 'fields': [...], 'measures': [...], 'practices': [...], 'other': {name: values},
+#        'sparse': [...]}
+#   session numbers: n int64
+#   session dates: n int32 days since 1970-01-01, missing dates as MISSING_DAY
+#   measures: n float64 per measure, missing values as NaN
+#   practices: n bits per practice, packed into bytes
+#   sparse fields: n bits per field that is missing from some sessions, set where it is present
+#
+# Readers reject versions newer than BINARY_FORMAT_VERSION. Version 1 has no sparse fields.
+#
+# Both formats can be gzip compressed, compressed records are recognized by GZIP_MAGIC.
+
+BINARY_MAGIC = b'PSYD'
+BINARY_FORMAT_VERSION = 2
+BINARY_PREFIX = struct.Struct('<4sHI')
+MISSING_DAY = np.iinfo(np.int32).min
+
+GZIP_MAGIC = b'\x1f\x8b'
+
+WHITESPACE = re.compile(r'[ \t\n\r]*')
+
+# Number of progress reports per upload
+PROGRESS_STEPS = 10
+
+# Number of items of a list section converted at once
+READ_BATCH_SIZE = 1000
+
+_decoder = json.JSONDecoder()
+
+def upload_chunks(contents, chunk_size=UPLOAD_CHUNK_SIZE, progress=None):
+    '''Yield the bytes of a base64 data URL in chunks, decompressed if gzip compressed.
+
+    If the upload has more than one chunk, progress(done, total) is called with the number of
+    decoded characters for every PROGRESS_STEPS-th part of the upload.'''
+    chunks = _base64_chunks(contents, chunk_size, progress)
+    prefix, chunks = peek_chunks(chunks, len(GZIP_MAGIC))
+    return decompress_chunks(chunks) if prefix == GZIP_MAGIC else chunks
+
+def _base64_chunks(contents, chunk_size, progress):
+    start = contents.index(',') + 1
+    total = len(contents) - start
+    reported = 0
+
+    # Chunks of whole base64 quantums decode independently
+    chunk_size -= chunk_size % 4
+    for position in range(start, len(contents), chunk_size):
+        yield base64.b64decode(contents[position:position + chunk_size])
+        done = min(position + chunk_size - start, total)
+        if progress and total > chunk_size and done * PROGRESS_STEPS // total > reported:
+            reported = done * PROGRESS_STEPS // total
+            progress(done, total)
+
+def peek_chunks(chunks, size):
+    '''Return the first size bytes of byte chunks, and the chunks including them'''
+    chunks = iter(chunks)
+    peeked = []
+    prefix = b''
+    while len(prefix) < size:
+        chunk = next(chunks, None)
+        if chunk is None:
+            break
+        peeked.append(chunk)
+        prefix += chunk[:size - len(prefix)]
+    return prefix, itertools.chain(peeked, chunks)
+
+def decompress_chunks(chunks, chunk_size=UPLOAD_CHUNK_SIZE, limit=MAX_RECORD_SIZE):
+    '''Yield the decompressed bytes of gzip compressed chunks, at most chunk_size bytes at once.
+    Raises ValueError once more than limit bytes are decompressed.'''
+    decompressor = zlib.decompressobj(wbits=zlib.MAX_WBITS | 16)
+    size = 0
+    for chunk in chunks:
+        while chunk:
+            data = decompressor.decompress(chunk, chunk_size)
+            size += len(data)
+            if size > limit:
+                raise ValueError('The decompressed record is too large.')
+            yield data
+            if not decompressor.eof:
+                chunk = decompressor.unconsumed_tail
+            else:
+                # A gzip file can hold several members
+                chunk = decompressor.unused_data
+                if chunk:
+                    decompressor = zlib.decompressobj(wbits=zlib.MAX_WBITS | 16)
+    yield decompressor.flush()
+    if not decompressor.eof:
+        raise ValueError('The compressed record is incomplete.')
+
+def decode_text(chunks):
+    '''Yield the UTF-8 text of byte chunks'''
+    text_decoder = codecs.getincrementaldecoder('utf-8')()
+    for chunk in chunks:
+        yield text_decoder.decode(chunk)
+    yield text_decoder.decode(b'', final=True)
+
+def read_record(chunks, read_items=None, batch_size=READ_BATCH_SIZE):
+    '''Parse a JSON object from text chunks.
+
+    Values that are lists are parsed item by item. For every batch_size items,
+    read_items(section, items, record) is called with the record read so far and returns the items
+    to keep, or the items themselves are kept if read_items is None.
+    Raises json.JSONDecodeError for invalid JSON and ValueError if it is not an object.'''
+    chunks = iter(chunks)
+    state = {'buffer': '', 'position': 0}
+
+    def fill():
+        chunk = next(chunks, None)
+        if chunk is None:
+            return False
+        state['buffer'] = state['buffer'][state['position']:] + chunk
+        state['position'] = 0
+        return True
+
+    def peek():
+        # Next character after whitespace, empty at the end of the text
+        while True:
+            state['position'] = WHITESPACE.match(state['buffer'], state['position']).end()
+            if state['position'] < len(state['buffer']):
+                return state['buffer'][state['position']]
+            if not fill():
+                return ''
+
+    def expect(characters):
+        character = peek()
+        if not character or character not in characters:
+            raise json.JSONDecodeError(f'Expecting {" or ".join(characters)}', state['buffer'], state['position'])
+        state['position'] += 1
+        return character
+
+    def parse_value():
+        peek()
+        while True:
+            try:
+                value, end = _decoder.raw_decode(state['buffer'], state['position'])
+            except json.JSONDecodeError:
+                # The value may continue in the next chunk
+                if fill():
+                    continue
+                raise
+            # A number at the end of the buffer may continue in the next chunk
+            if end == len(state['buffer']) and fill():
+                continue
+            state['position'] = end
+            return value
+
+    record = {}
+    if peek() != '{':
+        parse_value()
+        raise ValueError('The record is not a JSON object.')
+    expect('{')
+
+    if peek() == '}':
+        state['position'] += 1
+    else:
+        while True:
+            section = parse_value()
+            if not isinstance(section, str):
+                raise json.JSONDecodeError('Expecting property name', state['buffer'], state['position'])
+            expect(':')
+
+            if peek() == '[':
+                state['position'] += 1
+                record[section] = items = []
+                batch = []
+                if peek() == ']':
+                    state['position'] += 1
+                else:
+                    while True:
+                        batch.append(parse_value())
+                        end = expect(',]') == ']'
+                        if len(batch) == batch_size or end:
+                            items.extend(read_items(section, batch, record) if read_items else batch)
+                            batch = []
+                        if end:
+                            break
+            else:
+                record[section] = parse_value()
+
+            if expect(',}') == '}':
+                break
+
+    if peek():
+        raise json.JSONDecodeError('Extra data', state['buffer'], state['position'])
+
+    return record
+
+def parse_record_bytes(data, limit=MAX_RECORD_SIZE):
+    '''Parse the contents of a record file in the JSON or the binary format, compressed or not.
+    Raises ValueError if a compressed record decompresses to more than limit bytes.'''
+    if data[:len(GZIP_MAGIC)] == GZIP_MAGIC:
+        data = b''.join(decompress_chunks([data], limit=limit))
+    if data[:len(BINARY_MAGIC)] == BINARY_MAGIC:
+        return read_binary_record(data)
+    return json.loads(data)
+
+def write_record(record, record_format='json', compress=False):
+    '''Encode a sanitized record in the JSON or the binary format, gzip compressed if compress.
+    Compressed records are written to the compressor piece by piece, without an uncompressed copy.'''
+    buffer = io.BytesIO()
+    file = gzip.GzipFile(fileobj=buffer, mode='wb', mtime=0) if compress else buffer
+
+    if record_format == 'binary':
+        write_binary_record(record, file)
+    else:
+        text = io.TextIOWrapper(file, encoding='utf-8')
+        json.dump(record, text, indent=2)
+        text.flush()
+        text.detach()
+
+    if compress:
+        file.close()
+    return buffer.getvalue()
+
+def write_binary_record(record, file):
+    '''Write a sanitized record in the binary record format to a binary file'''
+    header = {section: value for section, value in record.items() if section != 'sessions'}
+    arrays = []
+
+    if 'sessions' in record:
+        sessions = record['sessions']
+        columns = sessions_to_columns(sessions, record.get('measures', []), record.get('practices', []))
+        dates = columns['session_date']
+        days = np.where(np.isnat(dates), MISSING_DAY, dates.astype(np.int64))
+
+        # Fields are filled in for all sessions, so note where sessions such as empty ones lack them
+        fields = columns['fields']
+        if all(len(session) == len(fields) for session in sessions):
+            sparse = []
+        else:
+            sparse = [field for field in fields if any(field not in session for session in sessions)]
+
+        header['sessions'] = {
+            'count': len(dates),
+            'fields': fields,
+            'measures': list(columns['measures']),
+            'practices': list(columns['practices']),
+            'other': columns['other'],
+            'sparse': sparse,
+        }
+        arrays = [columns['session_number'].astype('<i8'), days.astype('<i4')]
+        arrays += [values.astype('<f8') for values in columns['measures'].values()]
+        arrays += [np.packbits(values) for values in columns['practices'].values()]
+        arrays += [
+            np.packbits(np.fromiter((field in session for session in sessions), dtype=bool, count=len(sessions)))
+            for field in sparse
+        ]
+
+    encoded_header = json.dumps(header, separators=(',', ':')).encode('utf-8')
+    file.write(BINARY_PREFIX.pack(BINARY_MAGIC, BINARY_FORMAT_VERSION, len(encoded_header)))
+    file.write(encoded_header)
+    for array in arrays:
+        file.write(array.tobytes())
+
+def read_binary_record(data):
+    '''Decode a record in the binary record format into the JSON record structure.
+    Raises ValueError if the data is not a binary record or from a newer version.'''
+    if len(data) < BINARY_PREFIX.size:
+        raise ValueError('The record is not in the binary format.')
+    magic, version, header_size = BINARY_PREFIX.unpack_from(data)
+    if magic != BINARY_MAGIC:
+        raise ValueError('The record is not in the binary format.')
+    if version > BINARY_FORMAT_VERSION:
+        raise ValueError(f'Binary record format version {version} is not supported.')
+
+    offset = BINARY_PREFIX.size
+    record = json.loads(bytes(data[offset:offset + header_size]).decode('utf-8'))
+    offset += header_size
+
+    if 'sessions' in record:
+        layout = record['sessions']
+        count = layout['count']
+
+        def read_array(dtype, size):
+            nonlocal offset
+            array = np.frombuffer(data, dtype=dtype, count=size, offset=offset)
+            offset += array.nbytes
+            return array
+
+        session_numbers = read_array('<i8', count).astype(np.int64)
+        days = read_array('<i4', count)
+        dates = days.astype(np.int64).astype('datetime64[D]')
+        dates[days == MISSING_DAY] = np.datetime64('NaT')
+        measures = {name: read_array('<f8', count).astype(np.float64) for name in layout['measures']}
+        practices = {
+            name: np.unpackbits(read_array(np.uint8, (count + 7) // 8), count=count).astype(bool)
+            for name in layout['practices']
+        }
+        present = {
+            field: np.unpackbits(read_array(np.uint8, (count + 7) // 8), count=count).astype(bool)
+            for field in layout.get('sparse', [])
+        }
+
+        sessions = columns_to_sessions({
+            'session_number': session_numbers,
+            'session_date': dates,
+            'measures': measures,
+            'practices': practices,
+            'other': layout['other'],
+            'fields': layout['fields'],
+        })
+        for field, field_present in present.items():
+            for index in np.flatnonzero(~field_present):
+                del sessions[index][field]
+        record['sessions'] = sessions
+
+    return record
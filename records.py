@@ -0,0 +1,251 @@
+import hashlib
+import json
+import threading
+from datetime import date
+import numpy as np
+from cachetools import LRUCache, cached
+
+# Session arrays
+#
+# The stores hold sessions as a list of dicts keyed by measure and practice names, and that list is
+# what callbacks receive and what record operations change. Computations that need whole columns,
+# such as the dashboard figure or the binary record format, convert the sessions into one array per
+# column when they run. The arrays are not kept between callbacks:
+#
+#   {
+#       'session_number': int64 array,
+#       'session_date': datetime64[D] array,
+#       'measures': {name: float64 array, missing values as NaN},
+#       'practices': {name: bool array},
+#       'other': {name: list of values of fields not defined as measure or practice},
+#       'fields': field names in the order of the session dicts,
+#   }
+
+SESSION_FIELDS = ['session_number', 'session_date']
+
+# Schema indexes by schema fingerprint
+schema_cache = LRUCache(maxsize=64)
+
+def measure_names(measures_data):
+    '''Names of the defined measures'''
+    return [measure['Name'] for measure in measures_data if measure['Name'] != 'New Measure']
+
+def practice_names(practices_data):
+    '''Names of the defined practices'''
+    return [practice['Name'] for practice in practices_data if practice['Name'] != 'New Practice']
+
+def to_float(value):
+    '''Convert a session value to float, missing values become NaN'''
+    if value is None or value == '':
+        return np.nan
+    try:
+        return float(value)
+    except (ValueError, TypeError):
+        return np.nan
+
+def measure_column(sessions_data, name):
+    '''Values of a single measure as float array'''
+    return np.fromiter((to_float(session.get(name)) for session in sessions_data), dtype=np.float64, count=len(sessions_data))
+
+def practice_column(sessions_data, name):
+    '''Values of a single practice as bool array'''
+    return np.fromiter((bool(session.get(name)) for session in sessions_data), dtype=bool, count=len(sessions_data))
+
+def date_column(sessions_data):
+    '''Session dates as datetime64 array, missing dates become NaT'''
+    return np.array([session.get('session_date') or 'NaT' for session in sessions_data], dtype='datetime64[D]')
+
+def parse_dates(values):
+    '''Parse ISO dates (YYYY-MM-DD) into a datetime64 array, invalid or missing dates become NaT'''
+    values = np.char.strip(np.asarray(values, dtype=str))
+    try:
+        dates = values.astype('datetime64[D]')
+    except ValueError:
+        dates = np.array([_parse_date(value) for value in values], dtype='datetime64[D]')
+
+    # numpy also accepts partial dates such as 2020-01, which are not valid session dates
+    return np.where(np.char.str_len(values) == 10, dates, np.datetime64('NaT'))
+
+def _parse_date(value):
+    try:
+        return np.datetime64(date.fromisoformat(value), 'D')
+    except ValueError:
+        return np.datetime64('NaT')
+
+def sessions_to_columns(sessions_data, measures_data, practices_data):
+    '''Convert the sessions of a record into session arrays'''
+    sessions_data = sessions_data or []
+    measures = measure_names(measures_data)
+    practices = practice_names(practices_data)
+
+    # Keep the field order of the sessions to restore it when converting back
+    fields = dict.fromkeys(SESSION_FIELDS)
+    for session in sessions_data:
+        fields.update(dict.fromkeys(session))
+    fields.update(dict.fromkeys(measures + practices))
+    other = [field for field in fields if field not in SESSION_FIELDS and field not in measures and field not in practices]
+
+    return {
+        'session_number': np.fromiter(
+            (session.get('session_number') or 0 for session in sessions_data), dtype=np.int64, count=len(sessions_data)
+        ),
+        'session_date': date_column(sessions_data),
+        'measures': {name: measure_column(sessions_data, name) for name in measures},
+        'practices': {name: practice_column(sessions_data, name) for name in practices},
+        'other': {name: [session.get(name) for session in sessions_data] for name in other},
+        'fields': list(fields),
+    }
+
+def columns_to_sessions(columns):
+    '''Convert session arrays back into the list of session dicts'''
+    session_numbers = columns['session_number'].tolist()
+    session_dates = [None if np.isnat(value) else str(value) for value in columns['session_date']]
+    measures = {
+        name: [None if np.isnan(value) else value for value in values.tolist()]
+        for name, values in columns['measures'].items()
+    }
+    practices = {name: values.tolist() for name, values in columns['practices'].items()}
+
+    values_by_field = {'session_number': session_numbers, 'session_date': session_dates, **measures, **practices, **columns['other']}
+    fields = [field for field in columns['fields'] if field in values_by_field]
+
+    return [
+        {field: values_by_field[field][index] for field in fields}
+        for index in range(len(session_numbers))
+    ]
+
+def session_days(columns):
+    '''Days since the first session, starting at 1'''
+    dates = columns['session_date']
+    valid_dates = dates[~np.isnat(dates)]
+    if not len(valid_dates):
+        return np.ones(len(dates), dtype=np.int64)
+    return (dates - valid_dates.min()).astype(np.int64) + 1
+
+def schema_fingerprint(measures_data, practices_data):
+    '''Hash of the measure and practice definitions that determine the session columns'''
+    schema = [
+        [[measure['Name'], measure['Type'], measure['Min'], measure['Max'], measure['Rater']] for measure in measures_data or []],
+        [practice['Name'] for practice in practices_data or []],
+    ]
+    encoded = json.dumps(schema, separators=(',', ':'), default=str)
+    return hashlib.sha256(encoded.encode('utf-8')).hexdigest()
+
+@cached(schema_cache, key=schema_fingerprint, lock=threading.Lock(), info=True)
+def schema_index(measures_data, practices_data):
+    '''Index of the session fields by name, built once per schema.
+
+    'fields' maps each field to its kind ('session_number', 'session_date', 'measure' or 'practice'),
+    measures also to their Type, bounds and Rater. Count measures have no upper bound.
+    'raters' maps each rater to the positions of its measures in measures_data.
+    The index is shared between callers and must not be modified.'''
+    fields = {field: {'kind': field} for field in SESSION_FIELDS}
+
+    # Measures take precedence over practices of the same name
+    for name in practice_names(practices_data or []):
+        fields[name] = {'kind': 'practice'}
+    for measure in measures_data or []:
+        if measure['Name'] != 'New Measure':
+            fields[measure['Name']] = {
+                'kind': 'measure',
+                'type': measure['Type'],
+                'min': to_float(measure['Min']),
+                'max': to_float(measure['Max']) if measure['Type'] == 'Scale' else np.inf,
+                'rater': measure['Rater'],
+            }
+
+    raters = {}
+    for position, measure in enumerate(measures_data or []):
+        raters.setdefault(measure['Rater'], []).append(position)
+
+    return {
+        'fields': fields,
+        'measures': measure_names(measures_data or []),
+        'practices': [name for name, field in fields.items() if field['kind'] == 'practice'],
+        'raters': raters,
+    }
+
+def measure_index(measures_data):
+    '''Map measure names to their definitions'''
+    return {measure['Name']: measure for measure in measures_data if measure['Name'] != 'New Measure'}
+
+def normalize_measures(measure_values, measures_by_name, names):
+    '''Normalize the given measures to their Min - Max range in one vectorized pass.
+
+    Scale measures use their defined Max, Count measures the maximum observed value.
+    Only the given measures are copied, the result maps each name to its normalized array.'''
+    names = [name for name in names if name in measure_values and name in measures_by_name]
+    if not names:
+        return {}
+
+    values = np.vstack([measure_values[name] for name in names])
+    definitions = [measures_by_name[name] for name in names]
+    min_values = np.array([to_float(measure['Min']) for measure in definitions])
+    max_values = np.array([to_float(measure['Max']) for measure in definitions])
+
+    # fmax ignores missing values and keeps NaN for measures without any values
+    is_count = np.array([measure['Type'] == 'Count' for measure in definitions])
+    observed_max = np.fmax.reduce(values, axis=1)
+    max_values = np.where(is_count, observed_max, max_values)
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        normalized = (values - min_values[:, None]) / (max_values - min_values)[:, None]
+
+    return dict(zip(names, normalized))
+
+# Record operations
+#
+# Changes of a list of rows, such as the sessions, expressed as operations. They are applied to
+# the store data or to a dash.Patch of it, and kept in the journal of server-side stores:
+#
+#   {'op': 'set', 'index': i, 'field': name, 'value': value}
+#   {'op': 'append', 'row': row}
+#   {'op': 'extend', 'rows': rows}
+#   {'op': 'delete', 'index': i}
+#   {'op': 'rename_field', 'old': name, 'new': name, 'default': value}
+#   {'op': 'drop_fields', 'fields': names}
+#   {'op': 'order_fields', 'fields': names}
+#   {'op': 'clear_out_of_range', 'field': name, 'min': value, 'max': value}
+#
+# Only set, append, extend and delete can be applied to a dash.Patch.
+
+def apply_operations(rows, operations, recorded=None):
+    '''Apply operations to a list of rows in place, and add them to the recorded operations if given'''
+    if recorded is not None:
+        recorded.extend(operations)
+
+    for operation in operations:
+        op = operation['op']
+        if op == 'set':
+            rows[operation['index']][operation['field']] = operation['value']
+        elif op == 'append':
+            rows.append(operation['row'])
+        elif op == 'extend':
+            rows.extend(operation['rows'])
+        elif op == 'delete':
+            del rows[operation['index']]
+        elif op == 'rename_field':
+            # The renamed field moves to the end, rows without it get the default value
+            old, new = operation['old'], operation['new']
+            for row in rows:
+                row[new] = row.pop(old) if old in row else operation['default']
+        elif op == 'drop_fields':
+            for row in rows:
+                for field in operation['fields']:
+                    row.pop(field, None)
+        elif op == 'order_fields':
+            # The fields move to the end in the given order, missing fields become None
+            fields = operation['fields']
+            ordered = set(fields)
+            for index, row in enumerate(rows):
+                reordered = {key: value for key, value in row.items() if key not in ordered}
+                reordered.update((field, row.get(field)) for field in fields)
+                rows[index] = reordered
+        elif op == 'clear_out_of_range':
+            field = operation['field']
+            values = measure_column(rows, field)
+            for index in np.flatnonzero((values < operation['min']) | (values > operation['max'])):
+                rows[index][field] = None
+        else:
+            raise ValueError(f'Unknown operation {op!r}')
+    return rows
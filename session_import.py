@@ -0,0 +1,197 @@
+import csv
+import numpy as np
+from globals import IMPORT_CHUNK_ROWS
+from records import SESSION_FIELDS, schema_index, to_float, parse_dates
+
+# Session import from CSV and TSV files
+#
+# The file is read in chunks of IMPORT_CHUNK_ROWS rows. Each chunk is turned into one array per
+# column and validated at once with the rules of the sessions grid: valid dates in increasing
+# order after the last existing session, and measure values within their Min - Max range.
+# Accepted rows are returned as session arrays, see records.py.
+
+# Header names of the date column and of ignored session number columns, compared in lower case
+DATE_COLUMNS = ['session_date', 'date']
+SESSION_NUMBER_COLUMNS = ['session_number', 'session']
+
+# Cell values that mark a practice as implemented, compared in lower case
+TRUE_VALUES = ['1', '1.0', 'true', 'yes', 'y', 'x']
+
+# Bytes read to detect the delimiter
+SNIFF_SIZE = 4096
+
+# Row numbers listed per reason in the import report
+MAX_REPORTED_ROWS = 10
+
+REJECT_REASONS = {
+    'date': 'invalid or missing date',
+    'order': 'date not after the previous session',
+    'value': 'measure value invalid or out of range',
+}
+
+def detect_delimiter(filename, sample):
+    '''Tab for .tsv files, otherwise the delimiter found in the first lines'''
+    if filename and filename.lower().endswith('.tsv'):
+        return '\t'
+    try:
+        return csv.Sniffer().sniff(sample, delimiters=',;\t').delimiter
+    except csv.Error:
+        return ','
+
+def map_columns(header, schema):
+    '''Match the header to the date column, measures and practices of a schema index by name'''
+    measures = {name.strip().lower(): name for name in schema['measures']}
+    practices = {name.strip().lower(): name for name in schema['practices']}
+    mapping = {'date': None, 'measures': {}, 'practices': {}, 'ignored': []}
+
+    for index, column in enumerate(header):
+        key = column.strip().lower()
+        if key in DATE_COLUMNS and mapping['date'] is None:
+            mapping['date'] = index
+        elif key in measures and measures[key] not in mapping['measures']:
+            mapping['measures'][measures[key]] = index
+        elif key in practices and practices[key] not in mapping['practices']:
+            mapping['practices'][practices[key]] = index
+        elif key not in SESSION_NUMBER_COLUMNS:
+            mapping['ignored'].append(column)
+
+    return mapping
+
+def read_chunks(reader, chunk_rows=IMPORT_CHUNK_ROWS):
+    '''Yield the line numbers and rows of a csv reader in chunks, skipping blank rows'''
+    lines, rows = [], []
+    for row in reader:
+        if not any(cell.strip() for cell in row):
+            continue
+        lines.append(reader.line_num)
+        rows.append(row)
+        if len(rows) == chunk_rows:
+            yield np.array(lines), rows
+            lines, rows = [], []
+    if rows:
+        yield np.array(lines), rows
+
+def _parse_numbers(cells):
+    # Convert a whole column at once, cell by cell only if it contains text or blanks
+    blank = cells == ''
+    try:
+        return np.where(blank, 'nan', cells).astype(np.float64), blank
+    except ValueError:
+        blank = np.array([not cell.strip() for cell in cells], dtype=bool)
+        return np.array([to_float(cell) for cell in cells]), blank
+
+def _parse_flags(cells):
+    # Look up each distinct value once
+    unique_cells, inverse = np.unique(cells, return_inverse=True)
+    is_true = np.array([cell.strip().lower() in TRUE_VALUES for cell in unique_cells], dtype=bool)
+    return is_true[inverse]
+
+def import_sessions(file, measures_data, practices_data, last_date=None, first_number=1, filename=None, chunk_rows=IMPORT_CHUNK_ROWS):
+    '''Read sessions from a CSV or TSV text file.
+
+    Returns the accepted sessions as columns numbered from first_number, and a report with the
+    number of imported rows, the rejected rows by reason and the ignored columns.
+    Raises ValueError if the file has no header or no date column.'''
+    sample = file.read(SNIFF_SIZE)
+    file.seek(0)
+    reader = csv.reader(file, delimiter=detect_delimiter(filename, sample))
+
+    header = next(reader, None)
+    if not header:
+        raise ValueError('The file is empty.')
+    schema = schema_index(measures_data, practices_data)
+    mapping = map_columns(header, schema)
+    if mapping['date'] is None:
+        raise ValueError('No date column found. Name the column Date or session_date.')
+
+    # Ranges of the imported measures, Count measures have no upper limit
+    imported_measures = list(mapping['measures'])
+    min_values = np.array([schema['fields'][name]['min'] for name in imported_measures])[:, None]
+    max_values = np.array([schema['fields'][name]['max'] for name in imported_measures])[:, None]
+
+    # Dates as days since epoch, the first imported date has to be after the last existing session
+    last_day = parse_dates([last_date or '']).astype(np.int64)[0]
+    if last_day == np.datetime64('NaT').astype(np.int64):
+        last_day = np.iinfo(np.int64).min
+
+    accepted_dates = []
+    accepted_measures = {name: [] for name in imported_measures}
+    accepted_practices = {name: [] for name in mapping['practices']}
+    rejected = {reason: [] for reason in REJECT_REASONS}
+    total = 0
+
+    for lines, rows in read_chunks(reader, chunk_rows):
+        total += len(rows)
+        width = max(len(header), max(len(row) for row in rows))
+        table = np.array([row + [''] * (width - len(row)) for row in rows], dtype=str)
+
+        dates = parse_dates(table[:, mapping['date']])
+        invalid_date = np.isnat(dates)
+
+        # Empty cells are missing values, anything else has to be a number within the range
+        cells = table[:, [mapping['measures'][name] for name in imported_measures]].T
+        parsed = [_parse_numbers(column) for column in cells]
+        values = np.array([column_values for column_values, _ in parsed]).reshape(cells.shape)
+        empty = np.array([blank for _, blank in parsed], dtype=bool).reshape(cells.shape)
+        with np.errstate(invalid='ignore'):
+            valid_values = empty | (np.isfinite(values) & (min_values <= values) & (values <= max_values))
+        invalid_value = ~invalid_date & ~valid_values.all(axis=0)
+
+        # A date has to be after all previously accepted dates. Dates out of order never raise the
+        # running maximum, so comparing with the maximum of all candidates matches the row by row check.
+        candidates = np.flatnonzero(~invalid_date & ~invalid_value)
+        days = dates[candidates].astype(np.int64)
+        previous_days = np.maximum.accumulate(np.concatenate(([last_day], days)))[:-1]
+        in_order = days > previous_days
+        if days.size:
+            last_day = max(last_day, days.max())
+
+        accepted = np.zeros(len(rows), dtype=bool)
+        accepted[candidates[in_order]] = True
+        wrong_order = np.zeros(len(rows), dtype=bool)
+        wrong_order[candidates[~in_order]] = True
+
+        rejected['date'].append(lines[invalid_date])
+        rejected['value'].append(lines[invalid_value])
+        rejected['order'].append(lines[wrong_order])
+
+        accepted_dates.append(dates[accepted])
+        values[empty] = np.nan
+        for position, name in enumerate(imported_measures):
+            accepted_measures[name].append(values[position, accepted])
+        for name, index in mapping['practices'].items():
+            accepted_practices[name].append(_parse_flags(table[accepted, index]))
+
+    session_dates = np.concatenate(accepted_dates) if accepted_dates else np.array([], dtype='datetime64[D]')
+    count = len(session_dates)
+
+    # Measures and practices missing in the file stay empty
+    measures = schema['measures']
+    practices = schema['practices']
+    columns = {
+        'session_number': np.arange(first_number, first_number + count, dtype=np.int64),
+        'session_date': session_dates,
+        'measures': {
+            name: np.concatenate(accepted_measures[name]) if name in accepted_measures and count else np.full(count, np.nan)
+            for name in measures
+        },
+        'practices': {
+            name: np.concatenate(accepted_practices[name]) if name in accepted_practices and count else np.zeros(count, dtype=bool)
+            for name in practices
+        },
+        'other': {},
+        'fields': SESSION_FIELDS + measures + practices,
+    }
+
+    report = {
+        'total': total,
+        'imported': count,
+        'rejected': {},
+        'ignored_columns': mapping['ignored'],
+    }
+    for reason, chunks in rejected.items():
+        lines = np.concatenate(chunks) if chunks else np.array([], dtype=np.int64)
+        if lines.size:
+            report['rejected'][reason] = {'count': int(lines.size), 'rows': lines[:MAX_REPORTED_ROWS].tolist()}
+
+    return columns, report
@@ -0,0 +1,305 @@
+import json
+import os
+import threading
+import time
+import uuid
+from globals import SERVER_SIDE_STORE, RECORD_STORE_DIR, RECORD_STORE_MAX_ENTRIES, RECORD_STORE_TTL, JOURNAL_SNAPSHOT_INTERVAL, UNDO_DEPTH
+from records import apply_operations
+
+# Server-side store
+#
+# With SERVER_SIDE_STORE enabled, the dcc.Stores only hold a handle {'record_id': ..., 'revision': ...}
+# and the data lives in a JSON file per store entry in RECORD_STORE_DIR. The files are shared by all
+# workers and evicted when unused for RECORD_STORE_TTL seconds or when there are more than
+# RECORD_STORE_MAX_ENTRIES. Without it, read_store and write_store pass the data through unchanged.
+#
+# Changes given as record operations (see records.py) are appended to a journal next to the entry,
+# one JSON line per revision, instead of rewriting the entry. The entry is a snapshot, and the journal
+# holds the changes after it and cursor lines written by undo_store and redo_store. The data of the
+# entry is the snapshot with the changes applied up to the head: the change of the last line, or the
+# change a cursor line points to. Every JOURNAL_SNAPSHOT_INTERVAL changes the journal is compacted
+# into a new snapshot, keeping the last UNDO_DEPTH changes before the head for undo.
+#
+# Revision numbers increase with every write, undo and redo and are never reused, so a handle names
+# one state of the entry. Handles only tell the browser that the data changed, reads always return the
+# data at the head. Changes written with an outdated handle are applied on top of the head, as long as
+# their operations still apply, otherwise they are rejected.
+#
+# Operations addressing rows by index only apply to the rows they were made for. Every snapshot and
+# journal line records the layout of the rows at its revision: the revision of the last change that
+# added or removed rows. A change with index operations from an outdated handle is rejected if the
+# layout changed since, or is no longer known, as the indices may point to other rows by now.
+
+# Number of writes between evictions
+EVICTION_INTERVAL = 50
+
+# Operations that address rows by index, and operations that add or remove rows
+INDEX_OPERATIONS = {'set', 'delete'}
+LAYOUT_OPERATIONS = {'append', 'extend', 'delete'}
+
+_writes = 0
+_writes_lock = threading.Lock()
+
+# Serializes changes of the journals within a worker
+_journal_lock = threading.Lock()
+
+def is_handle(data):
+    '''Check if store data is a handle to a server-side entry'''
+    return isinstance(data, dict) and 'record_id' in data and 'revision' in data
+
+def _entry_path(record_id):
+    # Record ids are generated as hex strings, anything else is not a valid entry
+    if not isinstance(record_id, str) or not record_id.isalnum():
+        raise ValueError(f'Invalid record id {record_id!r}')
+    return os.path.join(RECORD_STORE_DIR, f'{record_id}.json')
+
+def _journal_path(record_id):
+    return os.path.join(RECORD_STORE_DIR, f'{record_id}.journal.jsonl')
+
+def read_store(data, default=None):
+    '''Return the data of a store, resolving server-side handles'''
+    if not is_handle(data):
+        return data
+
+    entry = _read_entry(data['record_id'])
+    if entry is None:
+        print(f"Store entry {data['record_id']} not found")
+        return default
+
+    # Mark as recently used for eviction
+    os.utime(_entry_path(data['record_id']))
+
+    return _head_data(entry, _read_journal(data['record_id']))
+
+def write_store(data, handle=None, operations=None, undoable=False):
+    '''Store data and return the value for the dcc.Store, a new handle revision in server-side mode.
+
+    If the operations leading from the handle revision to the data are given, only they are appended
+    to the journal. Undoable revisions can be reverted with undo_store. Operations from an outdated
+    handle that no longer apply are rejected, the returned handle then points to the latest revision
+    and has 'rejected' set, the data of the store has to be read again.'''
+    if not SERVER_SIDE_STORE:
+        return data
+
+    with _journal_lock:
+        if operations is not None and is_handle(handle) and os.path.exists(_entry_path(handle['record_id'])):
+            return _append_journal(handle, operations, undoable)
+
+        if is_handle(handle):
+            record_id = handle['record_id']
+            revision = max(handle['revision'], _latest_revision(record_id)) + 1
+        else:
+            record_id = uuid.uuid4().hex
+            revision = 1
+
+        os.makedirs(RECORD_STORE_DIR, exist_ok=True)
+        _write_snapshot(record_id, revision, data, layout=revision)
+
+        # A new snapshot replaces all revisions in the journal
+        try:
+            os.remove(_journal_path(record_id))
+        except FileNotFoundError:
+            pass
+
+    _count_write()
+
+    return {'record_id': record_id, 'revision': revision}
+
+def undo_store(handle):
+    '''Handle after reverting the last undoable change, or None if there is none'''
+    return _move_head(handle, -1)
+
+def redo_store(handle):
+    '''Handle after restoring the last undone change, or None if there is none'''
+    return _move_head(handle, 1)
+
+def _move_head(handle, step):
+    if not SERVER_SIDE_STORE or not is_handle(handle):
+        return None
+
+    record_id = handle['record_id']
+    with _journal_lock:
+        entry = _read_entry(record_id)
+        if entry is None:
+            return None
+        journal = _read_journal(record_id)
+        changes = [line for line in journal if 'operations' in line]
+        head = _head(entry, journal)
+
+        # Revisions the head can be at: the snapshot and the changes after it
+        revisions = [entry['revision']] + [change['revision'] for change in changes]
+        position = revisions.index(head) if head in revisions else len(revisions) - 1
+        if step < 0:
+            if position == 0 or not changes[position - 1]['undoable']:
+                return None
+        elif position + 1 == len(revisions):
+            return None
+
+        revision = _latest_revision(record_id, entry, journal) + 1
+        target = revisions[position + step]
+        line = {'revision': revision, 'head': target, 'layout': _layout_at(entry, journal, target)}
+        with open(_journal_path(record_id), 'a') as file:
+            file.write(json.dumps(line, separators=(',', ':')) + '\n')
+
+    return {'record_id': record_id, 'revision': revision}
+
+def _read_entry(record_id):
+    try:
+        with open(_entry_path(record_id), 'r') as file:
+            return json.load(file)
+    except (FileNotFoundError, json.JSONDecodeError):
+        return None
+
+def _head(entry, journal):
+    # The head is the change of the last line, or the change a last cursor line points to
+    if not journal:
+        return entry['revision']
+    last = journal[-1]
+    return last['head'] if 'head' in last else last['revision']
+
+def _layout(entry, journal):
+    # Layout of the rows at the head, cursor lines record the layout of the change they point to
+    return journal[-1].get('layout') if journal else entry.get('layout')
+
+def _layout_at(entry, journal, revision):
+    # Layout of the rows at a revision, None if the revision is no longer in the entry
+    if entry['revision'] == revision:
+        return entry.get('layout')
+    for line in journal:
+        if line['revision'] == revision:
+            return line.get('layout')
+    return None
+
+def _head_data(entry, journal):
+    head = _head(entry, journal)
+    data = entry['data']
+    for line in journal:
+        if 'operations' in line and entry['revision'] < line['revision'] <= head:
+            apply_operations(data, line['operations'])
+    return data
+
+def _latest_revision(record_id, entry=None, journal=None):
+    # Lines are appended with increasing revisions, the last one is the latest
+    if entry is None:
+        entry = _read_entry(record_id)
+    if journal is None:
+        journal = _read_journal(record_id)
+    revisions = [line['revision'] for line in journal]
+    if entry is not None:
+        revisions.append(entry['revision'])
+    return max(revisions, default=0)
+
+def _write_snapshot(record_id, revision, data, layout):
+    # Write atomically so concurrent readers never see a partial entry
+    path = _entry_path(record_id)
+    temp_path = f'{path}.{uuid.uuid4().hex}.tmp'
+    with open(temp_path, 'w') as file:
+        json.dump({'revision': revision, 'layout': layout, 'data': data}, file, separators=(',', ':'))
+    os.replace(temp_path, path)
+
+def _read_journal(record_id):
+    try:
+        with open(_journal_path(record_id), 'r') as file:
+            lines = file.readlines()
+    except FileNotFoundError:
+        return []
+
+    # A line still being appended by another worker is skipped
+    revisions = []
+    for line in lines:
+        try:
+            revisions.append(json.loads(line))
+        except json.JSONDecodeError:
+            continue
+    return revisions
+
+def _append_journal(handle, operations, undoable):
+    record_id = handle['record_id']
+    entry = _read_entry(record_id)
+    journal = _read_journal(record_id)
+    head = _head(entry, journal)
+    latest = _latest_revision(record_id, entry, journal)
+
+    layout = _layout(entry, journal)
+    rejected = {'record_id': record_id, 'revision': latest, 'rejected': True}
+
+    # A handle behind the latest revision comes from a callback that started before an earlier change
+    # arrived, its operations are applied on top of the head if they still apply to the same rows
+    if handle['revision'] < latest:
+        if any(operation['op'] in INDEX_OPERATIONS for operation in operations):
+            handle_layout = _layout_at(entry, journal, handle['revision'])
+            if handle_layout is None or handle_layout != layout:
+                return rejected
+        try:
+            apply_operations(_head_data(_read_entry(record_id), journal), operations)
+        except (IndexError, KeyError, TypeError, ValueError):
+            return rejected
+
+    revision = latest + 1
+    if any(operation['op'] in LAYOUT_OPERATIONS for operation in operations):
+        layout = revision
+    change = {'revision': revision, 'operations': operations, 'undoable': undoable, 'layout': layout}
+
+    # Changing the entry after an undo discards the undone changes and the cursor lines
+    if journal and 'head' in journal[-1]:
+        journal = [line for line in journal if 'operations' in line and line['revision'] <= head] + [change]
+        _write_journal(record_id, journal)
+    else:
+        with open(_journal_path(record_id), 'a') as file:
+            file.write(json.dumps(change, separators=(',', ':')) + '\n')
+        journal.append(change)
+
+    os.utime(_entry_path(record_id))
+
+    changes = [line for line in journal if 'operations' in line]
+    if len(changes) > JOURNAL_SNAPSHOT_INTERVAL + UNDO_DEPTH:
+        _compact(record_id, journal, changes[-UNDO_DEPTH - 1]['revision'])
+
+    return {'record_id': record_id, 'revision': revision}
+
+def _write_journal(record_id, journal):
+    path = _journal_path(record_id)
+    temp_path = f'{path}.{uuid.uuid4().hex}.tmp'
+    with open(temp_path, 'w') as file:
+        file.writelines(json.dumps(line, separators=(',', ':')) + '\n' for line in journal)
+    os.replace(temp_path, path)
+
+def _compact(record_id, journal, revision):
+    # Write the snapshot first, readers skip journal lines older than the snapshot
+    entry = _read_entry(record_id)
+    data = _head_data(entry, [line for line in journal if line['revision'] <= revision])
+    _write_snapshot(record_id, revision, data, _layout_at(entry, journal, revision))
+    _write_journal(record_id, [line for line in journal if line['revision'] > revision])
+
+def _count_write():
+    global _writes
+    with _writes_lock:
+        _writes += 1
+        evict = _writes % EVICTION_INTERVAL == 0
+    if evict:
+        evict_entries()
+
+def evict_entries():
+    '''Remove expired entries and the least recently used entries above the maximum number'''
+    try:
+        names = [name for name in os.listdir(RECORD_STORE_DIR) if name.endswith('.json')]
+    except FileNotFoundError:
+        return
+
+    entries = []
+    for name in names:
+        path = os.path.join(RECORD_STORE_DIR, name)
+        try:
+            entries.append((os.path.getmtime(path), path))
+        except FileNotFoundError:
+            continue
+    entries.sort(reverse=True)
+
+    expired = time.time() - RECORD_STORE_TTL
+    for index, (mtime, path) in enumerate(entries):
+        if mtime < expired or index >= RECORD_STORE_MAX_ENTRIES:
+            for entry_path in [path, path[:-len('.json')] + '.journal.jsonl']:
+                try:
+                    os.remove(entry_path)
+                except FileNotFoundError:
+                    pass
@@ -0,0 +1,81 @@
+import sqlite3
+import pytest
+import library
+from library import save_library_record, list_library_records, count_library_records, read_library_record, new_library_id, import_library_id
+
+@pytest.fixture(autouse=True)
+def library_path(tmp_path, monkeypatch):
+    path = str(tmp_path / 'library.db')
+    monkeypatch.setattr(library, 'RECORD_LIBRARY_PATH', path)
+    monkeypatch.setattr(library, '_connections', library.threading.local())
+    return path
+
+def record(client_id, focus='Depression', date='2024-01-01'):
+    return {
+        'client': [{'ID': client_id, 'Focus': focus}],
+        'measures': [],
+        'sessions': [{'session_number': 1, 'session_date': date}],
+        'practices': [],
+    }
+
+def test_records_with_the_same_client_id_are_kept_apart():
+    first, second = new_library_id(), new_library_id()
+    save_library_record(record('A1', 'Depression'), first)
+    save_library_record(record('a1', 'Anxiety'), second)
+
+    assert count_library_records('A1') == 2
+    assert read_library_record(first)['client'][0]['Focus'] == 'Depression'
+    assert read_library_record(second)['client'][0]['Focus'] == 'Anxiety'
+
+def test_saving_under_a_library_id_replaces_its_record():
+    library_id = new_library_id()
+    assert save_library_record(record('A1', date='2024-01-01'), library_id)
+    assert save_library_record(record('A2', date='2024-02-01'), library_id)
+    assert not save_library_record(record('A2', date='2024-02-01'), library_id)
+
+    assert [row['client_id'] for row in list_library_records()] == ['A2']
+    assert count_library_records('Depr') == 1
+    assert import_library_id('a.psyb.gz') == import_library_id('a.psyb.gz') != import_library_id('b.psyb.gz')
+
+def test_invalid_library_ids():
+    with pytest.raises(ValueError):
+        save_library_record(record('A1'), '../A1')
+    assert read_library_record('A1') is None
+
+def test_pages():
+    for day in range(1, 6):
+        save_library_record(record(f'C{day}', date=f'2024-01-0{day}'), new_library_id())
+
+    pages = [[row['client_id'] for row in list_library_records(page=page, page_size=2)] for page in [1, 2, 3, 4]]
+    assert pages == [['C5', 'C4'], ['C3', 'C2'], ['C1'], []]
+    assert count_library_records() == 5
+
+def test_version_1_library_is_migrated(library_path):
+    data = library.write_record(record('A1', 'Depression, Eating'), 'binary', compress=True)
+    connection = sqlite3.connect(library_path)
+    connection.executescript('''
+        CREATE TABLE records (
+            id INTEGER PRIMARY KEY,
+            client_id TEXT NOT NULL COLLATE NOCASE UNIQUE,
+            focus TEXT NOT NULL,
+            last_session_date TEXT,
+            session_count INTEGER NOT NULL,
+            updated REAL NOT NULL,
+            digest TEXT NOT NULL,
+            data BLOB NOT NULL
+        );
+        CREATE INDEX records_last_session_date ON records (last_session_date);
+        CREATE TABLE focus_terms (record_id INTEGER NOT NULL REFERENCES records (id) ON DELETE CASCADE, term TEXT NOT NULL COLLATE NOCASE);
+    ''')
+    connection.execute(
+        'INSERT INTO records VALUES (1, ?, ?, ?, 1, 0, ?, ?)', ('A1', 'Depression, Eating', '2024-01-01', 'digest', data)
+    )
+    connection.commit()
+    connection.close()
+
+    [row] = list_library_records('Eat')
+    assert row['client_id'] == 'A1'
+    assert read_library_record(row['library_id'])['client'][0]['ID'] == 'A1'
+
+    save_library_record(record('A1'), new_library_id())
+    assert count_library_records('A1') == 2
@@ -0,0 +1,80 @@
+import copy
+import json
+import os
+import pytest
+import app  # Registers the pages before they are imported
+from pages.home import sanitize_data_types, sanitize_sessions, record_filename
+from record_io import write_record, parse_record_bytes
+
+EXAMPLE_PATH = os.path.join(os.path.dirname(__file__), os.pardir, 'example-data', 'example.json')
+
+def example_record():
+    with open(EXAMPLE_PATH, encoding='utf-8') as file:
+        return json.load(file)
+
+def messy_record():
+    record = example_record()
+    measure = record['measures'][0]['Name']
+    practice = record['practices'][0]['Name']
+    record['sessions'] = [
+        {},
+        {'session_number': 2},
+        {'session_number': '3', 'session_date': '2024-13-01', measure: '7', 'extra': 'x'},
+        {'session_number': None, 'session_date': None, practice: None},
+        {'session_date': '2024-02-01', measure: 'abc', practice: 'yes'},
+        {},
+    ] + record['sessions'][:3]
+    return record
+
+@pytest.mark.parametrize('record_format', ['json', 'binary'])
+@pytest.mark.parametrize('compress', [False, True])
+@pytest.mark.parametrize('make_record', [example_record, messy_record])
+def test_round_trip(make_record, record_format, compress):
+    record = sanitize_data_types(make_record())
+    expected = copy.deepcopy(record)
+
+    assert parse_record_bytes(write_record(record, record_format, compress)) == expected
+
+def test_empty_sessions_round_trip():
+    record = sanitize_data_types(example_record())
+    record['sessions'] = [{}, *record['sessions'][:2], {}]
+
+    sessions = parse_record_bytes(write_record(record, 'binary'))['sessions']
+    assert sessions == record['sessions']
+    assert sessions[0] == {} and sessions[-1] == {}
+
+@pytest.mark.parametrize('filename, record_format, compress, expected', [
+    ('record', 'json', False, 'record.json'),
+    ('record.json.gz', 'json', False, 'record.json'),
+    ('record.json', 'json', True, 'record.json.gz'),
+    ('record.json.gz', 'json', True, 'record.json.gz'),
+    ('record.psydash.gz', 'binary', False, 'record.psydash'),
+    ('record.gz', 'binary', True, 'record.psydash.gz'),
+])
+def test_record_filename(filename, record_format, compress, expected):
+    assert record_filename(filename, record_format, compress) == expected
+
+def test_sanitize_mixed_session_values():
+    measures = [{'Name': 'Mood'}]
+    practices = [{'Name': 'Walk'}]
+    sessions = [
+        {'session_number': 1, 'session_date': '2024-01-01', 'Mood': 3, 'Walk': True},
+        {'session_number': 2.0, 'session_date': '2024-01-02', 'Mood': 4.5, 'Walk': False},
+        {'session_number': '3', 'session_date': '2024-01-03', 'Mood': '5', 'Walk': 1},
+        {'session_number': 4, 'session_date': '2024-01-04', 'Mood': 'high', 'Walk': None},
+    ]
+    report = {}
+
+    sanitized = sanitize_sessions(sessions, measures, practices, report)
+
+    assert [row['session_number'] for row in sanitized] == [1, 2, 3, 4]
+    assert [type(row['session_number']) for row in sanitized] == [int] * 4
+    assert [row['Mood'] for row in sanitized] == [3.0, 4.5, 5.0, None]
+    assert [type(row['Mood']) for row in sanitized[:3]] == [float] * 3
+    assert [row['Walk'] for row in sanitized] == [True, False, True, False]
+    assert report == {'coerced': 4, 'dropped': 1}
+
+    # Sanitized rows are kept as they are, unsanitized rows are rebuilt
+    assert sanitize_sessions(sanitized, measures, practices) is not sanitized
+    assert all(a is b for a, b in zip(sanitize_sessions(sanitized, measures, practices), sanitized))
+    assert sanitize_sessions(sessions, measures, practices)[0] is not sessions[0]
@@ -0,0 +1,98 @@
+import pytest
+import store
+from store import read_store, write_store, undo_store, redo_store
+
+@pytest.fixture(autouse=True)
+def server_side_store(tmp_path, monkeypatch):
+    monkeypatch.setattr(store, 'SERVER_SIDE_STORE', True)
+    monkeypatch.setattr(store, 'RECORD_STORE_DIR', str(tmp_path))
+
+def sessions(count):
+    return [{'session_number': number, 'value': None} for number in range(1, count + 1)]
+
+def edit(handle, index, value):
+    data = read_store(handle)
+    operations = [{'op': 'set', 'index': index, 'field': 'value', 'value': value}]
+    return write_store(data, handle, operations, undoable=True)
+
+def test_two_writes_from_the_same_handle():
+    handle = write_store(sessions(3))
+    first = edit(handle, 0, 'a')
+    second = edit(handle, 1, 'b')
+
+    assert second['revision'] > first['revision']
+    assert [row['value'] for row in read_store(second)] == ['a', 'b', None]
+
+def test_stale_write_that_no_longer_applies_is_rejected():
+    handle = write_store(sessions(2))
+    deleted = write_store(None, handle, [{'op': 'delete', 'index': 1}], undoable=True)
+    rejected = write_store(None, handle, [{'op': 'set', 'index': 1, 'field': 'value', 'value': 'x'}], undoable=True)
+
+    assert rejected == {**deleted, 'rejected': True}
+    assert read_store(rejected) == sessions(1)
+
+def test_stale_index_write_after_rows_changed_is_rejected():
+    handle = write_store(sessions(3))
+    deleted = write_store(None, handle, [{'op': 'delete', 'index': 0}], undoable=True)
+    # Row 1 still exists, but it is another session by now
+    rejected = edit(handle, 1, 'x')
+
+    assert rejected == {**deleted, 'rejected': True}
+    assert [row['session_number'] for row in read_store(rejected)] == [2, 3]
+    assert [row['value'] for row in read_store(rejected)] == [None, None]
+
+def test_stale_index_write_on_the_same_rows_is_applied():
+    handle = write_store(sessions(2))
+    edit(handle, 0, 'a')
+    applied = edit(handle, 1, 'b')
+
+    assert 'rejected' not in applied
+    assert [row['value'] for row in read_store(applied)] == ['a', 'b']
+
+def test_stale_index_write_after_undone_rows_is_rejected():
+    handle = write_store(sessions(2))
+    appended = write_store(None, handle, [{'op': 'append', 'row': {'session_number': 3, 'value': None}}], undoable=True)
+    undone = undo_store(appended)
+
+    assert edit(appended, 0, 'x') == {**undone, 'rejected': True}
+    assert 'rejected' not in edit(handle, 0, 'y')
+
+def test_undo_redo():
+    handle = edit(edit(write_store(sessions(2)), 0, 'a'), 1, 'b')
+
+    handle = undo_store(handle)
+    assert [row['value'] for row in read_store(handle)] == ['a', None]
+    handle = undo_store(handle)
+    assert [row['value'] for row in read_store(handle)] == [None, None]
+    assert undo_store(handle) is None
+
+    handle = redo_store(redo_store(handle))
+    assert [row['value'] for row in read_store(handle)] == ['a', 'b']
+    assert redo_store(handle) is None
+
+def test_write_after_undo_discards_redo_without_reusing_revisions():
+    handle = edit(edit(write_store(sessions(2)), 0, 'a'), 1, 'b')
+    undone = undo_store(handle)
+    changed = edit(undone, 1, 'c')
+
+    revisions = {handle['revision'], undone['revision'], changed['revision']}
+    assert len(revisions) == 3
+    assert [row['value'] for row in read_store(changed)] == ['a', 'c']
+    assert redo_store(changed) is None
+    assert [row['value'] for row in read_store(undo_store(changed))] == ['a', None]
+
+def test_barrier_cannot_be_undone():
+    handle = write_store(None, write_store(sessions(1)), [{'op': 'append', 'row': {'session_number': 2}}], undoable=False)
+    assert undo_store(handle) is None
+
+def test_compaction_keeps_data_and_undo(monkeypatch):
+    monkeypatch.setattr(store, 'JOURNAL_SNAPSHOT_INTERVAL', 5)
+    monkeypatch.setattr(store, 'UNDO_DEPTH', 3)
+    handle = write_store(sessions(20))
+    for index in range(20):
+        handle = edit(handle, index, index)
+
+    assert [row['value'] for row in read_store(handle)] == list(range(20))
+    for _ in range(3):
+        handle = undo_store(handle)
+    assert [row['value'] for row in read_store(handle)] == list(range(17)) + [None] * 3